@@ -0,0 +1,127 @@
+import os
+import re
+from typing import TYPE_CHECKING, Optional
+from core.config import get_settings
+from core.mailer import build_mime
+
+# Jinja2 loads with the first template, see TemplateRegistry.env
+if TYPE_CHECKING:
+    from jinja2 import Environment
+
+settings = get_settings()
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+
+# Template name -> email subject
+EMAIL_TEMPLATES = {
+    'verification_email.html': "Your Verification Code",
+    'password_reset_email.html': "Reset Your Password",
+}
+
+# Per-user fields filled into the pre-rendered templates
+TEMPLATE_FIELDS = ('username', 'verification_code')
+_MARKER = re.compile(r'@@(\w+)@@')
+_BOUNDARY = re.compile(r'boundary="([^"]+)"')
+
+
+def _marker(field: str) -> str:
+    return f'@@{field}@@'
+
+
+def _split(text: str) -> list:
+    # Even items are static text, odd items are field names
+    return _MARKER.split(text)
+
+
+def _fill(chunks: list, values: dict) -> str:
+    return ''.join(chunk if i % 2 == 0 else values[chunk] for i, chunk in enumerate(chunks))
+
+
+class CompiledEmail:
+    """
+    A compiled email template plus its MIME message rendered once with markers,
+    so sending only splices the recipient and per-user fields into static text.
+    """
+
+    def __init__(self, env: "Environment", name: str, subject: str):
+        self.env = env
+        self.name = name
+        self.subject = subject
+        self.template = env.get_template(name)
+        self._html_chunks = None
+        self._message_chunks = None
+        self._boundary = None
+        if not env.auto_reload:
+            self._prerender()
+
+    def _prerender(self):
+        markers = {field: _marker(field) for field in TEMPLATE_FIELDS}
+        html = self.template.render(**markers)
+        msg = build_mime(_marker('to_email'), self.subject, html, is_html=True)
+        raw = msg.as_string()
+
+        html_chunks = _split(html)
+        sample = {'username': 'sample-user', 'verification_code': '000000'}
+        if msg.get_payload(0).get_content_charset() != 'us-ascii' or _fill(html_chunks, sample) != self.template.render(**sample):
+            # Template does more than plain substitution, keep rendering it with Jinja2
+            return
+
+        self._html_chunks = html_chunks
+        self._message_chunks = _split(raw)
+        self._boundary = _BOUNDARY.search(raw).group(1)
+
+    def _can_splice(self, values: dict) -> bool:
+        if self._message_chunks is None:
+            return False
+        for value in values.values():
+            if not value.isascii() or '\n' in value or '\r' in value or self._boundary in value:
+                return False
+        return True
+
+    def render(self, **fields) -> str:
+        if self.env.auto_reload:
+            return self.env.get_template(self.name).render(**fields)
+        if self._html_chunks is not None:
+            return _fill(self._html_chunks, {k: str(v) for k, v in fields.items()})
+        return self.template.render(**fields)
+
+    def render_message(self, to_email: str, **fields) -> Optional[str]:
+        """
+        Full MIME message for the recipient, or None if it has to be built the slow way.
+        """
+        values = {k: str(v) for k, v in fields.items()}
+        values['to_email'] = to_email
+        if not self._can_splice(values):
+            return None
+        return _fill(self._message_chunks, values)
+
+
+class TemplateRegistry:
+    """
+    Process-wide cache of compiled email templates.
+    """
+
+    def __init__(self, auto_reload: bool = False):
+        self.auto_reload = auto_reload
+        self._env = None
+        self._templates = {}
+
+    @property
+    def env(self) -> "Environment":
+        if self._env is None:
+            from jinja2 import Environment, FileSystemLoader
+
+            self._env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), auto_reload=self.auto_reload)
+        return self._env
+
+    def load(self):
+        for name, subject in EMAIL_TEMPLATES.items():
+            self._templates[name] = CompiledEmail(self.env, name, subject)
+
+    def get(self, name: str) -> CompiledEmail:
+        if name not in self._templates:
+            self._templates[name] = CompiledEmail(self.env, name, EMAIL_TEMPLATES[name])
+        return self._templates[name]
+
+
+email_templates = TemplateRegistry(auto_reload=settings.EMAIL_TEMPLATES_AUTO_RELOAD)
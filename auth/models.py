@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Index
+from datetime import datetime
+from core.database import Base
+
+class EmailOutboxModel(Base):
+    __tablename__ = "email_outbox"
+    id = Column(Integer, primary_key=True, index=True)
+    to_email = Column(String(255), nullable=False)
+    template = Column(String(100), nullable=False)  # Template name in auth/templates
+    payload = Column(JSON, nullable=False)  # Template fields, e.g. username and code
+    status = Column(String(20), nullable=False, default="pending")  # pending, sending or failed
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = Column(DateTime, nullable=True)
+    claimed_by = Column(String(100), nullable=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_available_at", "status", "available_at"),
+    )
+
+
+class RevokedTokenModel(Base):
+    __tablename__ = "revoked_tokens"
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String(64), unique=True, nullable=True)  # Single refresh token, rotated or revoked
+    user_id = Column(Integer, nullable=False, index=True)
+    revoked_before = Column(DateTime, nullable=True)  # Every token of the user issued before this time
+    expires_at = Column(DateTime, nullable=False, index=True)  # Row can be dropped once the tokens have expired, see users.retention
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)  # Re-scanned by the revocation sync
@@ -0,0 +1,155 @@
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, and_, or_
+from sqlalchemy.orm import Session, sessionmaker
+from auth.models import EmailOutboxModel
+from auth.email_templates import email_templates
+from auth.utils import is_valid_email
+from core.config import get_settings
+from core.database import SessionLocal
+from core.mailer import OutgoingEmail, SMTPSession
+
+settings = get_settings()
+
+
+def outbox_email(to_email: str, template: str, **fields) -> EmailOutboxModel:
+    """
+    Build an outbox row. Add it to the session that writes the user row so both
+    commit in the same transaction.
+    """
+    return EmailOutboxModel(to_email=to_email, template=template, payload=fields)
+
+
+def claim_batch(db: Session, worker_id: str, limit: int) -> list:
+    """
+    Claim up to `limit` due rows for this worker. Rows are locked with SKIP LOCKED
+    where the database supports it, and the conditional UPDATE keeps two workers
+    from claiming the same row on databases that don't (e.g. SQLite).
+    Rows whose lease ran out (crashed worker) are claimed again.
+    """
+    now = datetime.utcnow()
+    due = or_(
+        and_(EmailOutboxModel.status == "pending", EmailOutboxModel.available_at <= now),
+        and_(EmailOutboxModel.status == "sending", EmailOutboxModel.locked_until < now),
+    )
+    ids = db.execute(
+        select(EmailOutboxModel.id)
+        .where(due)
+        .order_by(EmailOutboxModel.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not ids:
+        db.commit()
+        return []
+
+    db.execute(
+        update(EmailOutboxModel)
+        .where(EmailOutboxModel.id.in_(ids), due)
+        .values(
+            status="sending",
+            claimed_by=worker_id,
+            locked_until=now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+    return db.execute(
+        select(EmailOutboxModel).where(
+            EmailOutboxModel.id.in_(ids),
+            EmailOutboxModel.status == "sending",
+            EmailOutboxModel.claimed_by == worker_id,
+        )
+    ).scalars().all()
+
+
+def _render(row: EmailOutboxModel) -> OutgoingEmail:
+    template = email_templates.get(row.template)
+    raw = template.render_message(row.to_email, **row.payload)
+    body = '' if raw is not None else template.render(**row.payload)
+    return OutgoingEmail(to_email=row.to_email, subject=template.subject, body=body, is_html=True, raw=raw)
+
+
+def _record_failure(row: EmailOutboxModel, error: Exception, now: datetime):
+    row.attempts += 1
+    row.last_error = f"{type(error).__name__}: {error}"[:500]
+    if row.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        row.status = "failed"
+    else:
+        row.status = "pending"
+        row.available_at = now + timedelta(seconds=settings.SMTP_RETRY_BACKOFF * (2 ** (row.attempts - 1)))
+    row.claimed_by = None
+    row.locked_until = None
+
+
+def dispatch_batch(db: Session, smtp: SMTPSession, worker_id: str, limit: int = None) -> int:
+    """
+    Claim one batch, send it over the given SMTP session and record the outcome.
+    Sent rows are deleted, rows that failed to render or send are retried with
+    backoff until EMAIL_OUTBOX_MAX_ATTEMPTS. Returns the number of claimed rows.
+    """
+    rows = claim_batch(db, worker_id, limit or settings.EMAIL_OUTBOX_BATCH_SIZE)
+    sent_ids = []
+    now = datetime.utcnow()
+
+    for row in rows:
+        if not is_valid_email(row.to_email):
+            row.status = "failed"
+            row.last_error = "Invalid email address"
+            continue
+        try:
+            smtp.send(_render(row))
+            sent_ids.append(row.id)
+        except Exception as e:
+            # Any failure stays with its row, so the rows already sent are still deleted below
+            if isinstance(e, OSError):  # Includes SMTPException, the connection may be unusable
+                smtp.close()
+            _record_failure(row, e, now)
+
+    if sent_ids:
+        db.execute(
+            delete(EmailOutboxModel)
+            .where(EmailOutboxModel.id.in_(sent_ids))
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+    return len(rows)
+
+
+class OutboxDispatcher(threading.Thread):
+    """
+    Background thread draining the outbox. Several processes can run one each.
+    """
+
+    def __init__(self, session_factory: sessionmaker = SessionLocal, name: str = "outbox-dispatcher"):
+        super().__init__(name=name, daemon=True)
+        self.session_factory = session_factory
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{name}"
+        self.stopping = threading.Event()
+        self.smtp = SMTPSession()
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                with self.session_factory() as db:
+                    claimed = dispatch_batch(db, self.smtp, self.worker_id)
+            except Exception as e:
+                print(f"Outbox dispatch failed: {e}")
+                claimed = 0
+            if claimed < settings.EMAIL_OUTBOX_BATCH_SIZE:
+                # Outbox drained, wait before polling again
+                if self.smtp.connected and time.monotonic() - self.smtp.last_used > settings.SMTP_IDLE_TIMEOUT:
+                    self.smtp.close()
+                self.stopping.wait(settings.EMAIL_OUTBOX_POLL_INTERVAL)
+        self.smtp.close()
+
+    def stop(self, timeout: float = None):
+        self.stopping.set()
+        self.join(timeout if timeout is not None else settings.SMTP_SHUTDOWN_TIMEOUT)
+
+
+outbox_dispatcher = OutboxDispatcher() if settings.EMAIL_OUTBOX else None
@@ -0,0 +1,125 @@
+"""
+Pick the bcrypt cost for this hardware and see what the stored hashes cost.
+
+    python -m auth.password_cost calibrate --target-ms 250
+    python -m auth.password_cost report
+
+`calibrate` times bcrypt at each cost and recommends the highest cost whose
+median hash time stays within the target, with the login throughput the
+hashing pool sustains at that cost. `report` counts the hashes in
+users.password per scheme and cost with one GROUP BY, and estimates the CPU
+time a login costs on average for the current population. Hashes below
+PASSWORD_BCRYPT_ROUNDS are upgraded on their next successful login.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from passlib.hash import bcrypt
+from sqlalchemy import func, select
+from core.config import get_settings
+from core.database import db_execute, open_primary_session
+from users.models import UserModel
+
+settings = get_settings()
+
+PREFIX_LENGTH = len("$2b$12$")
+
+
+def time_cost(rounds: int, samples: int) -> float:
+    """
+    Median seconds for one bcrypt hash at `rounds`, verify costs the same.
+    """
+    handler = bcrypt.using(rounds=rounds)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        handler.hash("calibration-password")
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def calibrate(target: float, min_rounds: int, max_rounds: int, samples: int) -> dict:
+    costs = {}
+    for rounds in range(min_rounds, max_rounds + 1):
+        costs[rounds] = time_cost(rounds, samples)
+        if costs[rounds] > target * 2:
+            break  # Every further round doubles the time
+    within = [rounds for rounds, seconds in costs.items() if seconds <= target]
+    return {"costs": costs, "recommended": max(within) if within else min_rounds}
+
+
+def parse_prefix(prefix: str) -> tuple:
+    # "$2b$12$" -> ("bcrypt", 12), anything else is reported as is
+    parts = (prefix or "").split("$")
+    if len(parts) >= 3 and parts[1] in ("2", "2a", "2b", "2x", "2y") and parts[2].isdigit():
+        return "bcrypt", int(parts[2])
+    return "unknown", None
+
+
+async def hash_distribution() -> dict:
+    """
+    {(scheme, cost): users}, grouped by the database on the hash prefix.
+    """
+    prefix = func.substr(UserModel.password, 1, PREFIX_LENGTH)
+    statement = select(prefix, func.count()).group_by(prefix)
+    distribution = {}
+    async with open_primary_session() as db:
+        for value, users in (await db_execute(db, statement)).all():
+            key = parse_prefix(value)
+            distribution[key] = distribution.get(key, 0) + users
+    return distribution
+
+
+def _print_calibration(result: dict, target: float):
+    workers = settings.PASSWORD_HASH_WORKERS
+    print(f"{'cost':>4} {'hash ms':>10} {'logins/s':>10}  ({workers} hashing workers)")
+    for rounds, seconds in result["costs"].items():
+        marker = "  <- recommended" if rounds == result["recommended"] else ""
+        print(f"{rounds:>4} {seconds * 1000:>10.1f} {workers / seconds:>10.1f}{marker}")
+    print(f"\nPASSWORD_BCRYPT_ROUNDS={result['recommended']}  (target {target * 1000:.0f}ms, configured {settings.PASSWORD_BCRYPT_ROUNDS})")
+
+
+def _print_report(distribution: dict, samples: int):
+    total = sum(distribution.values())
+    if not total:
+        print("No users.")
+        return
+    configured = settings.PASSWORD_BCRYPT_ROUNDS
+    print(f"{'scheme':>8} {'cost':>5} {'users':>10} {'share':>7} {'verify ms':>10}")
+    average = 0.0
+    for (scheme, rounds), users in sorted(distribution.items(), key=lambda item: (item[0][0], item[0][1] or 0)):
+        seconds = time_cost(rounds, samples) if rounds else None
+        if seconds:
+            average += seconds * users / total
+        verify_ms = f"{seconds * 1000:.1f}" if seconds else "-"
+        print(f"{scheme:>8} {str(rounds or '-'):>5} {users:>10} {users / total:>7.1%} {verify_ms:>10}")
+
+    upgrades = sum(users for (scheme, rounds), users in distribution.items() if scheme == "bcrypt" and rounds < configured)
+    print(f"\n{total} users, {upgrades} below the configured cost {configured} (rehashed on their next login)")
+    if average:
+        workers = settings.PASSWORD_HASH_WORKERS
+        print(f"Average verify {average * 1000:.1f}ms per login, ~{workers / average:.0f} logins/s on {workers} hashing workers")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the bcrypt cost or report the cost of the stored hashes.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    calibrate_parser = commands.add_parser("calibrate", help="time bcrypt per cost on this machine")
+    calibrate_parser.add_argument("--target-ms", type=float, default=250, help="acceptable hash time per login")
+    calibrate_parser.add_argument("--min-rounds", type=int, default=10)
+    calibrate_parser.add_argument("--max-rounds", type=int, default=16)
+    report_parser = commands.add_parser("report", help="hash cost distribution across users.password")
+    for command in (calibrate_parser, report_parser):
+        command.add_argument("--samples", type=int, default=5, help="hashes timed per cost")
+    args = parser.parse_args()
+
+    if args.command == "calibrate":
+        target = args.target_ms / 1000
+        _print_calibration(calibrate(target, args.min_rounds, args.max_rounds, args.samples), target)
+    else:
+        _print_report(asyncio.run(hash_distribution()), args.samples)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,15 @@
-from fastapi import APIRouter, status, Depends, Header, BackgroundTasks
+from fastapi import APIRouter, status, Depends, Header, HTTPException, Response
 from fastapi.security import OAuth2PasswordRequestForm
-from users.models import UserModel
-from sqlalchemy.orm import Session
-from core.database import get_db
-from auth.services import get_refresh_token, login_user, register_user, verify_user_code, forgot_password, reset_password
+from core.principals import UserSnapshot
+from core.database import get_session, DBSession
+from auth.services import get_refresh_token, login_user, register_user, verify_user_code, forgot_password, reset_password, change_password
 from users.schemas import CreateUserRequest, VerifyCodeRequest
 from auth.schemas import ForgotPasswordRequest, ResetPasswordRequest, ChangePasswordRequest
-from core.security import get_current_user
+from core.security import get_current_user, key_ring
+from core.config import get_settings
+from core.responses import FastJSONResponse
+from users.responses import UserResponse, serialize_user
+from auth.responses import TokenResponse
 
 router = APIRouter(
     prefix="/auth",
@@ -14,41 +17,61 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+settings = get_settings()
+
+# Public discovery documents, served at the root
+well_known_router = APIRouter(
+    prefix="/.well-known",
+    tags=["Auth"],
+)
+
+# Public keys for verifying our tokens locally, by the kid in the token header
+@well_known_router.get("/jwks.json")
+async def get_jwks():
+    if key_ring is None:
+        raise HTTPException(status_code=404, detail="Tokens are signed with a shared secret (HS256).")
+    return Response(
+        key_ring.jwks,
+        media_type="application/json",
+        headers={"Cache-Control": f"public, max-age={settings.JWT_JWKS_MAX_AGE}"},
+    )
+
 # Refresh token route
-@router.post("/refresh", status_code=status.HTTP_200_OK)
-async def refresh_access_token(refresh_token: str = Header(), db: Session = Depends(get_db)):
-    return await get_refresh_token(token=refresh_token, db=db)
+@router.post("/refresh", status_code=status.HTTP_200_OK, response_model=TokenResponse)
+async def refresh_access_token(refresh_token: str = Header(), db: DBSession = Depends(get_session)):
+    return FastJSONResponse(await get_refresh_token(token=refresh_token, db=db))
 
 # Registration route
-@router.post("/register", status_code=status.HTTP_201_CREATED)
-async def register(data: CreateUserRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    return await register_user(data=data, db=db, background_tasks=background_tasks)
+@router.post("/register", status_code=status.HTTP_201_CREATED, response_model=UserResponse)
+async def register(data: CreateUserRequest, db: DBSession = Depends(get_session)):
+    user = await register_user(data=data, db=db)
+    return FastJSONResponse(serialize_user(user), status_code=status.HTTP_201_CREATED)
 
 # Code verification route 
 @router.post("/verify", status_code=status.HTTP_200_OK)
-def verify_code(data: VerifyCodeRequest, db: Session = Depends(get_db)):
-    return verify_user_code(email=data.email, code=data.code, db=db)
+async def verify_code(data: VerifyCodeRequest, db: DBSession = Depends(get_session)):
+    return await verify_user_code(email=data.email, code=data.code, db=db, token=data.token)
 
 # login route
-@router.post("/login", status_code=status.HTTP_200_OK)
-async def login(data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    return await login_user(data=data, db=db)
+@router.post("/login", status_code=status.HTTP_200_OK, response_model=TokenResponse)
+async def login(data: OAuth2PasswordRequestForm = Depends(), db: DBSession = Depends(get_session)):
+    return FastJSONResponse(await login_user(data=data, db=db))
 
 # Forgot password route
 @router.post("/forgot-password", status_code=200)
-async def forgot_password_route(data: ForgotPasswordRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    return await forgot_password(email=data.email, db=db, background_tasks=background_tasks)
+async def forgot_password_route(data: ForgotPasswordRequest, db: DBSession = Depends(get_session)):
+    return await forgot_password(email=data.email, db=db)
 
 # Reset password route
 @router.post("/reset-password", status_code=200)
-async def reset_password_route(data: ResetPasswordRequest, db: Session = Depends(get_db)):
-    return await reset_password(email=data.email, code=data.code, new_password=data.new_password, confirm_password=data.confirm_password, db=db)
+async def reset_password_route(data: ResetPasswordRequest, db: DBSession = Depends(get_session)):
+    return await reset_password(email=data.email, code=data.code, new_password=data.new_password, confirm_password=data.confirm_password, db=db, token=data.token)
  
 # Change password route
 @router.put("/change-password", status_code=status.HTTP_200_OK)
 async def change_user_password(
     data: ChangePasswordRequest,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user) 
+    db: DBSession = Depends(get_session),
+    current_user: UserSnapshot = Depends(get_current_user) 
 ):
     return await change_password(user_id=current_user.id, data=data, db=db)
\ No newline at end of file
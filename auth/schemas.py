@@ -1,5 +1,5 @@
 # auth/schemas.py
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr
 from typing import Optional
 from datetime import datetime
 
@@ -22,8 +22,7 @@ class UserResponse(BaseModel):
     is_active: bool
     registered_at: Optional[datetime] = None
 
-    class Config:
-        orm_mode = True  # Allows returning ORM objects from database
+    model_config = ConfigDict(from_attributes=True)  # Allows returning ORM objects from database
 
 # Token response for JWT authentication
 class TokenResponse(BaseModel):
@@ -40,8 +39,10 @@ class ForgotPasswordRequest(BaseModel):
     email: str
 
 class ResetPasswordRequest(BaseModel):
-    email: str
-    code: str
+    # Either the emailed code with its email, or the signed token (EMAIL_SIGNED_TOKENS)
+    email: Optional[str] = None
+    code: Optional[str] = None
+    token: Optional[str] = None
     new_password: str
     confirm_password: str
 
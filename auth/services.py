@@ -1,39 +1,69 @@
+import hashlib
 from users.models import UserModel
 from fastapi.exceptions import HTTPException
-from core.security import verify_password, get_password_hash
+from core.security import verify_password_async, verify_and_update_password_async, hash_password_async, password_rehashes
 from core.config import get_settings
 from datetime import timedelta, datetime
 from auth.responses import TokenResponse
-from core.security import create_access_token, create_refresh_token, get_token_payload
-from fastapi import Depends, BackgroundTasks
-from sqlalchemy.orm import Session
+from core.security import create_access_token, create_refresh_token, get_token_payload, get_user_principal
+from core.security import create_verification_token, create_password_reset_token, decode_email_token, mark_email_token_used
+from core.revocation import revocation_store, is_jti_revoked, consume_refresh_token, revoke_user_tokens
+from core.principals import invalidate_principal
+from fastapi import Depends
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from core.replicas import use_primary
+from core.singleflight import SingleFlight
+from core.database import DBSession, db_execute, db_commit, db_rollback, insert_ignoring_conflicts
 from fastapi.security import OAuth2PasswordRequestForm
-from auth.utils import send_verification_email, generate_verification_code, generate_code_expiration, send_password_reset_email
+from auth.utils import send_verification_email, generate_verification_code, generate_code_expiration, send_password_reset_email, email_token_link
 from auth.schemas import UserCreateRequest, ChangePasswordRequest
+from auth.outbox import outbox_email
+from users.services import is_account_taken
 
 settings = get_settings()    
 
-async def get_refresh_token(token: str, db: Session):   
+# Parallel refreshes with one refresh token share a single rotation and all get its new token pair
+refresh_flights = SingleFlight("refresh")
+
+def _invalid_refresh_token() -> HTTPException:
+    return HTTPException(
+        status_code=401,
+        detail="Invalid refresh token.",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+async def get_refresh_token(token: str, db: DBSession):
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    return await refresh_flights.do(key, lambda: _rotate_refresh_token(token, db))
+
+
+async def _rotate_refresh_token(token: str, db: DBSession):
     payload = get_token_payload(token=token)
     user_id = payload.get('id')
+    jti = payload.get('jti')
     
-    if not user_id:
-        raise HTTPException(
-            status_code=401,
-            detail="Invalid refresh token.",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+    # Only rotating refresh tokens with an id and expiry are accepted
+    if not user_id or not jti or not payload.get('exp') or payload.get('type') != 'refresh':
+        raise _invalid_refresh_token()
+
+    # In-memory revocation checks, the table is only read on a filter hit
+    if revocation_store.is_user_token_revoked(payload) or await is_jti_revoked(db, jti):
+        raise _invalid_refresh_token()
     
-    user = db.query(UserModel).filter(UserModel.id == user_id).first()
+    try:
+        user = await get_user_principal(user_id, db)
+    except HTTPException:
+        raise _invalid_refresh_token()
+
+    # Rotate: the presented token can't be used again
+    if not await consume_refresh_token(db, payload):
+        await db_rollback(db)
+        raise _invalid_refresh_token()
+    await db_commit(db)
     
-    if not user:
-        raise HTTPException(
-            status_code=401,
-            detail="Invalid refresh token.",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    return await _get_user_token(user=user, refresh_token=token)
+    return await _get_user_token(user=user)
 
     
 def _verify_user_access(user: UserModel):
@@ -52,7 +82,7 @@ def _verify_user_access(user: UserModel):
         )
 
 
-async def _get_user_token(user: UserModel, refresh_token: str = None):
+async def _get_user_token(user, refresh_token: str = None):
     payload = {"id": user.id}
     
     access_token_expiry = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -62,17 +92,19 @@ async def _get_user_token(user: UserModel, refresh_token: str = None):
     if not refresh_token:
         refresh_token = await create_refresh_token(payload)
     
-    return TokenResponse(
+    # Built from values we just created, so skip validation
+    return TokenResponse.model_construct(
         access_token=access_token,
         refresh_token=refresh_token,
-        expires_in=access_token_expiry.total_seconds()  # total_seconds for precision
+        expires_in=int(access_token_expiry.total_seconds())
     )
 
 
-async def login_user(data: OAuth2PasswordRequestForm, db: Session):
-    user = db.query(UserModel).filter(
+async def login_user(data: OAuth2PasswordRequestForm, db: DBSession):
+    result = await db_execute(db, select(UserModel).where(
         (UserModel.username == data.username) | (UserModel.email == data.username)
-    ).first()
+    ))
+    user = result.scalars().first()
 
     if not user:
         raise HTTPException(
@@ -81,7 +113,8 @@ async def login_user(data: OAuth2PasswordRequestForm, db: Session):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    if not verify_password(data.password, user.password):
+    valid, new_hash = await verify_and_update_password_async(data.password, user.password)
+    if not valid:
         raise HTTPException(
             status_code=400,
             detail="Invalid login credentials.",
@@ -89,54 +122,145 @@ async def login_user(data: OAuth2PasswordRequestForm, db: Session):
         )
 
     _verify_user_access(user)
-    return await _get_user_token(user)
-
-
-async def register_user(data: UserCreateRequest, db: Session, background_tasks: BackgroundTasks):
-    existing_user = db.query(UserModel).filter(
-        (UserModel.email == data.email) | (UserModel.username == data.username)
-    ).first()
-
-    if existing_user:
-        raise HTTPException(
-            status_code=422,
-            detail="Username or email is already registered with us."
-        )
-
-    verification_code = generate_verification_code()
-    expiration_time = generate_code_expiration(minutes=15)  # Code expires in 15 minutes
-
-    new_user = UserModel(
+    if new_hash:
+        # Hash below the configured cost: store the upgraded one with this login, unless the password changed meanwhile
+        await db_execute(db, update(UserModel).where(
+            UserModel.id == user.id,
+            UserModel.password == user.password,
+        ).values(password=new_hash).execution_options(synchronize_session=False))
+    token = await _get_user_token(user)
+    if new_hash:
+        await db_commit(db)
+        password_rehashes.inc()
+    return token
+
+
+async def register_user(data: UserCreateRequest, db: DBSession):
+    if await is_account_taken(data.username, data.email, db):
+        raise HTTPException(status_code=422, detail="Username or email is already registered with us.")
+
+    # With signed tokens nothing is stored for the verification, the token is built once the id is known
+    verification_code = None if settings.EMAIL_SIGNED_TOKENS else generate_verification_code()
+    expiration_time = None if settings.EMAIL_SIGNED_TOKENS else generate_code_expiration(minutes=15)  # Code expires in 15 minutes
+
+    # INSERT ... ON CONFLICT DO NOTHING RETURNING, a username or email taken since the check returns no row
+    statement = insert_ignoring_conflicts(UserModel).values(
         username=data.username,
         email=data.email,
-        password=get_password_hash(data.password),
+        password=await hash_password_async(data.password),
         verification_code=verification_code,
         verification_code_expiration=expiration_time,
         is_active=False,  # Inactive until verified
         is_verified=False,
         registered_at=datetime.utcnow(),  # UTC for consistency
-        updated_at=datetime.utcnow()
-    )
+        updated_at=datetime.utcnow(),
+        signup_source="register",
+    ).returning(UserModel)
+
+    try:
+        result = await db_execute(db, statement)
+        new_user = result.scalars().first()
+    except IntegrityError:
+        new_user = None
+
+    if not new_user:
+        await db_rollback(db)
+        raise HTTPException(
+            status_code=422,
+            detail="Username or email is already registered with us."
+        )
 
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    if settings.EMAIL_SIGNED_TOKENS:
+        verification_code = email_token_link(settings.EMAIL_VERIFY_URL, create_verification_token(new_user.id, new_user.email))
 
-    # Send verification code via email
-    background_tasks.add_task(
-        send_verification_email,
-        email=new_user.email,
-        username=new_user.username,
-        verification_code=verification_code
-    )
+    if settings.EMAIL_OUTBOX:
+        # Written in the same transaction as the user row
+        db.add(outbox_email(new_user.email, 'verification_email.html', username=new_user.username, verification_code=verification_code))
+    await db_commit(db)
+
+    # Queue the verification code email
+    if not settings.EMAIL_OUTBOX:
+        send_verification_email(
+            email=new_user.email,
+            username=new_user.username,
+            verification_code=verification_code
+        )
 
     return new_user
 
-def verify_user_code(email: str, code: str, db: Session):
+async def verify_user_code(email: str, code: str, db: DBSession, token: str = None):
+    """
+    Verifies the user's code, or signed token, and activates the account if valid.
+    """
+    if token:
+        return await _verify_user_token(token, db)
+    if not email or not code:
+        raise HTTPException(status_code=400, detail="Provide the token, or the email and code.")
+
+    now = datetime.utcnow()
+
+    # Mark the user as verified in one UPDATE ... RETURNING guarded by the code checks
+    result = await db_execute(db, update(UserModel).where(
+        UserModel.email == email,
+        UserModel.is_verified.is_not(True),
+        UserModel.verification_code == code,
+        UserModel.verification_code_expiration >= now,
+    ).values(
+        is_verified=True,
+        is_active=True,
+        verification_code=None,  # Clear the code after verification
+        verification_code_expiration=None,
+        updated_at=now,
+    ).returning(UserModel.id).execution_options(synchronize_session=False))
+    user_id = result.scalars().first()
+
+    if not user_id:
+        await db_rollback(db)
+        await _raise_verification_error(email, code, db)
+
+    await db_commit(db)
+    invalidate_principal(user_id)
+
+    return {"message": "Account verified successfully"}
+
+
+async def _verify_user_token(token: str, db: DBSession):
+    payload = decode_email_token(token, "verify")
+    now = datetime.utcnow()
+
+    # The only statement of the flow, a verified account no longer matches so the token is single use
+    result = await db_execute(db, update(UserModel).where(
+        UserModel.id == payload["id"],
+        UserModel.email == payload.get("email"),
+        UserModel.is_verified.is_not(True),
+    ).values(
+        is_verified=True,
+        is_active=True,
+        verification_code=None,
+        verification_code_expiration=None,
+        updated_at=now,
+    ).returning(UserModel.id).execution_options(synchronize_session=False))
+    user_id = result.scalars().first()
+
+    if not user_id:
+        await db_rollback(db)
+        raise HTTPException(status_code=400, detail="Token is no longer valid")
+
+    await db_commit(db)
+    mark_email_token_used(payload)
+    invalidate_principal(user_id)
+
+    return {"message": "Account verified successfully"}
+
+
+async def _raise_verification_error(email: str, code: str, db: DBSession):
     """
-    Verifies the user's code and activates the account if valid.
+    Work out why a verification UPDATE matched no row. Only runs on the failure path.
     """
-    user = db.query(UserModel).filter(UserModel.email == email).first()
+    result = await db_execute(db, select(
+        UserModel.is_verified, UserModel.verification_code, UserModel.verification_code_expiration
+    ).where(UserModel.email == email))
+    user = result.first()
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -147,113 +271,189 @@ def verify_user_code(email: str, code: str, db: Session):
     if user.verification_code != code:
         raise HTTPException(status_code=400, detail="Invalid verification code")
 
-    if user.verification_code_expiration < datetime.utcnow():
-        raise HTTPException(status_code=400, detail="Verification code has expired")
+    raise HTTPException(status_code=400, detail="Verification code has expired")
 
-    # Mark the user as verified
-    user.is_verified = True
-    user.is_active = True
-    user.verification_code = None  # Clear the code after verification
-    user.verification_code_expiration = None
-    user.updated_at = datetime.utcnow()
 
-    db.commit()
-    db.refresh(user)
+async def _raise_reset_error(email: str, code: str, db: DBSession):
+    """
+    Work out why a password reset UPDATE matched no row. Only runs on the failure path.
+    """
+    result = await db_execute(db, select(UserModel.reset_password_code).where(UserModel.email == email))
+    user = result.first()
 
-    return {"message": "Account verified successfully"}
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    if user.reset_password_code != code:
+        raise HTTPException(status_code=400, detail="Invalid reset code")
+
+    raise HTTPException(status_code=400, detail="Reset code has expired")
 
 
 # Forgot password service
-async def forgot_password(email: str, db: Session, background_tasks: BackgroundTasks):
+async def forgot_password(email: str, db: DBSession):
     """
     Service to handle forgot password functionality by sending a reset code.
     """
-    user = db.query(UserModel).filter(UserModel.email == email).first()
-
-    if not user:
-        raise HTTPException(status_code=404, detail="Email not found")
-
-    # Generate reset password code and expiration time
-    reset_code = generate_verification_code() 
-    expiration_time = generate_code_expiration(minutes=15)  # Code expires in 15 minutes
-
-    # Save reset password code and expiration time in the user record
-    user.reset_password_code = reset_code
-    user.reset_password_code_expiration = expiration_time
-    user.updated_at = datetime.utcnow()
-
-    db.commit()
-    db.refresh(user)
-
-    # Send reset code via email for password reset
-    background_tasks.add_task(
-        send_password_reset_email, 
-        email=user.email,
-        username=user.username,
-        reset_code=reset_code  # Pass the reset_code instead of verification_code
-    )
+    if settings.EMAIL_SIGNED_TOKENS:
+        # Read only: the token carries everything the reset needs, bound to the current password hash
+        result = await db_execute(db, select(
+            UserModel.id, UserModel.email, UserModel.username, UserModel.password
+        ).where(UserModel.email == email))
+        user = result.first()
+        if not user:
+            raise HTTPException(status_code=404, detail="Email not found")
+        reset_code = email_token_link(settings.EMAIL_RESET_URL, create_password_reset_token(user.id, user.password))
+    else:
+        # Generate reset password code and expiration time
+        reset_code = generate_verification_code()
+        expiration_time = generate_code_expiration(minutes=15)  # Code expires in 15 minutes
+
+        # Save reset password code and expiration time in the user record
+        result = await db_execute(db, update(UserModel).where(UserModel.email == email).values(
+            reset_password_code=reset_code,
+            reset_password_code_expiration=expiration_time,
+            updated_at=datetime.utcnow(),
+        ).returning(UserModel.email, UserModel.username).execution_options(synchronize_session=False))
+        user = result.first()
+
+        if not user:
+            await db_rollback(db)
+            raise HTTPException(status_code=404, detail="Email not found")
+
+    if settings.EMAIL_OUTBOX:
+        # Written in the same transaction as the reset code
+        db.add(outbox_email(user.email, 'password_reset_email.html', username=user.username, verification_code=reset_code))
+        await db_commit(db)
+    elif not settings.EMAIL_SIGNED_TOKENS:
+        await db_commit(db)
+
+    # Queue the reset code email for password reset
+    if not settings.EMAIL_OUTBOX:
+        send_password_reset_email(
+            email=user.email,
+            username=user.username,
+            reset_code=reset_code  # Pass the reset_code instead of verification_code
+        )
 
     return {"message": "Password reset code sent to email."}
 
 
 # Reset password service
-async def reset_password(email: str, code: str, new_password: str, confirm_password: str, db: Session):
+async def reset_password(email: str, code: str, new_password: str, confirm_password: str, db: DBSession, token: str = None):
     """
-    Service to handle resetting the password after the user provides the reset code.
+    Service to handle resetting the password after the user provides the reset code or signed token.
     """
     # Check if the new password and confirm password match
     if new_password != confirm_password:
         raise HTTPException(status_code=400, detail="Passwords do not match")
 
-    user = db.query(UserModel).filter(UserModel.email == email).first()
+    if token:
+        return await _reset_password_with_token(token, new_password, db)
+    if not email or not code:
+        raise HTTPException(status_code=400, detail="Provide the token, or the email and code.")
+
+    # Hash new password and save it in one UPDATE ... RETURNING guarded by the reset code checks
+    new_hash = await hash_password_async(new_password)
+    now = datetime.utcnow()
+    result = await db_execute(db, update(UserModel).where(
+        UserModel.email == email,
+        UserModel.reset_password_code == code,
+        UserModel.reset_password_code_expiration >= now,
+    ).values(
+        password=new_hash,
+        reset_password_code=None,  # Clear the reset code
+        reset_password_code_expiration=None,
+        updated_at=now,
+    ).returning(UserModel.id).execution_options(synchronize_session=False))
+    user_id = result.scalars().first()
 
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    if not user_id:
+        await db_rollback(db)
+        await _raise_reset_error(email, code, db)
 
-    # Verify the reset password code
-    if user.reset_password_code != code:
-        raise HTTPException(status_code=400, detail="Invalid reset code")
+    await _finish_password_reset(user_id, db)
+    return {"message": "Password reset successfully"}
 
-    if user.reset_password_code_expiration < datetime.utcnow():
-        raise HTTPException(status_code=400, detail="Reset code has expired")
 
-    # Hash new password and save it
-    user.password = get_password_hash(new_password)
-    user.reset_password_code = None  # Clear the reset code
-    user.reset_password_code_expiration = None
-    user.updated_at = datetime.utcnow()
+async def _reset_password_with_token(token: str, new_password: str, db: DBSession):
+    payload = decode_email_token(token, "reset")
+
+    # One UPDATE, matching only while the hash still has the fingerprint the token was issued for.
+    # The new hash has a new salt, so the token can't be redeemed twice.
+    fingerprint = payload.get("pwd")
+    if not fingerprint:
+        raise HTTPException(status_code=400, detail="Invalid or expired token")
+    new_hash = await hash_password_async(new_password)
+    result = await db_execute(db, update(UserModel).where(
+        UserModel.id == payload["id"],
+        func.substr(UserModel.password, 1, len(fingerprint)) == fingerprint,
+    ).values(
+        password=new_hash,
+        reset_password_code=None,
+        reset_password_code_expiration=None,
+        updated_at=datetime.utcnow(),
+    ).returning(UserModel.id).execution_options(synchronize_session=False))
+    user_id = result.scalars().first()
 
-    db.commit()
-    db.refresh(user)
+    if not user_id:
+        await db_rollback(db)
+        raise HTTPException(status_code=400, detail="Token is no longer valid")
 
+    await _finish_password_reset(user_id, db)
+    mark_email_token_used(payload)
     return {"message": "Password reset successfully"}
 
 
-async def change_password(user_id: int, data: ChangePasswordRequest, db: Session):
+async def _finish_password_reset(user_id: int, db: DBSession):
+    # Existing tokens stop working once the password changes
+    revoked_before = revoke_user_tokens(db, user_id)
+    await db_commit(db)
+    revocation_store.add_cutoff(user_id, revoked_before)
+    invalidate_principal(user_id)
+
+
+async def change_password(user_id: int, data: ChangePasswordRequest, db: DBSession):
     """
     Service to change the user's password after validating the current password.
     """
-    # Fetch the user by their ID
-    user = db.query(UserModel).filter(UserModel.id == user_id).first()
+    # Fetch the current password hash by the user's ID, from the primary since the update depends on it
+    use_primary(db)
+    result = await db_execute(db, select(UserModel.password).where(UserModel.id == user_id))
+    current_hash = result.scalars().first()
 
-    if not user:
+    if not current_hash:
         raise HTTPException(status_code=404, detail="User not found")
 
     # Verify the current password
-    if not verify_password(data.current_password, user.password):
+    if not await verify_password_async(data.current_password, current_hash):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
 
     # Check if new password and confirm password match
     if data.new_password != data.confirm_password:
         raise HTTPException(status_code=400, detail="New password and confirm password do not match")
 
-    # Hash the new password and update the user's password
-    user.password = get_password_hash(data.new_password)
-    user.updated_at = datetime.utcnow()
+    # Hash the new password and update it, unless it changed since it was verified
+    new_hash = await hash_password_async(data.new_password)
+    result = await db_execute(db, update(UserModel).where(
+        UserModel.id == user_id,
+        UserModel.password == current_hash,
+    ).values(
+        password=new_hash,
+        updated_at=datetime.utcnow(),
+    ).returning(UserModel.id).execution_options(synchronize_session=False))
+
+    if not result.scalars().first():
+        await db_rollback(db)
+        raise HTTPException(status_code=409, detail="Password was changed by another request")
+
+    # Existing tokens stop working once the password changes
+    revoked_before = revoke_user_tokens(db, user_id)
 
     # Commit the changes to the database
-    db.commit()
-    db.refresh(user)
+    await db_commit(db)
+    revocation_store.add_cutoff(user_id, revoked_before)
+    invalidate_principal(user_id)
 
     return {"message": "Password changed successfully"}
 
@@ -0,0 +1,109 @@
+"""
+Count SQL statements during bursts of parallel requests carrying one token.
+
+Run from the project root:
+    python -m benchmarks.coalescing --burst 20 --rounds 10
+
+Stands in for a mobile client launching: `--burst` parallel GET /users/me with
+one access token and a cold principal cache, then `--burst` parallel
+POST /auth/refresh with one refresh token, once per seeded user. Each scenario
+runs with REQUEST_COALESCING off and on (see core/singleflight.py). Without it
+every /users/me request queries the user and only one refresh wins the
+rotation, the rest get 401; with it a burst shares one lookup and one rotation.
+The app runs in-process against a throwaway SQLite database (benchmarks/harness.py).
+With DB_ASYNC=false queries block the loop, so calls never overlap and a burst
+larger than the pool stalls.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from benchmarks import harness
+from core import singleflight
+from core.instrumentation import query_duration
+from core.principals import principal_cache
+
+PASSWORD = "secret"
+
+
+def _statements() -> int:
+    return sum(histogram.count for histogram in query_duration.children.values())
+
+
+def _coalesced() -> dict:
+    return dict(singleflight.coalesced_calls.values)
+
+
+async def _login(client, username: str) -> dict:
+    response = await client.post("/auth/login", data={"username": username, "password": PASSWORD})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def _burst(client, requests: list) -> tuple:
+    principal_cache.clear()  # Cold start: the first requests after launch miss the cache
+    before = _statements()
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(request() for request in requests))
+    elapsed = time.perf_counter() - start
+    statuses = {}
+    for response in responses:
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    return _statements() - before, elapsed, statuses
+
+
+async def _run(client, usernames: list, burst: int) -> dict:
+    results = {}
+    for scenario in ("me", "refresh"):
+        statements, latencies, statuses = [], [], {}
+        for username in usernames:
+            tokens = await _login(client, username)
+            if scenario == "me":
+                headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+                requests = [lambda: client.get("/users/me", headers=headers)] * burst
+            else:
+                headers = {"refresh-token": tokens["refresh_token"]}
+                requests = [lambda: client.post("/auth/refresh", headers=headers)] * burst
+            count, elapsed, burst_statuses = await _burst(client, requests)
+            statements.append(count)
+            latencies.append(elapsed * 1000)
+            for status, hits in burst_statuses.items():
+                statuses[status] = statuses.get(status, 0) + hits
+        results[scenario] = {
+            "sql_per_burst": round(statistics.mean(statements), 1),
+            "burst_p50_ms": round(statistics.median(latencies), 1),
+            "statuses": statuses,
+        }
+    return results
+
+
+async def _main(burst: int, rounds: int):
+    async with harness.running_app(), harness.client() as client:
+        for index, enabled in enumerate((False, True)):
+            singleflight.settings.REQUEST_COALESCING = enabled
+            before = _coalesced()
+            usernames = [f"user{index * rounds + i}" for i in range(rounds)]
+            results = await _run(client, usernames, burst)
+            calls = {labels: value - before.get(labels, 0) for labels, value in _coalesced().items()}
+            print(f"REQUEST_COALESCING={str(enabled).lower()}")
+            for scenario, result in results.items():
+                print(f"    {scenario:>8}: {result}")
+            if enabled:
+                for group in ("user", "refresh"):
+                    shared = calls.get((group, "shared"), 0)
+                    total = shared + calls.get((group, "leader"), 0)
+                    print(f"    {group:>8} coalescing ratio {shared / total if total else 0:.2f} ({shared}/{total} calls shared)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--burst", type=int, default=20, help="parallel requests per token")
+    parser.add_argument("--rounds", type=int, default=10, help="bursts per scenario, one user each")
+    args = parser.parse_args()
+
+    harness.seed_users(args.rounds * 2, PASSWORD)
+    asyncio.run(_main(args.burst, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Measure email render throughput: a fresh Jinja2 environment per email versus the
+cached template registry with pre-rendered MIME messages.
+
+Run from the project root:
+    python -m benchmarks.email_render --number 2000
+"""
+import argparse
+import timeit
+from jinja2 import Environment, FileSystemLoader
+from auth.email_templates import TEMPLATE_DIR, TemplateRegistry
+from core.mailer import build_mime
+
+FIELDS = {"username": "benchmark-user", "verification_code": "123456"}
+
+
+def render_uncached() -> str:
+    env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
+    html = env.get_template("verification_email.html").render(**FIELDS)
+    return build_mime("user@example.com", "Your Verification Code", html, is_html=True).as_string()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    registry = TemplateRegistry()
+    registry.load()
+    template = registry.get("verification_email.html")
+
+    cases = {
+        "uncached": render_uncached,
+        "cached": lambda: build_mime(
+            "user@example.com", template.subject, template.render(**FIELDS), is_html=True
+        ).as_string(),
+        "pre-rendered": lambda: template.render_message("user@example.com", **FIELDS),
+    }
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=args.number, repeat=3))
+        print(f"{name:>12}: {args.number / seconds:10.0f} emails/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Shared setup for benchmarks that drive the whole app in-process.
+
+Importing this module points the app at a throwaway SQLite database and at a
+local SMTP sink before anything reads the settings, so import it before `main`
+or any `core` module. Variables already set in the environment win, e.g.
+DB_ASYNC=false to measure the sync session path.
+"""
+import email
+import os
+import re
+import socketserver
+import tempfile
+import threading
+from contextlib import asynccontextmanager
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    # Just enough SMTP for smtplib.sendmail without TLS or AUTH
+    def reply(self, line: str):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        self.server.connected()
+        self.reply("220 sink")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self.reply("250 sink")
+            elif command == b"MAIL":
+                fault = self.server.next_fault()
+                if fault == "drop":
+                    return  # Hang up without a reply, like a server restart
+                if fault == "reject":
+                    self.reply("451 Try again later")
+                    continue
+                recipients = []
+                self.reply("250 OK")
+            elif command == b"RCPT":
+                recipients.append(line.split(b":", 1)[1].strip(b" <>\r\n").decode())
+                self.reply("250 OK")
+            elif command == b"DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                for data_line in self.rfile:
+                    if data_line == b".\r\n":
+                        break
+                    data.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                self.server.deliver(recipients, b"".join(data))
+                self.reply("250 OK")
+            elif command == b"QUIT":
+                self.reply("221 Bye")
+                return
+            else:  # RSET, NOOP
+                self.reply("250 OK")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    Local SMTP server keeping the latest message per recipient, so flows can
+    read the verification and reset codes the app sends. Counts connections and
+    can hang up on or reject the next messages, to exercise the mail workers.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.messages = {}
+        self.received = 0
+        self.connections = 0
+        self.faults = []  # "drop" or "reject", applied to the next MAIL commands in order
+        self._condition = threading.Condition()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def connected(self):
+        with self._condition:
+            self.connections += 1
+
+    def next_fault(self):
+        with self._condition:
+            return self.faults.pop(0) if self.faults else None
+
+    def wait_received(self, count: int, timeout: float = 10) -> bool:
+        """
+        Wait until `count` messages have been delivered in total.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self.received >= count, timeout)
+
+    def deliver(self, recipients: list, data: bytes):
+        message = email.message_from_bytes(data)
+        text = "".join(
+            part.get_payload(decode=True).decode("utf-8", "replace")
+            for part in message.walk() if part.get_content_maintype() == "text"
+        )
+        with self._condition:
+            for recipient in recipients:
+                self.messages[recipient.lower()] = text
+            self.received += 1
+            self._condition.notify_all()
+
+    def pop_message(self, recipient: str, timeout: float = 10) -> str:
+        """
+        Wait for the next message to `recipient` and return its text.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: recipient.lower() in self.messages, timeout):
+                raise TimeoutError(f"No email for {recipient}")
+            return self.messages.pop(recipient.lower())
+
+    def pop_code(self, recipient: str, timeout: float = 10) -> str:
+        """
+        Wait for the next message to `recipient` and return the 6 digit code in it.
+        """
+        return re.search(r"(?:Code: |<h2>)(\d{6})", self.pop_message(recipient, timeout)).group(1)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="smtp-sink", daemon=True).start()
+
+
+sink = SMTPSink()
+sink.start()
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/benchmark.db")
+os.environ.setdefault("DB_ASYNC", "true")  # The sync path blocks the loop once concurrency exceeds the pool
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")  # Every virtual user shares one client IP
+os.environ.setdefault("LOAD_SHED_ENABLED", "false")
+os.environ.setdefault("EMAIL_SENDER", "noreply@example.com")
+os.environ.update({
+    "SMTP_SERVER": "127.0.0.1",
+    "SMTP_PORT": str(sink.port),
+    "EMAIL_USE_TLS": "false",
+    "EMAIL_PASSWORD": "",  # No AUTH against the sink
+    "EMAIL_OUTBOX": "false",
+})
+
+import httpx  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+from core.database import Base, engine  # noqa: E402
+from core.instrumentation import request_queries  # noqa: E402
+from core.security import get_password_hash  # noqa: E402
+from users.models import UserModel  # noqa: E402
+from main import app  # noqa: E402
+
+
+def seed_users(count: int, password: str, prefix: str = "user") -> list:
+    """
+    Create the schema and `count` active, verified users sharing one password hash.
+    Returns their usernames.
+    """
+    Base.metadata.create_all(engine)
+    hashed = get_password_hash(password)
+    usernames = [f"{prefix}{i}" for i in range(count)]
+    with engine.begin() as conn:
+        conn.execute(insert(UserModel), [
+            {"username": username, "email": f"{username}@example.com", "password": hashed, "is_active": True, "is_verified": True}
+            for username in usernames
+        ])
+    return usernames
+
+
+def client(ip: str = "127.0.0.1") -> httpx.AsyncClient:
+    transport = httpx.ASGITransport(app=app, client=(ip, 40000))
+    return httpx.AsyncClient(transport=transport, base_url="http://bench")
+
+
+@asynccontextmanager
+async def running_app():
+    # ASGITransport doesn't send lifespan events, run the startup and shutdown hooks ourselves
+    await app.router.startup()
+    try:
+        yield app
+    finally:
+        await app.router.shutdown()
+
+
+def query_totals() -> dict:
+    """
+    {route template: (requests, SQL statements)} recorded so far by MetricsMiddleware.
+    """
+    return {route: (histogram.count, histogram.sum) for (route,), histogram in request_queries.children.items()}
@@ -0,0 +1,75 @@
+"""
+Measure event-loop latency while concurrent logins verify bcrypt hashes.
+
+Run from the project root:
+    python -m benchmarks.hash_event_loop_lag --logins 32
+
+A ticker coroutine sleeps for a fixed interval and records how late it wakes up.
+With inline hashing the lag grows with every login; with the hashing worker pool
+it stays flat.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from passlib.context import CryptContext
+from core.hashing import run_in_hash_pool, shutdown_hash_executor
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+TICK = 0.005
+
+
+def verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+async def _ticker(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - start - TICK) * 1000)
+
+
+async def _inline_login(hashed: str):
+    verify("secret", hashed)
+
+
+async def _pooled_login(hashed: str):
+    await run_in_hash_pool(verify, "secret", hashed)
+
+
+async def _run(login, logins: int, hashed: str) -> dict:
+    stop = asyncio.Event()
+    lags = []
+    ticker = asyncio.create_task(_ticker(stop, lags))
+    await asyncio.sleep(TICK * 2)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(login(hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await ticker
+    lags.sort()
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "lag_p50_ms": round(statistics.median(lags), 2),
+        "lag_p99_ms": round(lags[int(len(lags) * 0.99) - 1 if len(lags) > 1 else 0], 2),
+        "lag_max_ms": round(lags[-1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=32)
+    args = parser.parse_args()
+
+    hashed = pwd_context.hash("secret")
+    for name, login in (("inline", _inline_login), ("pool", _pooled_login)):
+        result = asyncio.run(_run(login, args.logins, hashed))
+        print(f"{name:>6}: {result}")
+    shutdown_hash_executor()
+
+
+if __name__ == "__main__":
+    main()
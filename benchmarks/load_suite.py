@@ -0,0 +1,306 @@
+"""
+Load test every auth endpoint in-process and report latency, throughput and SQL per endpoint.
+
+Run from the project root:
+    python -m benchmarks.load_suite --concurrency 16 --requests 1000 --output results.json
+    python -m benchmarks.load_suite --baseline results.json   # exits 1 on a regression
+
+The app from main.py runs against a throwaway SQLite database and a local SMTP
+sink (see benchmarks/harness.py). Each worker owns one seeded user and picks
+operations from the mix, so flows that revoke tokens or change passwords don't
+interfere. Client and app share the process, so compare numbers from the same
+machine only.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from collections import deque
+from benchmarks import harness
+
+PASSWORD = "Secret123!"
+
+# Operation weights, the names are the endpoints they report
+MIXES = {
+    "default": "login=2,me=10,refresh=4,register=1,verify=1,forgot_password=1,reset_password=1,change_password=1",
+    "read": "me=20,refresh=4,login=1",
+    "signup": "register=4,verify=4,login=2,me=2",
+    "passwords": "forgot_password=2,reset_password=2,change_password=2,login=1,me=1",
+}
+
+# Route template per endpoint, to read SQL statement counts from the metrics
+ROUTES = {
+    "register": "/auth/register",
+    "verify": "/auth/verify",
+    "login": "/auth/login",
+    "refresh": "/auth/refresh",
+    "me": "/users/me",
+    "forgot_password": "/auth/forgot-password",
+    "reset_password": "/auth/reset-password",
+    "change_password": "/auth/change-password",
+}
+
+
+class Results:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.samples = {}
+        self.recording = False
+
+    def record(self, endpoint: str, seconds: float, response, expected: int):
+        if not self.recording:
+            return
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        if response.status_code != expected:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            self.samples.setdefault(endpoint, f"{response.status_code} {response.text[:200]}")
+
+
+class VirtualUser:
+    """
+    One worker's account and tokens.
+    """
+    new_accounts = itertools.count()
+    pending_verifications = deque()  # Emails registered but not verified yet, shared by the workers
+
+    def __init__(self, client, username: str, results: Results):
+        self.client = client
+        self.username = username
+        self.email = f"{username}@example.com"
+        self.password = PASSWORD
+        self.results = results
+        self.access_token = None
+        self.refresh_token = None
+        self.reset_code = None
+        self.changes = 0
+
+    async def call(self, endpoint: str, method: str, url: str, expected: int = 200, **kwargs):
+        start = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        self.results.record(endpoint, time.perf_counter() - start, response, expected)
+        return response
+
+    def _store_tokens(self, response):
+        if response.status_code == 200:
+            tokens = response.json()
+            self.access_token, self.refresh_token = tokens["access_token"], tokens["refresh_token"]
+        else:
+            self.access_token = self.refresh_token = None
+
+    def _next_password(self) -> str:
+        self.changes += 1
+        return f"{PASSWORD}{self.changes}"
+
+    async def ensure_tokens(self):
+        if not self.access_token:
+            await self.login()
+
+    async def login(self):
+        response = await self.call("login", "POST", "/auth/login", data={"username": self.username, "password": self.password})
+        self._store_tokens(response)
+
+    async def me(self):
+        await self.ensure_tokens()
+        await self.call("me", "GET", "/users/me", headers={"Authorization": f"Bearer {self.access_token}"})
+
+    async def refresh(self):
+        await self.ensure_tokens()
+        response = await self.call("refresh", "POST", "/auth/refresh", headers={"refresh-token": self.refresh_token})
+        self._store_tokens(response)
+
+    async def register(self):
+        username = f"new{next(self.new_accounts)}"
+        email = f"{username}@example.com"
+        response = await self.call(
+            "register", "POST", "/auth/register", expected=201,
+            json={"username": username, "email": email, "password": PASSWORD},
+        )
+        if response.status_code == 201:
+            self.pending_verifications.append(email)
+
+    async def verify(self):
+        if not self.pending_verifications:
+            await self.register()
+        if not self.pending_verifications:
+            return
+        email = self.pending_verifications.popleft()
+        code = await asyncio.to_thread(harness.sink.pop_code, email)
+        await self.call("verify", "POST", "/auth/verify", json={"email": email, "code": code})
+
+    async def forgot_password(self):
+        response = await self.call("forgot_password", "POST", "/auth/forgot-password", json={"email": self.email})
+        # Wait for this request's email so a later reset uses the latest code
+        if response.status_code == 200:
+            self.reset_code = await asyncio.to_thread(harness.sink.pop_code, self.email)
+
+    async def reset_password(self):
+        if not self.reset_code:
+            await self.forgot_password()
+        if not self.reset_code:
+            return
+        password = self._next_password()
+        response = await self.call(
+            "reset_password", "POST", "/auth/reset-password",
+            json={"email": self.email, "code": self.reset_code, "new_password": password, "confirm_password": password},
+        )
+        self.reset_code = None
+        if response.status_code == 200:
+            self.password = password
+            self.access_token = self.refresh_token = None  # Revoked by the reset
+
+    async def change_password(self):
+        await self.ensure_tokens()
+        password = self._next_password()
+        response = await self.call(
+            "change_password", "PUT", "/auth/change-password",
+            headers={"Authorization": f"Bearer {self.access_token}"},
+            json={"current_password": self.password, "new_password": password, "confirm_password": password},
+        )
+        if response.status_code == 200:
+            self.password = password
+            self.access_token = self.refresh_token = None  # Revoked by the change
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for item in MIXES.get(value, value).split(","):
+        name, weight = item.split("=")
+        if name.strip() not in ROUTES:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint {name!r}, expected one of {', '.join(ROUTES)}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+async def _worker(user: VirtualUser, mix: dict, budget: itertools.count, total: int, deadline: float, rng: random.Random):
+    names, weights = list(mix), list(mix.values())
+    while next(budget) < total and time.perf_counter() < deadline:
+        await getattr(user, rng.choices(names, weights)[0])()
+
+
+def _percentile(values: list, fraction: float) -> float:
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def summarize(results: Results, elapsed: float, queries_before: dict, queries_after: dict) -> dict:
+    endpoints = {}
+    for endpoint, latencies in sorted(results.latencies.items()):
+        latencies.sort()
+        requests_before, statements_before = queries_before.get(ROUTES[endpoint], (0, 0))
+        requests_after, statements_after = queries_after.get(ROUTES[endpoint], (0, 0))
+        requests = requests_after - requests_before
+        endpoints[endpoint] = {
+            "requests": len(latencies),
+            "errors": results.errors.get(endpoint, 0),
+            "throughput_rps": round(len(latencies) / elapsed, 2),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+            "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+            "p95_ms": round(_percentile(latencies, 0.95) * 1000, 3),
+            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+            "queries_per_request": round((statements_after - statements_before) / requests, 3) if requests else None,
+        }
+        if endpoint in results.samples:
+            endpoints[endpoint]["error_sample"] = results.samples[endpoint]
+    total = sum(len(latencies) for latencies in results.latencies.values())
+    return {"elapsed_s": round(elapsed, 3), "throughput_rps": round(total / elapsed, 2), "endpoints": endpoints}
+
+
+async def run(args) -> dict:
+    usernames = harness.seed_users(args.concurrency, PASSWORD)
+    results = Results()
+    async with harness.running_app(), harness.client() as client:
+        users = [VirtualUser(client, username, results) for username in usernames]
+        rngs = [random.Random(args.seed + i) for i in range(len(users))]
+
+        # Warm-up fills the pools and caches, it isn't recorded
+        budget = itertools.count()
+        await asyncio.gather(*(_worker(user, args.mix, budget, args.warmup, float("inf"), rng) for user, rng in zip(users, rngs)))
+
+        results.recording = True
+        queries_before = harness.query_totals()
+        budget = itertools.count()
+        deadline = time.perf_counter() + args.duration if args.duration else float("inf")
+        total = args.requests if not args.duration else sys.maxsize
+        start = time.perf_counter()
+        await asyncio.gather(*(_worker(user, args.mix, budget, total, deadline, rng) for user, rng in zip(users, rngs)))
+        elapsed = time.perf_counter() - start
+        queries_after = harness.query_totals()
+
+    summary = summarize(results, elapsed, queries_before, queries_after)
+    summary["config"] = {
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "duration": args.duration,
+        "mix": args.mix,
+        "seed": args.seed,
+        "db_async": os.environ["DB_ASYNC"],
+    }
+    return summary
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Regressions against a stored run: slower p95, lower throughput or more SQL statements per request.
+    """
+    regressions = []
+    for endpoint, now in current["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(endpoint)
+        if not before:
+            continue
+        if now["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{endpoint}: p95 {before['p95_ms']}ms -> {now['p95_ms']}ms")
+        if now["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{endpoint}: throughput {before['throughput_rps']} -> {now['throughput_rps']} req/s")
+        if (now["queries_per_request"] or 0) > (before["queries_per_request"] or 0) + 0.01:
+            regressions.append(f"{endpoint}: queries/request {before['queries_per_request']} -> {now['queries_per_request']}")
+        if now["errors"] > before["errors"]:
+            regressions.append(f"{endpoint}: errors {before['errors']} -> {now['errors']}")
+    return regressions
+
+
+def _print_table(summary: dict):
+    columns = ("requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "queries_per_request")
+    print(f"{'endpoint':<16}" + "".join(f"{column:>20}" for column in columns), file=sys.stderr)
+    for endpoint, stats in summary["endpoints"].items():
+        print(f"{endpoint:<16}" + "".join(f"{str(stats[column]):>20}" for column in columns), file=sys.stderr)
+    print(f"total {summary['throughput_rps']} req/s in {summary['elapsed_s']}s", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent virtual users")
+    parser.add_argument("--requests", type=int, default=500, help="operations to measure")
+    parser.add_argument("--duration", type=float, default=0, help="measure for this many seconds instead")
+    parser.add_argument("--warmup", type=int, default=20, help="operations run before measuring")
+    parser.add_argument("--mix", type=parse_mix, default=MIXES["default"], help=f"preset ({', '.join(MIXES)}) or endpoint=weight,...")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95/throughput change before it counts as a regression")
+    args = parser.parse_args()
+
+    summary = asyncio.run(run(args))
+    _print_table(summary)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(summary, json.load(file), args.tolerance)
+        summary["regressions"] = regressions
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(summary, file, indent=2)
+    else:
+        print(json.dumps(summary, indent=2))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Measure legitimate login latency during a credential-stuffing burst.
+
+Run from the project root:
+    python -m benchmarks.rate_limit_attack --attackers 16 --logins 10
+
+The app runs in-process against a throwaway SQLite database (benchmarks/harness.py). Legitimate users
+log in one after another, each from its own IP, while attacker tasks hammer
+/auth/login with wrong passwords from a single IP. Without the rate limiter
+every attempt costs a bcrypt verification and a query, so legitimate logins
+queue behind them; with it the attacker gets cheap 429s and latency stays flat.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from benchmarks import harness
+from core import ratelimit
+
+ATTACKER_IP = "203.0.113.7"
+ATTACK_PAUSE = 0.01  # Stands in for the network round trip of a real client
+
+
+async def _attack(stop: asyncio.Event, statuses: dict, targets: int):
+    async with harness.client(ATTACKER_IP) as client:
+        attempt = 0
+        while not stop.is_set():
+            attempt += 1
+            username = f"user{1000 + attempt % targets}"
+            response = await client.post("/auth/login", data={"username": username, "password": "wrong"})
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            await asyncio.sleep(ATTACK_PAUSE)
+
+
+async def _legit_logins(logins: int, offset: int) -> list:
+    latencies = []
+    for i in range(logins):
+        async with harness.client(f"198.51.100.{i + 1}") as client:
+            start = time.perf_counter()
+            response = await client.post("/auth/login", data={"username": f"user{offset + i}", "password": "secret"})
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.text
+    return latencies
+
+
+async def _run(attackers: int, logins: int, offset: int) -> dict:
+    ratelimit.rate_limit_store.buckets.clear()
+    stop = asyncio.Event()
+    statuses = {}
+    tasks = [asyncio.create_task(_attack(stop, statuses, 500)) for _ in range(attackers)]
+    await asyncio.sleep(0.1 if attackers else 0)
+
+    latencies = await _legit_logins(logins, offset)
+
+    stop.set()
+    await asyncio.gather(*tasks)
+    latencies.sort()
+    return {
+        "legit_p50_ms": round(statistics.median(latencies), 1),
+        "legit_max_ms": round(latencies[-1], 1),
+        "attack_statuses": statuses,
+    }
+
+
+async def _main(attackers: int, logins: int):
+    async with harness.running_app():
+        runs = (
+            ("baseline", 0, True),
+            ("no limit", attackers, False),
+            ("limited", attackers, True),
+        )
+        for index, (name, count, enabled) in enumerate(runs):
+            ratelimit.settings.RATE_LIMIT_ENABLED = enabled
+            result = await _run(count, logins, offset=index * logins)
+            print(f"{name:>8}: {result}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--attackers", type=int, default=16, help="concurrent attacker connections")
+    parser.add_argument("--logins", type=int, default=10, help="legitimate logins per run")
+    args = parser.parse_args()
+
+    harness.seed_users(1500, "secret")
+    asyncio.run(_main(args.attackers, args.logins))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compare per-request response serialization cost before and after the fast JSON path.
+
+Run from the project root:
+    python -m benchmarks.serialization --iterations 20000
+
+"before" runs FastAPI's own serialize_response (response_model validation or
+jsonable_encoder) followed by the stdlib JSONResponse, as the routes did when
+returning ORM objects and validated pydantic models. "after" is what the hot
+routes do now: a precomputed dict serializer or model_dump_json, encoded by
+FastJSONResponse.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")  # Models need an engine, nothing is queried
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+from auth.responses import TokenResponse  # noqa: E402
+from core.responses import FastJSONResponse  # noqa: E402
+from users.models import UserModel  # noqa: E402
+from users.responses import UserResponse, serialize_user  # noqa: E402
+
+TOKEN = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9." + "x" * 120 + ".signature"
+
+
+def _user() -> UserModel:
+    return UserModel(
+        id=42, username="alice", email="alice@example.com", password="hash", is_active=True,
+        is_verified=True, registered_at=datetime(2024, 1, 1, 12, 30), verified_at=datetime(2024, 1, 1, 12, 35),
+    )
+
+
+async def _time(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def _run(iterations: int):
+    user = _user()
+    user_field = create_response_field(name="Response_get_user_detail", type_=UserResponse)
+
+    async def me_before():
+        content = await serialize_response(field=user_field, response_content=user)
+        return JSONResponse(content).body
+
+    async def me_after():
+        return FastJSONResponse(serialize_user(user)).body
+
+    async def token_before():
+        token = TokenResponse(access_token=TOKEN, refresh_token=TOKEN, expires_in=3600.0)
+        content = await serialize_response(response_content=token)
+        return JSONResponse(content).body
+
+    async def token_after():
+        token = TokenResponse.model_construct(access_token=TOKEN, refresh_token=TOKEN, expires_in=3600)
+        return FastJSONResponse(token).body
+
+    # Both paths must produce the same document
+    assert json.loads(await me_before()) == json.loads(await me_after())
+    assert json.loads(await token_before()) == json.loads(await token_after())
+    for name, before, after in (("/users/me", me_before, me_after), ("token", token_before, token_after)):
+        before_us = await _time(before, iterations)
+        after_us = await _time(after, iterations)
+        print(f"{name:>10}: before {before_us:.2f}us  after {after_us:.2f}us  ({before_us / after_us:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(_run(args.iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Report worker cold start time: imports, app construction and startup hooks.
+
+Run from the project root:
+    python -m benchmarks.startup --runs 5
+
+Each run is a fresh interpreter against a throwaway SQLite database, alternating
+the default startup and LAZY_STARTUP=true. Prints the median phase timings per
+mode, then the packages that cost the most import time from one extra
+-X importtime run (kept out of the timings, it slows imports down), so a new
+eager import is easy to spot.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Runs in the child interpreter
+PROBE = """
+import asyncio, json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.app
+built = time.perf_counter()
+asyncio.run(app.router.startup())
+started = time.perf_counter()
+asyncio.run(app.router.shutdown())
+print(json.dumps({"import_ms": (imported - start) * 1000, "build_ms": (built - imported) * 1000, "startup_ms": (started - built) * 1000}))
+"""
+PHASES = ("import_ms", "build_ms", "startup_ms")
+
+
+def _environment(database_url: str, lazy: bool) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": database_url,
+        "LAZY_STARTUP": "true" if lazy else "false",
+        "DB_ASYNC": env.get("DB_ASYNC", "true"),
+        "EMAIL_OUTBOX": "false",
+        "PYTHONPATH": os.getcwd(),
+    })
+    return env
+
+
+def _create_schema(database_url: str):
+    # In a child too, so this process doesn't import the app before measuring it
+    code = "from core.database import Base, engine; import users.models, auth.models, core.revocation; Base.metadata.create_all(engine)"
+    subprocess.run([sys.executable, "-c", code], env=_environment(database_url, False), check=True)
+
+
+def _parse_importtime(stderr: str) -> dict:
+    # "import time: self [us] | cumulative | imported package", summed per top-level package
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us) / 1000
+    return packages
+
+
+def _run(database_url: str, lazy: bool, importtime: bool = False) -> tuple:
+    flags = ["-X", "importtime"] if importtime else []
+    result = subprocess.run(
+        [sys.executable, *flags, "-c", PROBE],
+        env=_environment(database_url, lazy), capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1]), _parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per mode")
+    parser.add_argument("--top", type=int, default=15, help="packages listed by import time")
+    args = parser.parse_args()
+
+    database_url = f"sqlite:///{tempfile.mkdtemp()}/startup.db"
+    _create_schema(database_url)
+
+    timings = {False: [], True: []}
+    for _ in range(args.runs):
+        for lazy in timings:  # Interleaved, so machine noise hits both modes alike
+            timings[lazy].append(_run(database_url, lazy)[0])
+
+    for lazy, runs in timings.items():
+        medians = {phase: statistics.median(run[phase] for run in runs) for phase in PHASES}
+        phases = "  ".join(f"{phase} {ms:.1f}" for phase, ms in medians.items())
+        print(f"LAZY_STARTUP={str(lazy).lower():<5}  {phases}  total {sum(medians.values()):.1f}ms")
+        _, packages = _run(database_url, lazy, importtime=True)
+        for package, ms in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {package:<24}{ms:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
 import os
 from pathlib import Path
-from dotenv import load_dotenv
+from dotenv import dotenv_values, load_dotenv
 from urllib.parse import quote_plus
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 env_path = Path(".") / ".env"
+_process_env = set(os.environ)  # Set outside .env, a reload never overrides them
 load_dotenv(dotenv_path=env_path)
 
 class Settings(BaseSettings):
@@ -15,23 +17,165 @@ class Settings(BaseSettings):
     DB_NAME: str = os.getenv('POSTGRESQL_DB')
     DB_HOST: str = os.getenv('POSTGRESQL_SERVER')
     DB_PORT: str = os.getenv('POSTGRESQL_PORT')
+    DATABASE_URL: Optional[str] = os.getenv('DATABASE_URL')  # Overrides the Postgres settings above, e.g. sqlite:///./dev.db
+    DB_ASYNC: bool = os.getenv('DB_ASYNC', False)  # Use the async engine and AsyncSession for requests
+    DB_POOL_SIZE: int = os.getenv('DB_POOL_SIZE', 5)
+    DB_MAX_OVERFLOW: int = os.getenv('DB_MAX_OVERFLOW', 0)
+    DB_POOL_TIMEOUT: int = os.getenv('DB_POOL_TIMEOUT', 30)  # seconds to wait for a checkout
+    DB_POOL_RECYCLE: int = os.getenv('DB_POOL_RECYCLE', 300)  # seconds
+    DB_POOL_PRE_PING: bool = os.getenv('DB_POOL_PRE_PING', 'false').strip().lower() == 'true'  # Off: stale connections are replaced on error
+    DB_POOL_WARMUP: int = os.getenv('DB_POOL_WARMUP', 5)  # Connections opened at startup, at most DB_POOL_SIZE
+    DB_REPLICA_URLS: Optional[str] = os.getenv('DB_REPLICA_URLS')  # Comma-separated read replica URLs
+    DB_REPLICA_RETRY_AFTER: int = os.getenv('DB_REPLICA_RETRY_AFTER', 30)  # seconds a failed replica stays out of rotation
+    DB_REPLICA_HEALTH_INTERVAL: int = os.getenv('DB_REPLICA_HEALTH_INTERVAL', 10)  # seconds between replica health checks
 
     @property
     def database_url(self) -> str:
+        if self.DATABASE_URL:
+            return self.DATABASE_URL
         return f"postgresql://{self.DB_USER}:{quote_plus(self.DB_PASSWORD)}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    # Internal endpoints
+    INTERNAL_API_TOKEN: Optional[str] = os.getenv('INTERNAL_API_TOKEN')  # Required in the X-Internal-Token header
+
     # JWT 
     JWT_SECRET: str = os.getenv('JWT_SECRET', '709d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7')
-    JWT_ALGORITHM: str = os.getenv('JWT_ALGORITHM', "HS256")
+    JWT_ALGORITHM: str = os.getenv('JWT_ALGORITHM', "HS256")  # HS256 with JWT_SECRET, or EdDSA, ES256, RS256 with the keys in JWT_KEYS_DIR
+    JWT_KEYS_DIR: str = os.getenv('JWT_KEYS_DIR', 'keys')  # <kid>.pem files, see python -m core.jwt_keys
+    JWT_SIGNING_KEY_ID: str = os.getenv('JWT_SIGNING_KEY_ID', '')  # kid that signs new tokens, the newest kid when empty
+    JWT_LEGACY_HS256: bool = os.getenv('JWT_LEGACY_HS256', 'false').strip().lower() == 'true'  # Keep accepting JWT_SECRET tokens after switching to asymmetric signing, until they expire
+    JWT_JWKS_MAX_AGE: int = os.getenv('JWT_JWKS_MAX_AGE', 300)  # seconds verifiers may cache /.well-known/jwks.json
     ACCESS_TOKEN_EXPIRE_MINUTES: int = os.getenv('JWT_TOKEN_EXPIRE_MINUTES', 60)
+    REFRESH_TOKEN_EXPIRE_DAYS: int = os.getenv('REFRESH_TOKEN_EXPIRE_DAYS', 30)
+
+    # Refresh token revocation
+    REVOCATION_FILTER_CAPACITY: int = os.getenv('REVOCATION_FILTER_CAPACITY', 1000000)
+    REVOCATION_FILTER_ERROR_RATE: float = os.getenv('REVOCATION_FILTER_ERROR_RATE', 0.001)
+    REVOCATION_SYNC_INTERVAL: int = os.getenv('REVOCATION_SYNC_INTERVAL', 5)  # seconds
+    REVOCATION_SYNC_BATCH: int = os.getenv('REVOCATION_SYNC_BATCH', 5000)
+    REVOCATION_REBUILD_INTERVAL: int = os.getenv('REVOCATION_REBUILD_INTERVAL', 3600)  # seconds, drops expired entries
+    REVOCATION_SYNC_OVERLAP: int = os.getenv('REVOCATION_SYNC_OVERLAP', 60)  # seconds of rows re-read per sync, covers slow commits and clock skew
     
     # Email Configuration
     EMAIL_TOKEN_EXPIRE_HOURS: int = os.getenv('EMAIL_TOKEN_EXPIRE_HOURS', 24)
+    EMAIL_SIGNED_TOKENS: bool = os.getenv('EMAIL_SIGNED_TOKENS', 'false').strip().lower() == 'true'  # Email signed single-use tokens instead of stored 6-digit codes
+    EMAIL_VERIFY_URL: Optional[str] = os.getenv('EMAIL_VERIFY_URL')  # e.g. https://app.example.com/verify?token={token}, the bare token is sent when unset
+    EMAIL_RESET_URL: Optional[str] = os.getenv('EMAIL_RESET_URL')  # e.g. https://app.example.com/reset?token={token}
+    EMAIL_TOKEN_USED_SET_SIZE: int = os.getenv('EMAIL_TOKEN_USED_SET_SIZE', 100000)
+    PASSWORD_RESET_TOKEN_EXPIRE_MINUTES: int = os.getenv('PASSWORD_RESET_TOKEN_EXPIRE_MINUTES', 15)
     EMAIL_SENDER: str = os.getenv('EMAIL_SENDER') 
     EMAIL_PASSWORD: str = os.getenv('EMAIL_PASSWORD')
     SMTP_SERVER: str = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
     SMTP_PORT: int = os.getenv('SMTP_PORT', 587) 
+    SMTP_USE_TLS: bool = os.getenv('EMAIL_USE_TLS', 'true').strip().lower() == 'true'
+    SMTP_TIMEOUT: int = os.getenv('SMTP_TIMEOUT', 30)
+    SMTP_WORKERS: int = os.getenv('SMTP_WORKERS', 2)  # Persistent SMTP connections
+    SMTP_MESSAGES_PER_SESSION: int = os.getenv('SMTP_MESSAGES_PER_SESSION', 100)
+    SMTP_IDLE_TIMEOUT: int = os.getenv('SMTP_IDLE_TIMEOUT', 60)  # seconds
+    SMTP_MAX_RETRIES: int = os.getenv('SMTP_MAX_RETRIES', 5)
+    SMTP_RETRY_BACKOFF: float = os.getenv('SMTP_RETRY_BACKOFF', 2)  # seconds, doubled per attempt
+    SMTP_SHUTDOWN_TIMEOUT: int = os.getenv('SMTP_SHUTDOWN_TIMEOUT', 30)  # seconds to flush on shutdown
+    EMAIL_TEMPLATES_AUTO_RELOAD: bool = os.getenv('EMAIL_TEMPLATES_AUTO_RELOAD', 'false').strip().lower() == 'true'  # Development only
+
+    # Transactional email outbox, used instead of the in-process queue when enabled
+    EMAIL_OUTBOX: bool = os.getenv('EMAIL_OUTBOX', 'false').strip().lower() == 'true'
+    EMAIL_OUTBOX_BATCH_SIZE: int = os.getenv('EMAIL_OUTBOX_BATCH_SIZE', 50)
+    EMAIL_OUTBOX_POLL_INTERVAL: float = os.getenv('EMAIL_OUTBOX_POLL_INTERVAL', 1)  # seconds
+    EMAIL_OUTBOX_LEASE: int = os.getenv('EMAIL_OUTBOX_LEASE', 300)  # seconds before a claimed row can be reclaimed
+    EMAIL_OUTBOX_MAX_ATTEMPTS: int = os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+
+    # Password hashing worker pool
+    PASSWORD_HASH_EXECUTOR: str = os.getenv('PASSWORD_HASH_EXECUTOR', 'thread')  # "thread" or "process"
+    PASSWORD_HASH_WORKERS: int = os.getenv('PASSWORD_HASH_WORKERS', 4)
+    PASSWORD_HASH_QUEUE_SIZE: int = os.getenv('PASSWORD_HASH_QUEUE_SIZE', 64)
+    PASSWORD_HASH_RETRY_AFTER: int = os.getenv('PASSWORD_HASH_RETRY_AFTER', 1)
+    PASSWORD_BCRYPT_ROUNDS: int = os.getenv('PASSWORD_BCRYPT_ROUNDS', 12)  # bcrypt cost, pick it with python -m auth.password_cost calibrate
+
+    # Authenticated principal cache
+    PRINCIPAL_CACHE_SIZE: int = os.getenv('PRINCIPAL_CACHE_SIZE', 10000)
+    PRINCIPAL_CACHE_TTL: int = os.getenv('PRINCIPAL_CACHE_TTL', 60)  # seconds
+    REQUEST_COALESCING: bool = os.getenv('REQUEST_COALESCING', 'true').strip().lower() == 'true'  # Concurrent lookups of one user or refresh token share a single call
+
+    # Verified token cache
+    TOKEN_CACHE_SIZE: int = os.getenv('TOKEN_CACHE_SIZE', 50000)
+    TOKEN_CACHE_TTL: int = os.getenv('TOKEN_CACHE_TTL', 3600)  # seconds, capped by each token's exp
+
+    # Rate limits for the expensive auth routes, as "requests/seconds" (empty disables)
+    RATE_LIMIT_ENABLED: bool = os.getenv('RATE_LIMIT_ENABLED', 'true').strip().lower() == 'true'
+    RATE_LIMIT_STORE: str = os.getenv('RATE_LIMIT_STORE', 'memory')  # "memory" (per worker) or "redis" (shared)
+    RATE_LIMIT_REDIS_URL: str = os.getenv('RATE_LIMIT_REDIS_URL', 'redis://localhost:6379/0')
+    RATE_LIMIT_TRUST_FORWARDED: bool = os.getenv('RATE_LIMIT_TRUST_FORWARDED', 'false').strip().lower() == 'true'  # Behind a trusted proxy only
+    RATE_LIMIT_EVICT_INTERVAL: float = os.getenv('RATE_LIMIT_EVICT_INTERVAL', 60)  # seconds
+    RATE_LIMIT_MAX_BODY: int = os.getenv('RATE_LIMIT_MAX_BODY', 16384)  # bytes read to find the account
+    RATE_LIMIT_LOGIN_IP: str = os.getenv('RATE_LIMIT_LOGIN_IP', '30/60')
+    RATE_LIMIT_LOGIN_ACCOUNT: str = os.getenv('RATE_LIMIT_LOGIN_ACCOUNT', '5/60')
+    RATE_LIMIT_REGISTER_IP: str = os.getenv('RATE_LIMIT_REGISTER_IP', '10/3600')
+    RATE_LIMIT_REGISTER_ACCOUNT: str = os.getenv('RATE_LIMIT_REGISTER_ACCOUNT', '3/3600')
+    RATE_LIMIT_FORGOT_IP: str = os.getenv('RATE_LIMIT_FORGOT_IP', '10/600')
+    RATE_LIMIT_FORGOT_ACCOUNT: str = os.getenv('RATE_LIMIT_FORGOT_ACCOUNT', '3/900')
+
+    # Load shedding: level 1 sheds low priority routes, level 2 everything but critical routes
+    LOAD_SHED_ENABLED: bool = os.getenv('LOAD_SHED_ENABLED', 'true').strip().lower() == 'true'
+    LOAD_SHED_INTERVAL: float = os.getenv('LOAD_SHED_INTERVAL', 0.5)  # seconds between samples
+    LOAD_SHED_LAG_LOW: float = os.getenv('LOAD_SHED_LAG_LOW', 0.05)  # event-loop lag in seconds
+    LOAD_SHED_LAG_HIGH: float = os.getenv('LOAD_SHED_LAG_HIGH', 0.25)
+    LOAD_SHED_POOL_WAIT_LOW: float = os.getenv('LOAD_SHED_POOL_WAIT_LOW', 0.1)  # average pool checkout wait in seconds
+    LOAD_SHED_POOL_WAIT_HIGH: float = os.getenv('LOAD_SHED_POOL_WAIT_HIGH', 1)
+    LOAD_SHED_RETRY_AFTER: int = os.getenv('LOAD_SHED_RETRY_AFTER', 2)
+    LOAD_SHED_CRITICAL_ROUTES: str = os.getenv('LOAD_SHED_CRITICAL_ROUTES', '/users/me,/auth/refresh,/internal,/.well-known')
+    LOAD_SHED_LOW_ROUTES: str = os.getenv('LOAD_SHED_LOW_ROUTES', '/auth/register,/auth/forgot-password,/guest')
+
+    # Sampling profiler for slow requests, served on /internal/profiles
+    PROFILE_ENABLED: bool = os.getenv('PROFILE_ENABLED', 'false').strip().lower() == 'true'
+    PROFILE_INTERVAL: float = os.getenv('PROFILE_INTERVAL', 0.01)  # seconds between stack samples
+    PROFILE_SAMPLE_RATE: float = os.getenv('PROFILE_SAMPLE_RATE', 1)  # fraction of requests tracked
+    PROFILE_SLOW_THRESHOLD: float = os.getenv('PROFILE_SLOW_THRESHOLD', 0.5)  # seconds, faster requests are dropped
+    PROFILE_MAX_CAPTURES: int = os.getenv('PROFILE_MAX_CAPTURES', 100)
+    PROFILE_MAX_DEPTH: int = os.getenv('PROFILE_MAX_DEPTH', 128)
+
+    # Admin user listing
+    ADMIN_PAGE_MAX_SIZE: int = os.getenv('ADMIN_PAGE_MAX_SIZE', 500)
+    ADMIN_STREAM_BATCH_SIZE: int = os.getenv('ADMIN_STREAM_BATCH_SIZE', 1000)  # rows fetched per server-side cursor batch
+
+    # Bulk user import (python -m users.bulk, POST /users/import)
+    BULK_IMPORT_BATCH_SIZE: int = os.getenv('BULK_IMPORT_BATCH_SIZE', 5000)  # rows checked, hashed and written per transaction
+    BULK_IMPORT_HASH_CONCURRENCY: int = os.getenv('BULK_IMPORT_HASH_CONCURRENCY', 4)  # hashing pool slots an import may hold, keep below PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_SIZE
+    BULK_IMPORT_REJECTS_RETURNED: int = os.getenv('BULK_IMPORT_REJECTS_RETURNED', 100)  # rejects listed in the POST /users/import response, the rest are counted only; the CLI writes them all
+
+    # Retention of never-verified accounts, expired codes and expired revocations (python -m users.retention)
+    RETENTION_ENABLED: bool = os.getenv('RETENTION_ENABLED', 'false').strip().lower() == 'true'  # In-process runner, enable it on one instance or schedule the CLI instead
+    RETENTION_INTERVAL: int = os.getenv('RETENTION_INTERVAL', 3600)  # seconds between runs
+    RETENTION_UNVERIFIED_DAYS: int = os.getenv('RETENTION_UNVERIFIED_DAYS', 30)  # never-verified /auth/register accounts created earlier are deleted, 0 keeps them
+    RETENTION_BATCH_SIZE: int = os.getenv('RETENTION_BATCH_SIZE', 500)  # rows per short transaction
+    RETENTION_BATCH_PAUSE: float = os.getenv('RETENTION_BATCH_PAUSE', 0.1)  # seconds between batches
+
+    # Startup
+    LAZY_STARTUP: bool = os.getenv('LAZY_STARTUP', 'false').strip().lower() == 'true'  # Compile email templates and start the SMTP workers on first use
+
+
+_settings: Optional[Settings] = None
+
 
-    
 def get_settings() -> Settings:
-    return Settings()
+    # One instance per process, the environment is parsed and validated once
+    global _settings
+    if _settings is None:
+        _settings = Settings()
+    return _settings
+
+
+def reload_settings() -> Settings:
+    """
+    Re-read .env and the environment into the shared instance, so every module
+    holding it sees the new values on its next read. Objects already built from
+    the old values (engines, pools, caches, the JWT signer) are not rebuilt, and
+    fields read from a differently named variable (POSTGRESQL_*, EMAIL_USE_TLS,
+    JWT_TOKEN_EXPIRE_MINUTES, ...) keep their import-time value.
+    """
+    for name, value in dotenv_values(env_path).items():
+        if name not in _process_env and value is not None:
+            os.environ[name] = value
+    settings = get_settings()
+    for name, value in Settings():
+        setattr(settings, name, value)
+    return settings
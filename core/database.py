@@ -1,26 +1,222 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from typing import Generator
+from sqlalchemy import create_engine, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Generator, Union
 from core.config import get_settings
+from core.replicas import ReplicaSet, RoutingSession
+from core.instrumentation import instrument_engine
+from core.metrics import registry
+from core.pool import TimedQueuePool, TimedAsyncQueuePool, watch_disconnects, get_pool_stats, warm_up_sync, warm_up_async
 
 # Get the settings instance
 settings = get_settings()
 
+# Session type accepted by the services, depending on DB_ASYNC
+DBSession = Union[Session, AsyncSession]
+
+# Async drivers used when DB_ASYNC is enabled
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def _async_database_url(url: str) -> str:
+    url = make_url(url)
+    backend = url.get_backend_name()
+    return url.set(drivername=ASYNC_DRIVERS.get(backend, url.drivername)).render_as_string(hide_password=False)
+
+
+def _engine_options(url: str, is_async: bool = False) -> dict:
+    url = make_url(url)
+    options = {}
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+        # In-memory SQLite stand-ins use their own pool class which doesn't take the sizing arguments
+        if url.database in (None, "", ":memory:"):
+            return options
+    options.update({
+        "poolclass": TimedAsyncQueuePool if is_async else TimedQueuePool,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+    })
+    return options
+
+
 # Create the SQLAlchemy engine using the database_url property
 engine = create_engine(
     settings.database_url,  # Access the property here
-    pool_pre_ping=True,
-    pool_recycle=300,
-    pool_size=5,
-    max_overflow=0
+    **_engine_options(settings.database_url)
 )
+watch_disconnects(engine)
+instrument_engine(engine)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Read replicas for the request sessions, reads go there and writes to the primary
+replica_urls = [url.strip() for url in (settings.DB_REPLICA_URLS or "").split(",") if url.strip()]
+replica_set = None
+
+
+def _replica_set(is_async: bool = False) -> ReplicaSet:
+    engines = [
+        create_async_engine(_async_database_url(url), **_engine_options(url, is_async=True)) if is_async
+        else create_engine(url, **_engine_options(url))
+        for url in replica_urls
+    ]
+    for replica in engines:
+        instrument_engine(replica)
+    return ReplicaSet(engines, retry_after=settings.DB_REPLICA_RETRY_AFTER)
+
+
+if replica_urls and not settings.DB_ASYNC:
+    replica_set = _replica_set()
+    SessionLocal = sessionmaker(
+        class_=RoutingSession, autocommit=False, autoflush=False, expire_on_commit=False,
+        info={"primary": engine, "replicas": replica_set},
+    )
+else:
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+# Async engine, only built when the async mode is switched on
+async_engine = None
+AsyncSessionLocal = None
+if settings.DB_ASYNC:
+    async_engine = create_async_engine(
+        _async_database_url(settings.database_url),
+        **_engine_options(settings.database_url, is_async=True)
+    )
+    watch_disconnects(async_engine.sync_engine)
+    instrument_engine(async_engine)
+    if replica_urls:
+        replica_set = _replica_set(is_async=True)
+        AsyncSessionLocal = async_sessionmaker(
+            sync_session_class=RoutingSession, autoflush=False, expire_on_commit=False,
+            info={"primary": async_engine.sync_engine, "replicas": replica_set},
+        )
+    else:
+        AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
 def get_db() -> Generator:
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncGenerator:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# Dependency used by the routes, switched by DB_ASYNC
+get_session = get_async_db if settings.DB_ASYNC else get_db
+
+
+# Session for code running outside of a route, e.g. middleware
+@asynccontextmanager
+async def open_session() -> AsyncGenerator:
+    if settings.DB_ASYNC:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+# Session on the primary for bulk writes and maintenance jobs, outside the replica routing of the request sessions
+@asynccontextmanager
+async def open_primary_session() -> AsyncGenerator:
+    if async_engine:
+        async with AsyncSession(async_engine, autoflush=False, expire_on_commit=False) as db:
+            yield db
+    else:
+        with Session(engine, autoflush=False, expire_on_commit=False) as db:
+            yield db
+
+
+# Pool serving the requests, depending on DB_ASYNC
+def get_request_pool():
+    return async_engine.sync_engine.pool if async_engine else engine.pool
+
+
+def pool_stats() -> dict:
+    stats = get_pool_stats(get_request_pool())
+    if replica_set:
+        stats["replicas"] = replica_set.stats()
+    return stats
+
+
+def _pool_gauges() -> dict:
+    stats = get_pool_stats(get_request_pool())
+    return {(name,): stats.get(name) for name in ("size", "checkedout", "checkedin", "overflow")}
+
+
+registry.gauge("db_pool_connections", "Request pool connections by state.", _pool_gauges, labels=("state",))
+registry.gauge(
+    "db_replica_healthy", "Whether each read replica is in rotation.",
+    lambda: {(replica["url"],): replica["healthy"] for replica in replica_set.stats()} if replica_set else {},
+    labels=("replica",),
+)
+
+
+async def warm_up_pool(connections: int = None):
+    """
+    Open connections before the app takes traffic, DB_POOL_WARMUP by default, capped at the pool size.
+    """
+    connections = settings.DB_POOL_WARMUP if connections is None else connections
+    if connections <= 0:
+        return
+    if async_engine:
+        await warm_up_async(async_engine, connections)
+    else:
+        warm_up_sync(engine, connections)
+
+
+# Helpers so services run unchanged on both Session and AsyncSession
+async def db_execute(db: DBSession, statement, params=None):
+    # A list of parameter dicts runs as executemany
+    if isinstance(db, AsyncSession):
+        return await db.execute(statement, params)
+    return db.execute(statement, params)
+
+
+async def db_commit(db: DBSession):
+    if isinstance(db, AsyncSession):
+        await db.commit()
+    else:
+        db.commit()
+
+
+async def db_rollback(db: DBSession):
+    if isinstance(db, AsyncSession):
+        await db.rollback()
+    else:
+        db.rollback()
+
+
+def insert_ignoring_conflicts(model):
+    """
+    INSERT ... ON CONFLICT DO NOTHING on the dialects that support it, so a unique
+    violation returns no row instead of an error. Other dialects get a plain INSERT
+    and callers still have to handle IntegrityError.
+    """
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        return pg_insert(model).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        return sqlite_insert(model).on_conflict_do_nothing()
+    return insert(model)
@@ -0,0 +1,97 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from fastapi import HTTPException
+from core.config import get_settings
+from core.instrumentation import add_phase
+from core.metrics import registry
+
+settings = get_settings()
+
+hash_duration = registry.histogram(
+    "password_hash_seconds", "bcrypt time per call, excluding the queue wait.", labels=("function",)
+)
+hash_queue_wait = registry.histogram("password_hash_queue_seconds", "Time hashing jobs waited for a worker.")
+hash_rejected = registry.counter("password_hash_rejected_total", "Hashing jobs rejected because the queue was full.")
+
+_executor: Executor = None
+_pending: int = 0
+
+
+def _create_executor() -> Executor:
+    """
+    Build the worker pool used for bcrypt work. bcrypt releases the GIL, so a
+    thread pool is usually enough; a process pool can be selected to isolate it.
+    """
+    workers = settings.PASSWORD_HASH_WORKERS
+    if settings.PASSWORD_HASH_EXECUTOR == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+
+
+def get_hash_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        _executor = _create_executor()
+    return _executor
+
+
+def shutdown_hash_executor(wait: bool = True):
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+
+
+def get_hash_pool_stats() -> dict:
+    return {
+        "executor": settings.PASSWORD_HASH_EXECUTOR,
+        "workers": settings.PASSWORD_HASH_WORKERS,
+        "max_pending": _max_pending(),
+        "pending": _pending,
+    }
+
+
+def _timed_call(func, *args):
+    # Runs on the worker, so the timing excludes the queue wait and works in a process pool too
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def _max_pending() -> int:
+    # Jobs running on a worker plus jobs waiting in the queue
+    return settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_SIZE
+
+
+async def run_in_hash_pool(func, *args):
+    """
+    Run a blocking hashing function on the worker pool without blocking the event loop.
+    Rejects with 503 once the in-flight plus queued job count reaches the configured cap.
+    """
+    global _pending
+    if _pending >= _max_pending():
+        hash_rejected.inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy. Please try again shortly.",
+            headers={"Retry-After": str(settings.PASSWORD_HASH_RETRY_AFTER)},
+        )
+
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        result, elapsed = await loop.run_in_executor(get_hash_executor(), partial(_timed_call, func, *args))
+        waited = max(0.0, time.perf_counter() - start - elapsed)
+        hash_duration.labels(func.__name__).observe(elapsed)
+        hash_queue_wait.observe(waited)
+        add_phase("hashing", elapsed)
+        add_phase("hash_queue", waited)
+        return result
+    finally:
+        _pending -= 1
+
+
+registry.gauge("password_hash_pending", "Hashing jobs running or queued.", lambda: _pending)
@@ -0,0 +1,119 @@
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from core.metrics import registry
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds", "Request latency by route.", labels=("method", "route", "status")
+)
+request_queries = registry.histogram(
+    "http_request_db_queries", "SQL statements executed per request.", labels=("route",),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+request_db_time = registry.histogram(
+    "http_request_db_seconds", "Time spent in SQL statements per request.", labels=("route",)
+)
+query_duration = registry.histogram(
+    "db_query_duration_seconds", "SQL statement latency by statement kind.", labels=("statement",)
+)
+
+QUERY_KINDS = {"select", "insert", "update", "delete", "with"}
+
+
+class RequestTimings:
+    """
+    Time spent per phase (db, pool_wait, jwt, hashing, ...) by the current request.
+    """
+    __slots__ = ("queries", "phases")
+
+    def __init__(self):
+        self.queries = 0
+        self.phases = {}
+
+
+_request_timings: ContextVar = ContextVar("request_timings", default=None)
+
+
+def current_timings():
+    return _request_timings.get()
+
+
+def add_phase(name: str, seconds: float):
+    """
+    Charge `seconds` of phase `name` to the request running in the current context, if any.
+    """
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.phases[name] = timings.phases.get(name, 0.0) + seconds
+
+
+def _statement_kind(statement: str) -> str:
+    words = statement.split(None, 1)
+    kind = words[0].lower() if words else ""
+    return kind if kind in QUERY_KINDS else "other"
+
+
+def instrument_engine(engine):
+    """
+    Time every statement run on the engine, and charge it to the current request.
+    """
+    sync_engine = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        query_duration.labels(_statement_kind(statement)).observe(elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.queries += 1
+            timings.phases["db"] = timings.phases.get("db", 0.0) + elapsed
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        # after_cursor_execute doesn't run for failed statements
+        if context.connection is not None:
+            starts = context.connection.info.get("query_start")
+            if starts:
+                starts.pop()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency plus SQL statement count and time per route.
+    Routes are labelled by their template so path parameters don't add series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        timings = RequestTimings()
+        token = _request_timings.set(timings)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_timings.reset(token)
+            route = scope.get("route")
+            # The router fills in the matched route, rejected or unknown paths share one label
+            path = route.path if route is not None else "unmatched"
+            request_duration.labels(scope["method"], path, str(status)).observe(elapsed)
+            request_queries.labels(path).observe(timings.queries)
+            request_db_time.labels(path).observe(timings.phases.get("db", 0.0))
@@ -0,0 +1,99 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from calendar import timegm
+from datetime import datetime
+from jose.exceptions import ExpiredSignatureError, JWTClaimsError, JWTError
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+def _claim_timestamp(value):
+    # Same conversion python-jose applies to datetime claims
+    if isinstance(value, datetime):
+        return timegm(value.utctimetuple())
+    return value
+
+
+def decode_header(header: bytes) -> dict:
+    """
+    The JSON object in an encoded JWT header, raises JWTError for anything else.
+    """
+    fields = json.loads(_b64decode(header))
+    if not isinstance(fields, dict):
+        raise JWTError("Invalid header")
+    return fields
+
+
+def encode_claims(payload: dict) -> bytes:
+    claims = dict(payload)
+    for claim in ("exp", "iat", "nbf"):
+        if claim in claims:
+            claims[claim] = _claim_timestamp(claims[claim])
+    return _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+
+
+def validate_claims(payload) -> dict:
+    """
+    The exp and nbf checks python-jose applies, raises JWTError.
+    """
+    if not isinstance(payload, dict):
+        raise JWTError("Invalid payload")
+
+    now = time.time()
+    if "exp" in payload:
+        if not isinstance(payload["exp"], (int, float)):
+            raise JWTClaimsError("Expiration Time claim (exp) must be an integer.")
+        if payload["exp"] <= now:
+            raise ExpiredSignatureError("Signature has expired.")
+    if "nbf" in payload and isinstance(payload["nbf"], (int, float)) and payload["nbf"] > now:
+        raise JWTClaimsError("The token is not yet valid (nbf)")
+    return payload
+
+
+class HS256Signer:
+    """
+    HS256 JWT signer/verifier that keeps the HMAC key object and encoded header
+    between calls instead of rebuilding them for every token. Tokens are
+    interchangeable with python-jose's HS256 tokens.
+    """
+
+    def __init__(self, secret: str):
+        self._mac = hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256)
+        header = json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":")).encode("utf-8")
+        self._header = _b64encode(header)
+
+    def _sign(self, signing_input: bytes) -> bytes:
+        mac = self._mac.copy()
+        mac.update(signing_input)
+        return mac.digest()
+
+    def encode(self, payload: dict) -> str:
+        body = encode_claims(payload)
+        signing_input = self._header + b"." + body
+        return (signing_input + b"." + _b64encode(self._sign(signing_input))).decode("ascii")
+
+    def decode(self, token: str) -> dict:
+        try:
+            signing_input, signature = token.encode("ascii").rsplit(b".", 1)
+            header, body = signing_input.split(b".", 1)
+            if header != self._header and decode_header(header).get("alg") != "HS256":
+                raise JWTError("The specified alg value is not allowed")
+            expected = self._sign(signing_input)
+            if not hmac.compare_digest(expected, _b64decode(signature)):
+                raise JWTError("Signature verification failed.")
+            payload = json.loads(_b64decode(body))
+        except JWTError:
+            raise
+        except (ValueError, TypeError, UnicodeError) as e:
+            raise JWTError(f"Invalid token: {e}")
+
+        return validate_claims(payload)
@@ -0,0 +1,249 @@
+"""
+Asymmetric JWT signing (EdDSA, ES256, RS256) with a key ring published as JWKS.
+
+    python -m core.jwt_keys generate --algorithm EdDSA
+    python -m core.jwt_keys list
+
+Every PEM file in JWT_KEYS_DIR is a key, its file name (without .pem) the kid.
+All of them verify tokens and are published at /.well-known/jwks.json; the
+JWT_SIGNING_KEY_ID key, or the newest kid when unset, signs new tokens. A file
+may hold just the public key of a retired key.
+
+Refresh tokens and the signed email tokens are signed with the same keys, so a
+verifier must check the `type` claim: only tokens with `"type": "access"` (and
+exp, iat) authenticate requests.
+
+Rotation, on every instance:
+
+1. `generate` the new key and pin JWT_SIGNING_KEY_ID to the current kid. After a
+   restart the new key is published but not used, wait JWT_JWKS_MAX_AGE so
+   every verifier has fetched it.
+2. Point JWT_SIGNING_KEY_ID at the new kid (or unset it) and restart.
+3. Once the longest lived tokens signed with the old key have expired
+   (REFRESH_TOKEN_EXPIRE_DAYS), delete its file.
+
+Like HS256Signer, the encoded header and the loaded key objects are kept per
+key, so signing and verifying only pay for the signature itself.
+"""
+import argparse
+import json
+import os
+import secrets
+from datetime import datetime
+from typing import Optional
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature, encode_dss_signature
+from jose.exceptions import JWTError
+from core.config import get_settings
+from core.jwt_hs256 import HS256Signer, _b64decode, _b64encode, decode_header, encode_claims, validate_claims
+
+settings = get_settings()
+
+ALGORITHMS = ("EdDSA", "ES256", "RS256")
+ES256_SIZE = 32  # Bytes per coordinate and per signature half on P-256
+RSA_KEY_SIZE = 2048
+
+
+def _uint(value: int, length: Optional[int] = None) -> str:
+    # Big-endian base64url, the JWK encoding of key parameters
+    length = length or (value.bit_length() + 7) // 8
+    return _b64encode(value.to_bytes(length, "big")).decode("ascii")
+
+
+def algorithm_for(key) -> str:
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return "EdDSA"
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)) and key.curve.name == "secp256r1":
+        return "ES256"
+    if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)) and key.key_size >= RSA_KEY_SIZE:
+        return "RS256"
+    raise ValueError(f"Unsupported key type {type(key).__name__}, use Ed25519, P-256 or RSA >= {RSA_KEY_SIZE} bits.")
+
+
+class SigningKey:
+    """
+    One key of the ring: its algorithm, public key, precompiled header and, while
+    it can sign, the private key.
+    """
+
+    def __init__(self, kid: str, key):
+        self.kid = kid
+        self.algorithm = algorithm_for(key)
+        self.private_key = key if hasattr(key, "public_key") else None
+        self.public_key = key.public_key() if self.private_key else key
+        header = json.dumps({"alg": self.algorithm, "kid": kid, "typ": "JWT"}, separators=(",", ":")).encode("utf-8")
+        self.header = _b64encode(header)
+
+    def sign(self, data: bytes) -> bytes:
+        if self.algorithm == "EdDSA":
+            return self.private_key.sign(data)
+        if self.algorithm == "ES256":
+            # JWS wants r || s, cryptography produces DER
+            r, s = decode_dss_signature(self.private_key.sign(data, ec.ECDSA(hashes.SHA256())))
+            return r.to_bytes(ES256_SIZE, "big") + s.to_bytes(ES256_SIZE, "big")
+        return self.private_key.sign(data, padding.PKCS1v15(), hashes.SHA256())
+
+    def verify(self, signature: bytes, data: bytes):
+        """
+        Raises InvalidSignature.
+        """
+        if self.algorithm == "EdDSA":
+            self.public_key.verify(signature, data)
+        elif self.algorithm == "ES256":
+            if len(signature) != 2 * ES256_SIZE:
+                raise InvalidSignature()
+            r, s = int.from_bytes(signature[:ES256_SIZE], "big"), int.from_bytes(signature[ES256_SIZE:], "big")
+            self.public_key.verify(encode_dss_signature(r, s), data, ec.ECDSA(hashes.SHA256()))
+        else:
+            self.public_key.verify(signature, data, padding.PKCS1v15(), hashes.SHA256())
+
+    def jwk(self) -> dict:
+        jwk = {"kid": self.kid, "alg": self.algorithm, "use": "sig"}
+        if self.algorithm == "EdDSA":
+            raw = self.public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+            jwk.update(kty="OKP", crv="Ed25519", x=_b64encode(raw).decode("ascii"))
+        elif self.algorithm == "ES256":
+            numbers = self.public_key.public_numbers()
+            jwk.update(kty="EC", crv="P-256", x=_uint(numbers.x, ES256_SIZE), y=_uint(numbers.y, ES256_SIZE))
+        else:
+            numbers = self.public_key.public_numbers()
+            jwk.update(kty="RSA", n=_uint(numbers.n), e=_uint(numbers.e))
+        return jwk
+
+
+class KeyRing:
+    """
+    Signs with one key and verifies with any key of the ring, picked by the kid
+    in the token header. `legacy` verifies HS256 tokens from before a switch to
+    asymmetric signing, until they expire.
+    """
+
+    def __init__(self, keys: list, signing_kid: str, legacy: Optional[HS256Signer] = None):
+        self.keys = {key.kid: key for key in keys}
+        self.signing_key = self.keys.get(signing_kid)
+        if self.signing_key is None or self.signing_key.private_key is None:
+            raise ValueError(f"No private key for JWT signing key id {signing_kid!r}.")
+        self.legacy = legacy
+        # Tokens carry the exact header bytes we produce, so most lookups skip parsing it
+        self._by_header = {key.header: key for key in keys}
+        self.jwks = json.dumps({"keys": [key.jwk() for key in keys]}, separators=(",", ":")).encode("utf-8")
+
+    @property
+    def algorithm(self) -> str:
+        return self.signing_key.algorithm
+
+    def encode(self, payload: dict) -> str:
+        key = self.signing_key
+        signing_input = key.header + b"." + encode_claims(payload)
+        return (signing_input + b"." + _b64encode(key.sign(signing_input))).decode("ascii")
+
+    def _key_for(self, header: bytes) -> Optional[SigningKey]:
+        key = self._by_header.get(header)
+        if key is not None:
+            return key
+        fields = decode_header(header)
+        key = self.keys.get(fields.get("kid"))
+        # The header's alg must be the key's, so a public key is never used as an HMAC secret
+        if key is None or fields.get("alg") != key.algorithm:
+            return None
+        return key
+
+    def decode(self, token: str) -> dict:
+        try:
+            signing_input, signature = token.encode("ascii").rsplit(b".", 1)
+            header, body = signing_input.split(b".", 1)
+            key = self._key_for(header)
+            if key is None:
+                if self.legacy:
+                    return self.legacy.decode(token)
+                raise JWTError("Unknown signing key")
+            key.verify(_b64decode(signature), signing_input)
+            payload = json.loads(_b64decode(body))
+        except JWTError:
+            raise
+        except InvalidSignature:
+            raise JWTError("Signature verification failed.")
+        except (ValueError, TypeError, UnicodeError, AttributeError) as e:
+            raise JWTError(f"Invalid token: {e}")
+        return validate_claims(payload)
+
+
+def _load_key(path: str):
+    with open(path, "rb") as file:
+        data = file.read()
+    if b"PRIVATE KEY" in data:
+        return serialization.load_pem_private_key(data, password=None)
+    return serialization.load_pem_public_key(data)
+
+
+def read_keys(directory: str) -> list:
+    """
+    Every <kid>.pem in `directory`, sorted by kid.
+    """
+    names = sorted(name for name in os.listdir(directory) if name.endswith(".pem")) if os.path.isdir(directory) else []
+    return [SigningKey(name[:-len(".pem")], _load_key(os.path.join(directory, name))) for name in names]
+
+
+def load_key_ring(legacy: Optional[HS256Signer] = None) -> KeyRing:
+    """
+    Key ring for JWT_ALGORITHM from JWT_KEYS_DIR, signing with JWT_SIGNING_KEY_ID or the newest kid.
+    """
+    keys = read_keys(settings.JWT_KEYS_DIR)
+    signing = [key for key in keys if key.private_key is not None]
+    if not signing:
+        raise ValueError(
+            f"JWT_ALGORITHM={settings.JWT_ALGORITHM} needs a private key in {settings.JWT_KEYS_DIR}, "
+            f"see python -m core.jwt_keys generate."
+        )
+    ring = KeyRing(keys, settings.JWT_SIGNING_KEY_ID or signing[-1].kid, legacy=legacy)
+    if ring.algorithm != settings.JWT_ALGORITHM:
+        raise ValueError(f"JWT signing key {ring.signing_key.kid} is {ring.algorithm}, JWT_ALGORITHM is {settings.JWT_ALGORITHM}.")
+    return ring
+
+
+def generate_key(algorithm: str):
+    if algorithm == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    if algorithm == "ES256":
+        return ec.generate_private_key(ec.SECP256R1())
+    return rsa.generate_private_key(public_exponent=65537, key_size=RSA_KEY_SIZE)
+
+
+def _generate(directory: str, algorithm: str) -> str:
+    # Date first, so the newest kid sorts last
+    kid = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{algorithm.lower()}-{secrets.token_hex(3)}"
+    pem = generate_key(algorithm).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{kid}.pem")
+    # Private key, readable by the owner only
+    with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb") as file:
+        file.write(pem)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the JWT signing keys in JWT_KEYS_DIR.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate_parser = commands.add_parser("generate", help="create a new private key")
+    generate_parser.add_argument("--algorithm", choices=ALGORITHMS, default=settings.JWT_ALGORITHM if settings.JWT_ALGORITHM in ALGORITHMS else "EdDSA")
+    commands.add_parser("list", help="list the keys and which one signs")
+    for command in commands.choices.values():
+        command.add_argument("--dir", default=settings.JWT_KEYS_DIR)
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        print(_generate(args.dir, args.algorithm))
+        return
+    keys = read_keys(args.dir)
+    signing = settings.JWT_SIGNING_KEY_ID or next((key.kid for key in reversed(keys) if key.private_key), None)
+    for key in keys:
+        role = "signing" if key.kid == signing else ("verify" if key.private_key else "verify (public only)")
+        print(f"{key.kid:<32} {key.algorithm:<6} {role}")
+
+
+if __name__ == "__main__":
+    main()
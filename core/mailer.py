@@ -0,0 +1,209 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+from core.config import get_settings
+from core.metrics import registry
+
+# smtplib and email.mime (~60ms of imports) load on the first email, workers that never send skip them
+if TYPE_CHECKING:
+    from email.mime.multipart import MIMEMultipart
+
+settings = get_settings()
+
+smtp_send_duration = registry.histogram("smtp_send_seconds", "SMTP time per message, including reconnects.")
+
+
+@dataclass
+class OutgoingEmail:
+    to_email: str
+    subject: str
+    body: str
+    is_html: bool = False
+    attempts: int = 0
+    raw: Optional[str] = None  # Already rendered MIME message, if any
+
+
+def build_mime(to_email: str, subject: str, body: str, is_html: bool = False) -> "MIMEMultipart":
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    msg = MIMEMultipart()
+    msg['From'] = settings.EMAIL_SENDER
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'html' if is_html else 'plain'))
+    return msg
+
+
+def build_message(email: OutgoingEmail) -> str:
+    if email.raw is not None:
+        return email.raw
+    return build_mime(email.to_email, email.subject, email.body, email.is_html).as_string()
+
+
+class SMTPSession:
+    """
+    Persistent SMTP connection that is reused for several messages and reopened
+    when the server drops it or SMTP_MESSAGES_PER_SESSION is reached.
+    """
+
+    def __init__(self):
+        self.server = None
+        self.sent_in_session = 0
+        self.last_used = 0.0
+
+    @property
+    def connected(self) -> bool:
+        return self.server is not None
+
+    def connect(self):
+        import smtplib
+
+        server = smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT)
+        if settings.SMTP_USE_TLS:
+            server.starttls()  # Enable security
+        if settings.EMAIL_PASSWORD:
+            server.login(settings.EMAIL_SENDER, settings.EMAIL_PASSWORD)
+        self.server = server
+        self.sent_in_session = 0
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except OSError:  # Includes SMTPException
+            self.server.close()
+        self.server = None
+
+    def send(self, email: OutgoingEmail):
+        start = time.perf_counter()
+        if self.server is None or self.sent_in_session >= settings.SMTP_MESSAGES_PER_SESSION:
+            self.close()
+            self.connect()
+        self.server.sendmail(settings.EMAIL_SENDER, email.to_email, build_message(email))
+        self.sent_in_session += 1
+        self.last_used = time.monotonic()
+        smtp_send_duration.observe(time.perf_counter() - start)
+
+
+class SMTPWorker(threading.Thread):
+    """
+    Drains the mail queue over one persistent SMTP session, closed after it has
+    been idle for SMTP_IDLE_TIMEOUT seconds.
+    """
+
+    def __init__(self, mail_queue: "MailQueue", name: str):
+        super().__init__(name=name, daemon=True)
+        self.mail_queue = mail_queue
+        self.session = SMTPSession()
+
+    def run(self):
+        import smtplib
+
+        while True:
+            try:
+                email = self.mail_queue.queue.get(timeout=1)
+            except queue.Empty:
+                if self.session.connected and time.monotonic() - self.session.last_used > settings.SMTP_IDLE_TIMEOUT:
+                    self.session.close()
+                if self.mail_queue.stopping.is_set():
+                    break
+                continue
+
+            if email is None:  # Shutdown sentinel
+                self.mail_queue.queue.task_done()
+                break
+
+            try:
+                self.session.send(email)
+                self.mail_queue.sent += 1
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused) as e:
+                # The server rejected this message, the connection is still usable
+                self.mail_queue.retry(email, e)
+            except OSError as e:
+                # Dropped or broken connection, reconnect on the next message
+                self.session.close()
+                self.mail_queue.retry(email, e)
+            finally:
+                self.mail_queue.queue.task_done()
+
+        self.session.close()
+
+
+class MailQueue:
+    """
+    In-process queue of outgoing emails drained by a small pool of SMTP workers.
+    """
+
+    def __init__(self, workers: int):
+        self.workers_count = workers
+        self.queue: queue.Queue = queue.Queue()
+        self.stopping = threading.Event()
+        self.workers = []
+        self.sent = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.workers:
+                return
+            self.stopping.clear()
+            self.workers = [SMTPWorker(self, name=f"smtp-worker-{i}") for i in range(self.workers_count)]
+            for worker in self.workers:
+                worker.start()
+
+    def enqueue(self, email: OutgoingEmail):
+        if not self.workers:
+            self.start()
+        self.queue.put_nowait(email)
+
+    def retry(self, email: OutgoingEmail, error: Exception):
+        email.attempts += 1
+        if email.attempts > settings.SMTP_MAX_RETRIES:
+            self.failed += 1
+            print(f"Failed to send email to {email.to_email}: {error}")
+            return
+
+        # Exponential backoff without holding up the worker
+        delay = settings.SMTP_RETRY_BACKOFF * (2 ** (email.attempts - 1))
+        timer = threading.Timer(delay, self.queue.put_nowait, args=(email,))
+        timer.daemon = True
+        timer.start()
+
+    def stop(self, timeout: float = None):
+        """
+        Flush queued emails and stop the workers.
+        """
+        with self._lock:
+            if not self.workers:
+                return
+            self.stopping.set()
+            for _ in self.workers:
+                self.queue.put(None)
+            deadline = time.monotonic() + (timeout if timeout is not None else settings.SMTP_SHUTDOWN_TIMEOUT)
+            for worker in self.workers:
+                worker.join(max(0.0, deadline - time.monotonic()))
+            self.workers = []
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(), "sent": self.sent, "failed": self.failed, "workers": len(self.workers)}
+
+
+mail_queue = MailQueue(workers=settings.SMTP_WORKERS)
+
+registry.gauge("smtp_queue_depth", "Emails waiting for an SMTP worker.", lambda: mail_queue.queue.qsize())
+registry.gauge(
+    "smtp_messages_total", "Emails delivered or given up on.",
+    lambda: {("sent",): mail_queue.sent, ("failed",): mail_queue.failed}, labels=("result",), kind="counter",
+)
+
+
+def send_email(to_email: str, subject: str, body: str, is_html: bool = False, raw: Optional[str] = None):
+    """
+    Queue an email for delivery. Returns immediately.
+    """
+    mail_queue.enqueue(OutgoingEmail(to_email=to_email, subject=subject, body=body, is_html=is_html, raw=raw))
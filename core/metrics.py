@@ -0,0 +1,136 @@
+from bisect import bisect_left
+from typing import Callable, Sequence
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram. Observations only bump list slots, so it is cheap
+    enough for hot paths and safe enough under the GIL without a lock.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+        return {"buckets": buckets, "sum": round(self.sum, 6), "count": self.count}
+
+
+class HistogramVec:
+    """
+    One Histogram per label value tuple, created on first use.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.children = {}
+
+    def labels(self, *values) -> Histogram:
+        child = self.children.get(values)
+        if child is None:
+            child = self.children.setdefault(values, Histogram(self.buckets))
+        return child
+
+
+class Counter:
+    """
+    Monotonic counter per label value tuple. Like Histogram it takes no lock, a
+    rare lost increment between threads is an accepted trade for the hot path.
+    """
+
+    def __init__(self):
+        self.values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if isinstance(value, bool):
+        return str(int(value))
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """
+    Metrics served on /metrics in the Prometheus text exposition format. Gauges
+    are read from callbacks at scrape time, so they cost nothing in between.
+    """
+
+    def __init__(self):
+        self.metrics = {}  # name -> (type, help, label names, metric or callback)
+
+    def register(self, name: str, kind: str, help: str, metric, labels: Sequence[str] = ()):
+        self.metrics[name] = (kind, help, tuple(labels), metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(name, "counter", help, Counter(), labels)
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        metric = HistogramVec(buckets) if labels else Histogram(buckets)
+        return self.register(name, "histogram", help, metric, labels)
+
+    def gauge(self, name: str, help: str, callback: Callable[[], dict], labels: Sequence[str] = (), kind: str = "gauge"):
+        """
+        `callback` returns {label value tuple: value}, or a plain number without
+        labels. Counters kept elsewhere are exported the same way with kind="counter".
+        """
+        return self.register(name, kind, help, callback, labels)
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help, label_names, metric) in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "histogram":
+                children = metric.children if isinstance(metric, HistogramVec) else {(): metric}
+                for values, histogram in list(children.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = 'le="%s"' % _number(bound)
+                        lines.append(f"{name}_bucket{_labels(label_names, values, le)} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(label_names, values)} {_number(histogram.sum)}")
+                    lines.append(f"{name}_count{_labels(label_names, values)} {histogram.count}")
+                continue
+
+            values = metric() if callable(metric) else metric.values
+            if not isinstance(values, dict):
+                values = {(): values}
+            for label_values, value in list(values.items()):
+                if value is None:
+                    continue
+                lines.append(f"{name}{_labels(label_names, label_values)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
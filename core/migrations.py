@@ -0,0 +1,199 @@
+"""
+Schema migrations for databases created before a table, column or index was added.
+
+    python -m core.migrations           # apply the pending migrations
+    python -m core.migrations --sql     # print their SQL instead, to review or run by hand
+    python -m core.migrations --list
+
+Run it before starting a new version, the code expects the tables, columns and
+indexes of the models. Applied migrations are recorded in schema_migrations so
+each runs once per database, and their statements skip what already exists, so
+SQL that was run by hand is recorded on the next run instead of failing. A
+database without a users table is new: it gets the whole schema from the
+models and every migration is recorded as applied.
+"""
+import argparse
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+from sqlalchemy import Column, DateTime, MetaData, String, Table, create_mock_engine, inspect, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateIndex, CreateTable
+from core.database import Base, engine
+from auth.models import EmailOutboxModel, RevokedTokenModel
+from users.models import UserModel
+
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("name", String(100), primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    name: str
+    statements: Callable[[Connection], list]  # SQL strings or DDL elements the database still needs, in order
+    transactional: bool = True  # False runs each statement on its own, as CREATE INDEX CONCURRENTLY requires
+
+
+def _create_table(model) -> Callable[[Connection], list]:
+    table = model.__table__
+
+    def statements(conn: Connection) -> list:
+        indexes = sorted(table.indexes, key=lambda index: index.name)
+        return [CreateTable(table, if_not_exists=True)] + [CreateIndex(index, if_not_exists=True) for index in indexes]
+
+    return statements
+
+
+USERS_INDEXES = {
+    "ix_users_created_at_id": "users (created_at, id)",
+    "ix_users_registered_at": "users (registered_at)",
+    "ix_users_verification_code_expiration": (
+        "users (verification_code_expiration, id) WHERE verification_code_expiration IS NOT NULL"
+    ),
+    "ix_users_reset_password_code_expiration": (
+        "users (reset_password_code_expiration, id) WHERE reset_password_code_expiration IS NOT NULL"
+    ),
+}
+POSTGRESQL_USERS_INDEXES = {"ix_users_email_pattern": "users (email text_pattern_ops)"}
+
+
+def _invalid_indexes(conn: Connection, names: list) -> set:
+    # Left behind by an interrupted CREATE INDEX CONCURRENTLY, IF NOT EXISTS would keep them
+    query = text(
+        "SELECT c.relname FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+        "WHERE NOT i.indisvalid AND c.relname = ANY(:names)"
+    )
+    return set(conn.execute(query, {"names": names}).scalars())
+
+
+def _users_indexes(conn: Connection) -> list:
+    if conn.dialect.name != "postgresql":
+        return [f"CREATE INDEX IF NOT EXISTS {name} ON {target}" for name, target in USERS_INDEXES.items()]
+
+    indexes = {**USERS_INDEXES, **POSTGRESQL_USERS_INDEXES}
+    invalid = _invalid_indexes(conn, list(indexes))
+    return [f"DROP INDEX CONCURRENTLY IF EXISTS {name}" for name in indexes if name in invalid] + [
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target}" for name, target in indexes.items()
+    ]
+
+
+def _users_signup_source(conn: Connection) -> list:
+    statements = []
+    if "signup_source" not in {column["name"] for column in inspect(conn).get_columns("users")}:
+        statements.append("ALTER TABLE users ADD COLUMN signup_source VARCHAR(20)")
+    # Sign-ups always stored a verification code and verifying cleared it, guests never had one
+    statements.append(
+        "UPDATE users SET signup_source = 'register' WHERE signup_source IS NULL AND verification_code IS NOT NULL"
+    )
+    return statements
+
+
+MIGRATIONS = (
+    # Verification and reset emails written with the user row (EMAIL_OUTBOX), see auth/outbox.py
+    Migration("0001_email_outbox", _create_table(EmailOutboxModel)),
+    # Rotated refresh tokens and password change cutoffs, loaded at startup, see core/revocation.py
+    Migration("0002_revoked_tokens", _create_table(RevokedTokenModel)),
+    # Admin listing and retention sweep indexes, see users/models.py. Built CONCURRENTLY on PostgreSQL so
+    # writes to users go on meanwhile; a build interrupted there leaves an INVALID index that the next run
+    # drops and builds again
+    Migration("0003_users_indexes", _users_indexes, transactional=False),
+    # Where an account came from, see users/retention.py. Accounts from before it was recorded that still
+    # hold a verification code are sign-ups that never verified, backfilled as 'register' so the retention
+    # job sweeps them. This runs before the new version, whose retention job clears expired codes; the
+    # rest (verified sign-ups, guests) stay NULL and are never swept
+    Migration("0004_users_signup_source", _users_signup_source),
+)
+
+
+def _sql(conn: Connection, statement) -> str:
+    if isinstance(statement, str):
+        return statement
+    return str(statement.compile(dialect=conn.dialect)).strip()
+
+
+def _applied(conn: Connection) -> set:
+    if not inspect(conn).has_table(schema_migrations.name):
+        return set()
+    return set(conn.execute(select(schema_migrations.c.name)).scalars())
+
+
+def _record(conn: Connection, names: list):
+    schema_migrations.create(conn, checkfirst=True)
+    now = datetime.utcnow()
+    conn.execute(insert(schema_migrations), [{"name": name, "applied_at": now} for name in names])
+
+
+def _schema_statements(bind: Engine) -> list:
+    # The DDL create_all would run, captured without a database
+    statements = []
+    mock = create_mock_engine(bind.url, lambda element, *args, **kwargs: statements.append(str(element.compile(dialect=mock.dialect)).strip()))
+    Base.metadata.create_all(mock, checkfirst=False)
+    return statements
+
+
+def _apply(bind: Engine, migration: Migration, dry_run: bool) -> list:
+    if migration.transactional:
+        context = bind.begin()
+    else:
+        context = bind.connect().execution_options(isolation_level="AUTOCOMMIT")
+    with context as conn:
+        statements = migration.statements(conn)
+        if not dry_run:
+            for statement in statements:
+                conn.execute(text(statement) if isinstance(statement, str) else statement)
+            _record(conn, [migration.name])
+        return [_sql(conn, statement) for statement in statements]
+
+
+def migrate(bind: Engine = engine, dry_run: bool = False) -> dict:
+    """
+    Apply the pending migrations in order. Returns {migration name: SQL statements},
+    with dry_run the statements that would run.
+    """
+    with bind.connect() as conn:
+        new_database = not inspect(conn).has_table(UserModel.__tablename__)
+        applied = _applied(conn)
+
+    if new_database:
+        statements = _schema_statements(bind)
+        if not dry_run:
+            with bind.begin() as conn:
+                Base.metadata.create_all(conn)
+                _record(conn, [migration.name for migration in MIGRATIONS])
+        return {"schema": statements}
+
+    return {
+        migration.name: _apply(bind, migration, dry_run)
+        for migration in MIGRATIONS if migration.name not in applied
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bring the database schema up to date with the models.")
+    parser.add_argument("--sql", action="store_true", help="print the SQL of the pending migrations without running it")
+    parser.add_argument("--list", action="store_true", help="list the migrations and whether they are applied")
+    args = parser.parse_args()
+
+    if args.list:
+        with engine.connect() as conn:
+            applied = _applied(conn)
+        for migration in MIGRATIONS:
+            print(f"{migration.name:<32} {'applied' if migration.name in applied else 'pending'}")
+        return
+
+    for name, statements in migrate(dry_run=args.sql).items():
+        if args.sql:
+            print(f"-- {name}")
+            for statement in statements:
+                print(f"{statement};")
+        else:
+            print(f"Applied {name}")
+    if not args.sql:
+        print("Schema is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import time
+from sqlalchemy import event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from core.instrumentation import add_phase
+from core.metrics import registry
+
+# Time spent waiting for a pool checkout, shared by the sync and async pools
+pool_wait = registry.histogram("db_pool_wait_seconds", "Time spent waiting for a pool checkout.")
+pool_counters = {"timeouts": 0, "disconnects": 0}
+registry.gauge(
+    "db_pool_events_total", "Pool checkout timeouts and disconnects.",
+    lambda: {(name,): value for name, value in pool_counters.items()}, labels=("event",), kind="counter",
+)
+
+
+def _timed_get(pool_cls, pool):
+    start = time.perf_counter()
+    try:
+        return super(pool_cls, pool)._do_get()
+    except PoolTimeoutError:
+        pool_counters["timeouts"] += 1
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        pool_wait.observe(elapsed)
+        add_phase("pool_wait", elapsed)
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited.
+    """
+
+    def _do_get(self):
+        return _timed_get(TimedQueuePool, self)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """
+    AsyncAdaptedQueuePool that records how long each checkout waited.
+    """
+
+    def _do_get(self):
+        return _timed_get(TimedAsyncQueuePool, self)
+
+
+def watch_disconnects(engine):
+    """
+    Count disconnect errors. Without pre-ping, SQLAlchemy invalidates the failed
+    connection and every connection checked out before it, so the pool heals on
+    the first error instead of pinging on every checkout.
+    """
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        if context.is_disconnect:
+            pool_counters["disconnects"] += 1
+
+
+def get_pool_stats(pool) -> dict:
+    stats = {"pool": type(pool).__name__}
+    for name in ("size", "checkedout", "checkedin", "overflow"):
+        method = getattr(pool, name, None)
+        if method:
+            stats[name] = method()
+    stats["max_overflow"] = getattr(pool, "_max_overflow", None)
+    stats["timeout"] = getattr(pool, "_timeout", None)
+    stats.update(pool_counters)
+    stats["wait_seconds"] = pool_wait.snapshot()
+    return stats
+
+
+def _warm_up_count(pool, connections: int) -> int:
+    # Connections beyond the pool size would be overflow, closed on return, or block until DB_POOL_TIMEOUT
+    size = getattr(pool, "size", None)
+    return min(connections, size()) if size else connections
+
+
+def warm_up_sync(engine, connections: int):
+    """
+    Open `connections` connections at once, at most the pool size, so the pool is full before traffic arrives.
+    """
+    opened = []
+    try:
+        for _ in range(_warm_up_count(engine.pool, connections)):
+            conn = engine.connect()
+            conn.execute(text("SELECT 1"))
+            opened.append(conn)
+    finally:
+        for conn in opened:
+            conn.close()
+
+
+async def warm_up_async(async_engine, connections: int):
+    opened = []
+    try:
+        for _ in range(_warm_up_count(async_engine.pool, connections)):
+            conn = await async_engine.connect()
+            await conn.execute(text("SELECT 1"))
+            opened.append(conn)
+    finally:
+        for conn in opened:
+            await conn.close()
@@ -0,0 +1,75 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+from core.cache import TTLCache
+from core.config import get_settings
+from core.metrics import registry
+from users.models import UserModel
+
+settings = get_settings()
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """
+    Immutable copy of the fields an authenticated request needs from UserModel.
+    Safe to share between requests, unlike a session-bound ORM instance.
+    """
+    id: int
+    username: str
+    email: str
+    is_active: bool
+    is_verified: bool
+    registered_at: Optional[datetime] = None
+    verified_at: Optional[datetime] = None
+
+    # Starlette BaseUser interface, so the snapshot can live in request.user
+    @property
+    def is_authenticated(self) -> bool:
+        return True
+
+    @property
+    def display_name(self) -> str:
+        return self.username
+
+    @property
+    def identity(self) -> str:
+        return str(self.id)
+
+    @classmethod
+    def from_model(cls, user: UserModel) -> "UserSnapshot":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            is_active=user.is_active,
+            is_verified=user.is_verified,
+            registered_at=user.registered_at,
+            verified_at=user.verified_at,
+        )
+
+
+# Authenticated principals keyed by user id
+principal_cache = TTLCache(maxsize=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL)
+registry.gauge(
+    "principal_cache_lookups_total", "Authenticated user cache lookups.",
+    lambda: {("hit",): principal_cache.hits, ("miss",): principal_cache.misses}, labels=("result",), kind="counter",
+)
+
+
+def get_cached_principal(user_id: int) -> Optional[UserSnapshot]:
+    return principal_cache.get(user_id)
+
+
+def cache_principal(user: UserModel) -> UserSnapshot:
+    snapshot = UserSnapshot.from_model(user)
+    principal_cache.set(snapshot.id, snapshot)
+    return snapshot
+
+
+def invalidate_principal(user_id: int):
+    """
+    Drop a cached principal after its user row changes. Other workers keep their
+    copy until PRINCIPAL_CACHE_TTL runs out.
+    """
+    principal_cache.pop(user_id)
@@ -0,0 +1,155 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from itertools import count
+from core.config import get_settings
+from core.instrumentation import current_timings
+
+settings = get_settings()
+
+
+class RequestProfile:
+    """
+    Stacks sampled while one request was running on the event loop. Samples
+    taken while the request was awaiting (DB, hashing pool, ...) are counted as
+    "[waiting]" so the flamegraph shows on- and off-CPU time side by side.
+    """
+
+    def __init__(self, method: str, path: str, frame):
+        self.method = method
+        self.path = path
+        self.frame = frame  # The middleware frame, present in every stack of this request
+        self.started_at = time.time()
+        self.stacks = Counter()
+        self.duration = 0.0
+        self.status = None
+        self.phases = {}
+        self.id = None
+
+    @property
+    def root(self) -> str:
+        return f"{self.method} {self.path}"
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_seconds": round(self.duration, 6),
+            "phases": {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            "samples": sum(self.stacks.values()),
+        }
+
+    def folded(self) -> list:
+        # Collapsed stack format ("root;frame;frame count") read by flamegraph.pl and speedscope
+        return [f"{self.root};{stack} {samples}" for stack, samples in self.stacks.items()]
+
+
+def _frame_name(frame) -> str:
+    # Function level, so samples from different lines of one function merge
+    code = frame.f_code
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the event loop thread every PROFILE_INTERVAL seconds and charges
+    each stack to the in-flight request whose middleware frame it contains.
+    Idle while no sampled request is in flight.
+    """
+
+    def __init__(self, interval: float, max_depth: int):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval = interval
+        self.max_depth = max_depth
+        self.loop_thread_id = None
+        self.active = {}  # id(middleware frame) -> RequestProfile
+        self.captures = deque(maxlen=settings.PROFILE_MAX_CAPTURES)
+        self.ids = count(1)
+        self.stopping = threading.Event()
+
+    def start(self):
+        self.loop_thread_id = threading.get_ident()
+        super().start()
+
+    def stop(self):
+        self.stopping.set()
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            if self.active:
+                self.sample()
+
+    def sample(self):
+        frame = sys._current_frames().get(self.loop_thread_id)
+        active = dict(self.active)
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            profile = active.pop(id(frame), None)
+            if profile is not None and profile.frame is frame:
+                profile.stacks[";".join(reversed(names)) or "[self]"] += 1
+                break
+            names.append(_frame_name(frame))
+            frame = frame.f_back
+        for profile in active.values():
+            profile.stacks["[waiting]"] += 1
+
+    def begin(self, profile: RequestProfile):
+        self.active[id(profile.frame)] = profile
+
+    def end(self, profile: RequestProfile):
+        self.active.pop(id(profile.frame), None)
+        profile.frame = None  # Don't keep the request's locals alive
+        if profile.duration >= settings.PROFILE_SLOW_THRESHOLD:
+            profile.id = next(self.ids)
+            self.captures.append(profile)
+
+    def find(self, profile_id: int = None, path: str = None) -> list:
+        return [
+            profile for profile in list(self.captures)
+            if (profile_id is None or profile.id == profile_id) and (path is None or profile.path == path)
+        ]
+
+
+sampler = StackSampler(settings.PROFILE_INTERVAL, settings.PROFILE_MAX_DEPTH) if settings.PROFILE_ENABLED else None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware keeping stack samples and the phase breakdown (jwt, db,
+    pool_wait, hashing, serialization) of requests slower than PROFILE_SLOW_THRESHOLD.
+    Runs inside MetricsMiddleware, which collects the phase timings.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or sampler is None or random.random() >= settings.PROFILE_SAMPLE_RATE:
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile(scope["method"], scope["path"], sys._getframe())
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+            await send(message)
+
+        sampler.begin(profile)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.duration = time.perf_counter() - start
+            route = scope.get("route")
+            if route is not None:
+                profile.path = route.path
+            timings = current_timings()
+            if timings is not None:
+                profile.phases = dict(timings.phases)
+            sampler.end(profile)
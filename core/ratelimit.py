@@ -0,0 +1,239 @@
+import json
+import time
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import parse_qs
+from starlette.responses import JSONResponse
+from core.config import get_settings
+from core.metrics import registry
+
+settings = get_settings()
+
+rate_limit_counters = {"allowed": 0, "rejected_ip": 0, "rejected_account": 0}
+registry.gauge(
+    "rate_limit_decisions_total", "Rate limited auth requests by outcome.",
+    lambda: {(name,): value for name, value in rate_limit_counters.items()}, labels=("outcome",), kind="counter",
+)
+
+
+@dataclass(frozen=True)
+class Limit:
+    """
+    Token bucket of `capacity` requests refilled evenly over `period` seconds.
+    """
+    capacity: int
+    period: float
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+    @classmethod
+    def parse(cls, value: str) -> Optional["Limit"]:
+        # "5/60" means 5 requests per 60 seconds, empty disables the limit
+        if not value:
+            return None
+        capacity, period = value.split("/")
+        return cls(int(capacity), float(period))
+
+
+class MemoryBucketStore:
+    """
+    Token buckets for one worker. Each key holds [tokens, last_refill], and
+    buckets that would be full again are evicted periodically.
+    """
+
+    def __init__(self, evict_interval: float):
+        self.buckets = {}
+        self.evict_interval = evict_interval
+        self._next_eviction = time.monotonic() + evict_interval
+
+    async def take(self, key: str, limit: Limit) -> float:
+        """
+        Take one token. Returns 0 when allowed, otherwise seconds until a token is available.
+        """
+        now = time.monotonic()
+        if now >= self._next_eviction:
+            self._evict(now)
+
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            self.buckets[key] = [limit.capacity - 1, now, limit.period]
+            return 0.0
+
+        tokens = min(limit.capacity, bucket[0] + (now - bucket[1]) * limit.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / limit.rate
+
+    def _evict(self, now: float):
+        # A bucket untouched for a whole period has refilled and carries no state
+        self.buckets = {key: bucket for key, bucket in self.buckets.items() if now - bucket[1] < bucket[2]}
+        self._next_eviction = now + self.evict_interval
+
+
+# Token bucket run atomically in Redis: KEYS[1] bucket, ARGV capacity, rate, now, ttl
+_REDIS_TOKEN_BUCKET = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return tostring(wait)
+"""
+
+
+class RedisBucketStore:
+    """
+    Token buckets shared by every worker through Redis. Needs the optional `redis` package.
+    """
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis  # Optional dependency, only needed for the shared store
+
+        self.client = redis.from_url(url)
+        self.script = self.client.register_script(_REDIS_TOKEN_BUCKET)
+
+    async def take(self, key: str, limit: Limit) -> float:
+        wait = await self.script(
+            keys=[f"ratelimit:{key}"],
+            args=[limit.capacity, limit.rate, time.time(), int(limit.period) + 1],
+        )
+        return float(wait)
+
+
+@dataclass(frozen=True)
+class RouteLimits:
+    ip: Optional[Limit]
+    account: Optional[Limit]
+    account_fields: tuple  # Body fields identifying the account
+
+
+def _route_limits() -> dict:
+    return {
+        ("POST", "/auth/login"): RouteLimits(
+            Limit.parse(settings.RATE_LIMIT_LOGIN_IP), Limit.parse(settings.RATE_LIMIT_LOGIN_ACCOUNT), ("username",)
+        ),
+        ("POST", "/auth/register"): RouteLimits(
+            Limit.parse(settings.RATE_LIMIT_REGISTER_IP), Limit.parse(settings.RATE_LIMIT_REGISTER_ACCOUNT), ("email", "username")
+        ),
+        ("POST", "/auth/forgot-password"): RouteLimits(
+            Limit.parse(settings.RATE_LIMIT_FORGOT_IP), Limit.parse(settings.RATE_LIMIT_FORGOT_ACCOUNT), ("email",)
+        ),
+    }
+
+
+def _create_store():
+    if settings.RATE_LIMIT_STORE == "redis":
+        return RedisBucketStore(settings.RATE_LIMIT_REDIS_URL)
+    return MemoryBucketStore(evict_interval=settings.RATE_LIMIT_EVICT_INTERVAL)
+
+
+rate_limit_store = _create_store()
+
+
+def get_rate_limit_stats() -> dict:
+    stats = {"store": settings.RATE_LIMIT_STORE, **rate_limit_counters}
+    if isinstance(rate_limit_store, MemoryBucketStore):
+        stats["buckets"] = len(rate_limit_store.buckets)
+    return stats
+
+
+def _account_ids(body: bytes, content_type: str, fields: tuple) -> list:
+    try:
+        if content_type.startswith("application/json"):
+            data = json.loads(body or b"{}")
+            values = [data.get(field) for field in fields] if isinstance(data, dict) else []
+        else:
+            form = parse_qs(body.decode("utf-8", "replace"))
+            values = [form.get(field, [None])[0] for field in fields]
+    except ValueError:
+        return []
+    return [str(value).strip().lower() for value in values if value]
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware throttling the expensive auth routes per client IP and per
+    account before any hashing or database work, with a cheap 429.
+    """
+
+    def __init__(self, app, store=None):
+        self.app = app
+        self.store = store or rate_limit_store
+        self.limits = _route_limits()
+
+    def _client_ip(self, scope) -> str:
+        if settings.RATE_LIMIT_TRUST_FORWARDED:
+            for name, value in scope.get("headers", []):
+                if name == b"x-forwarded-for":
+                    return value.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED:
+            return await self.app(scope, receive, send)
+
+        route = self.limits.get((scope["method"], scope["path"]))
+        if route is None:
+            return await self.app(scope, receive, send)
+
+        if route.ip:
+            wait = await self.store.take(f"ip:{scope['path']}:{self._client_ip(scope)}", route.ip)
+            if wait:
+                rate_limit_counters["rejected_ip"] += 1
+                return await self._reject(scope, receive, send, wait)
+
+        if route.account:
+            # Buffer the (small) body to read the account, then replay it to the app
+            body, more_body = b"", True
+            while more_body:
+                message = await receive()
+                body += message.get("body", b"")
+                more_body = message.get("more_body", False)
+                if len(body) > settings.RATE_LIMIT_MAX_BODY:
+                    break
+
+            content_type = dict(scope["headers"]).get(b"content-type", b"").decode("latin-1")
+            for account in _account_ids(body, content_type, route.account_fields):
+                wait = await self.store.take(f"account:{scope['path']}:{account}", route.account)
+                if wait:
+                    rate_limit_counters["rejected_account"] += 1
+                    return await self._reject(scope, receive, send, wait)
+
+            rate_limit_counters["allowed"] += 1
+            replayed = False
+
+            async def replay():
+                nonlocal replayed
+                if not replayed:
+                    replayed = True
+                    return {"type": "http.request", "body": body, "more_body": more_body}
+                return await receive()
+
+            return await self.app(scope, replay, send)
+
+        rate_limit_counters["allowed"] += 1
+        return await self.app(scope, receive, send)
+
+    async def _reject(self, scope, receive, send, wait: float):
+        response = JSONResponse(
+            {"detail": "Too many requests. Please try again later."},
+            status_code=429,
+            headers={"Retry-After": str(max(1, int(wait + 0.999)))},
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,124 @@
+import asyncio
+import itertools
+import time
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+
+class ReplicaSet:
+    """
+    Read replicas served round-robin. A replica that raises a connection error
+    is taken out of rotation until a later health check succeeds.
+    """
+
+    def __init__(self, engines: list, retry_after: float):
+        self.engines = engines
+        self.retry_after = retry_after
+        self._down_until = {id(engine): 0.0 for engine in engines}
+        self._cycle = itertools.cycle(range(len(engines)))
+        for engine in engines:
+            self._watch(engine)
+
+    def _sync_engine(self, engine):
+        return engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+
+    def _watch(self, engine):
+        @event.listens_for(self._sync_engine(engine), "handle_error")
+        def _handle_error(context):
+            if context.is_disconnect or context.connection is None:
+                self.mark_down(engine)
+
+    def mark_down(self, engine):
+        self._down_until[id(engine)] = time.monotonic() + self.retry_after
+
+    def mark_up(self, engine):
+        self._down_until[id(engine)] = 0.0
+
+    def is_healthy(self, engine) -> bool:
+        return self._down_until[id(engine)] <= time.monotonic()
+
+    def choose(self):
+        """
+        Next healthy replica as a sync engine, or None when all are down.
+        """
+        for _ in range(len(self.engines)):
+            engine = self.engines[next(self._cycle)]
+            if self.is_healthy(engine):
+                return self._sync_engine(engine)
+        return None
+
+    async def check(self):
+        """
+        Ping every replica and update its health.
+        """
+        for engine in self.engines:
+            try:
+                if isinstance(engine, AsyncEngine):
+                    async with engine.connect() as conn:
+                        await conn.execute(text("SELECT 1"))
+                else:
+                    await asyncio.to_thread(_ping, engine)
+                self.mark_up(engine)
+            except (DBAPIError, OSError):
+                self.mark_down(engine)
+
+    async def run_health_checks(self, interval: float):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                # Keep checking, a replica left marked down would never be marked up again
+                print(f"Replica health check failed: {e}")
+            await asyncio.sleep(interval)
+
+    def stats(self) -> list:
+        return [
+            {"url": self._sync_engine(engine).url.render_as_string(hide_password=True), "healthy": self.is_healthy(engine)}
+            for engine in self.engines
+        ]
+
+
+def _ping(engine):
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads to a replica and writes to the primary. Its reads
+    all go to the replica picked for the first one, so they never go back in
+    time between replicas that lag differently, and it holds one replica
+    connection at most. Once it has written (or locked rows), it stays on the
+    primary so it reads its own writes. The primary engine and ReplicaSet are
+    passed through Session.info.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        primary = self.info["primary"]
+        if self.info.get("use_primary") or self._flushing:
+            return primary
+
+        if isinstance(clause, UpdateBase) or getattr(clause, "_for_update_arg", None) is not None:
+            self.info["use_primary"] = True
+            return primary
+
+        replica = self.info.get("replica")
+        if replica is None:
+            replica = self.info["replica"] = self.info["replicas"].choose() or primary
+        return replica
+
+    def close(self):
+        self.info.pop("use_primary", None)
+        self.info.pop("replica", None)
+        super().close()
+
+
+def use_primary(db):
+    """
+    Pin a session to the primary, e.g. before a read that a write depends on.
+    """
+    session = getattr(db, "sync_session", db)
+    session.info["use_primary"] = True
@@ -0,0 +1,164 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_, select
+from sqlalchemy.exc import IntegrityError
+from core.bloom import BloomFilter
+from core.config import get_settings
+from core.database import DBSession, db_execute, open_session, insert_ignoring_conflicts
+from auth.models import RevokedTokenModel
+
+settings = get_settings()
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_timestamp(value: datetime) -> float:
+    return (value - EPOCH).total_seconds()
+
+
+class RevocationStore:
+    """
+    In-memory view of revoked_tokens so token checks don't hit the database.
+    Revoked refresh token ids go into a Bloom filter: a miss means "not revoked"
+    for sure, a hit is confirmed against the table. Per-user cutoffs (password
+    changes) are kept exactly. The store is synced from the table in batches.
+    """
+
+    def __init__(self, capacity: int = None):
+        self.capacity = capacity or settings.REVOCATION_FILTER_CAPACITY
+        self.filter = BloomFilter(self.capacity, settings.REVOCATION_FILTER_ERROR_RATE)
+        self.user_cutoffs = {}  # user id -> tokens issued before this timestamp are revoked
+        self.last_id = 0
+        self.last_sync = None  # created_at time the last sync or rebuild started at
+        self.last_rebuild = time.monotonic()
+
+    def add_jti(self, jti: str):
+        self.filter.add(jti)
+
+    def add_cutoff(self, user_id: int, revoked_before: float):
+        if revoked_before > self.user_cutoffs.get(user_id, 0):
+            self.user_cutoffs[user_id] = revoked_before
+
+    def might_be_revoked(self, jti: str) -> bool:
+        return self.filter.might_contain(jti)
+
+    def is_user_token_revoked(self, payload: dict) -> bool:
+        cutoff = self.user_cutoffs.get(payload.get('id'))
+        return cutoff is not None and payload.get('iat', 0) < cutoff
+
+    def _apply(self, row: RevokedTokenModel):
+        # Syncs overlap, so rows come by more than once: only new ids count towards the filter capacity
+        if row.jti and not self.filter.might_contain(row.jti):
+            self.filter.add(row.jti)
+        if row.revoked_before:
+            self.add_cutoff(row.user_id, to_timestamp(row.revoked_before))
+
+    async def _load(self, db: DBSession, condition) -> int:
+        """
+        Apply the rows matching `condition` in keyset batches, returns the highest id seen.
+        """
+        after_id = 0
+        while True:
+            statement = select(RevokedTokenModel).where(condition, RevokedTokenModel.id > after_id)
+            result = await db_execute(db, statement.order_by(RevokedTokenModel.id).limit(settings.REVOCATION_SYNC_BATCH))
+            rows = result.scalars().all()
+            for row in rows:
+                self._apply(row)
+            if rows:
+                after_id = rows[-1].id
+            if len(rows) < settings.REVOCATION_SYNC_BATCH:
+                return after_id
+
+    async def sync(self, db: DBSession):
+        """
+        Pick up rows written since the last sync, by this or any other worker.
+        Rebuilds from scratch when the filter is full or periodically, which also
+        drops expired entries.
+        """
+        if (
+            self.last_sync is None or self.filter.is_full
+            or time.monotonic() - self.last_rebuild > settings.REVOCATION_REBUILD_INTERVAL
+        ):
+            await self.rebuild(db)
+            return
+        # Ids are assigned at insert but become visible at commit, so a row with a lower id
+        # than the last one seen can still show up: re-scan the recent rows as well
+        started = datetime.utcnow()
+        since = self.last_sync - timedelta(seconds=settings.REVOCATION_SYNC_OVERLAP)
+        last_id = await self._load(db, or_(RevokedTokenModel.id > self.last_id, RevokedTokenModel.created_at >= since))
+        self.last_id = max(self.last_id, last_id)
+        self.last_sync = started
+
+    async def rebuild(self, db: DBSession):
+        started = datetime.utcnow()
+        unexpired = RevokedTokenModel.expires_at > started
+        tokens = (await db_execute(db, select(func.count()).where(unexpired, RevokedTokenModel.jti.is_not(None)))).scalar()
+        # Twice the revoked tokens alive now, so the filter isn't full again after a few syncs
+        fresh = RevocationStore(capacity=max(settings.REVOCATION_FILTER_CAPACITY, tokens * 2))
+        fresh.last_id = await fresh._load(db, unexpired)
+        if fresh.capacity > self.capacity:
+            print(f"Revocation filter grown to {fresh.capacity} entries")
+        self.capacity, self.filter, self.user_cutoffs = fresh.capacity, fresh.filter, fresh.user_cutoffs
+        self.last_id, self.last_sync = fresh.last_id, started
+        self.last_rebuild = time.monotonic()
+
+    async def load(self):
+        async with open_session() as db:
+            await self.rebuild(db)
+
+    async def run_sync(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with open_session() as db:
+                    await self.sync(db)
+            except Exception as e:
+                print(f"Revocation sync failed: {e}")
+
+
+revocation_store = RevocationStore()
+
+
+async def is_jti_revoked(db: DBSession, jti: str) -> bool:
+    # Filter misses are the common case and need no query
+    if not revocation_store.might_be_revoked(jti):
+        return False
+    result = await db_execute(db, select(RevokedTokenModel.id).where(RevokedTokenModel.jti == jti))
+    return result.first() is not None
+
+
+async def consume_refresh_token(db: DBSession, payload: dict) -> bool:
+    """
+    Mark a refresh token as used. Returns False if another request already used
+    or revoked it, so each refresh token can be rotated exactly once.
+    """
+    expires_at = datetime.utcfromtimestamp(payload['exp'])
+    statement = insert_ignoring_conflicts(RevokedTokenModel).values(
+        jti=payload['jti'],
+        user_id=payload['id'],
+        expires_at=expires_at,
+        created_at=datetime.utcnow(),
+    ).returning(RevokedTokenModel.id)
+    try:
+        result = await db_execute(db, statement)
+        consumed = result.first() is not None
+    except IntegrityError:
+        consumed = False
+
+    revocation_store.add_jti(payload['jti'])
+    return consumed
+
+
+def revoke_user_tokens(db: DBSession, user_id: int) -> float:
+    """
+    Revoke every token issued to the user so far. Adds the row to the caller's
+    transaction; call revocation_store.add_cutoff with the result after commit.
+    """
+    now = datetime.utcnow()
+    db.add(RevokedTokenModel(
+        user_id=user_id,
+        revoked_before=now,
+        expires_at=now + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return to_timestamp(now)
@@ -2,18 +2,65 @@ from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from starlette.authentication import AuthCredentials, UnauthenticatedUser
 from datetime import timedelta, datetime
-from jose import jwt, JWTError
+import hashlib
+import secrets
+import uuid
+import hmac
+import time
+from jose.exceptions import JWTError
 from core.config import get_settings
-from fastapi import Depends, HTTPException
-from sqlalchemy.orm import Session
-from core.database import get_db
+from fastapi import Depends, HTTPException, Request, Header
+from fastapi.security.utils import get_authorization_scheme_param
+from sqlalchemy import select
+from core.database import get_session, open_session, DBSession, db_execute
 from users.models import UserModel
+from core.hashing import run_in_hash_pool
+from core.principals import UserSnapshot, get_cached_principal, cache_principal
+from core.singleflight import SingleFlight
+from core.cache import TTLCache
+from core.jwt_hs256 import HS256Signer
+from core.revocation import revocation_store
+from core.metrics import registry
+from core.instrumentation import add_phase
 
 settings = get_settings()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes below PASSWORD_BCRYPT_ROUNDS report needs_update and are rehashed on the next login
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto",
+    bcrypt__default_rounds=settings.PASSWORD_BCRYPT_ROUNDS, bcrypt__min_rounds=settings.PASSWORD_BCRYPT_ROUNDS,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")  # Updated from /auth/token to /auth/login
 
+# Precompiled signer for the HS256 fast path, python-jose handles other algorithms
+hs256_signer = HS256Signer(settings.JWT_SECRET) if settings.JWT_ALGORITHM == "HS256" or settings.JWT_LEGACY_HS256 else None
+
+# EdDSA, ES256 and RS256 sign with the key ring, whose public keys other services verify with (JWKS)
+key_ring = None
+if settings.JWT_ALGORITHM in ("EdDSA", "ES256", "RS256"):
+    from core.jwt_keys import load_key_ring  # cryptography is only imported when it signs
+
+    key_ring = load_key_ring(legacy=hs256_signer if settings.JWT_LEGACY_HS256 else None)
+
+# jti of redeemed email tokens until their exp. A fast per-process check only: the redeeming UPDATE
+# is what makes them single use (verified flag, password fingerprint), so evictions and other workers are safe
+used_email_tokens = TTLCache(
+    maxsize=settings.EMAIL_TOKEN_USED_SET_SIZE, ttl=settings.EMAIL_TOKEN_EXPIRE_HOURS * 3600, clock=time.time
+)
+PASSWORD_FINGERPRINT_LENGTH = len("$2b$12$") + 22
+
+# Principal cache misses for the same user id share one query
+user_lookups = SingleFlight("user")
+
+# Verified token payloads keyed by token digest, entries drop out at the token's exp
+token_cache = TTLCache(maxsize=settings.TOKEN_CACHE_SIZE, ttl=settings.TOKEN_CACHE_TTL, clock=time.time)
+password_rehashes = registry.counter("password_rehash_total", "Password hashes upgraded to PASSWORD_BCRYPT_ROUNDS on login.")
+token_errors = registry.counter("auth_token_errors_total", "Tokens that failed verification.", labels=("error",))
+registry.gauge(
+    "token_cache_lookups_total", "Verified token cache lookups.",
+    lambda: {("hit",): token_cache.hits, ("miss",): token_cache.misses}, labels=("result",), kind="counter",
+)
+
 # Hash password
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
@@ -22,28 +69,86 @@ def get_password_hash(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
-# Create an access token with expiration
+# Verify password, with the new hash when the stored one is below the configured cost
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+# Hash password on the hashing worker pool
+async def hash_password_async(password: str) -> str:
+    return await run_in_hash_pool(get_password_hash, password)
+
+# Verify password on the hashing worker pool
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await run_in_hash_pool(verify_password, plain_password, hashed_password)
+
+# Verify and, if needed, rehash on the hashing worker pool in one job
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> tuple:
+    return await run_in_hash_pool(verify_and_update_password, plain_password, hashed_password)
+
+# Sign a JWT with the configured algorithm
+def encode_token(payload: dict) -> str:
+    if key_ring:
+        return key_ring.encode(payload)
+    if hs256_signer:
+        return hs256_signer.encode(payload)
+    from jose import jwt  # Loads the cryptography backends, only needed off the HS256 fast path
+
+    return jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
+
+# Verify a JWT and return its claims, raises JWTError
+def decode_token(token: str) -> dict:
+    if key_ring:
+        return key_ring.decode(token)
+    if hs256_signer:
+        return hs256_signer.decode(token)
+    from jose import jwt
+
+    return jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
+
+# Create an access token with expiration, typed so no other token of ours passes for one
 async def create_access_token(data: dict, expiry: timedelta) -> str:
     payload = data.copy()
     expire_in = datetime.utcnow() + expiry
-    payload.update({"exp": expire_in})
-    return jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
+    payload.update({"exp": expire_in, "iat": round(time.time(), 3), "type": "access"})
+    return encode_token(payload)
 
-# Create a refresh token without expiration
+# Create a refresh token with an id and expiration, rotated on every use
 async def create_refresh_token(data: dict) -> str:
-    return jwt.encode(data, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
+    payload = data.copy()
+    expire_in = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    payload.update({"exp": expire_in, "iat": round(time.time(), 3), "jti": uuid.uuid4().hex, "type": "refresh"})
+    return encode_token(payload)
 
 # Decode the JWT token and return the payload
 def get_token_payload(token: str) -> dict:
+    start = time.perf_counter()
     try:
-        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
-        return payload
+        return _get_token_payload(token)
+    finally:
+        add_phase("jwt", time.perf_counter() - start)
+
+def _get_token_payload(token: str) -> dict:
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    payload = token_cache.get(key)
+    if payload is not None:
+        return dict(payload)
+
+    try:
+        payload = decode_token(token)
     except JWTError as e:
         print(f"Token decoding failed: {str(e)}")
+        token_errors.inc(type(e).__name__)
         raise HTTPException(status_code=401, detail="Could not validate credentials")
 
-# Get the current authenticated user from the token
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> UserModel:
+    exp = payload.get("exp")
+    token_cache.set(key, payload, expires_at=exp if isinstance(exp, (int, float)) else None)
+    return dict(payload)
+
+def _is_timestamp(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+# Resolve the user behind a token, from the principal cache when possible
+async def get_token_principal(token: str, db: DBSession = None) -> UserSnapshot:
     payload = get_token_payload(token)
     if not payload or type(payload) is not dict:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
@@ -52,11 +157,49 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     if not user_id:
         raise HTTPException(status_code=401, detail="User ID not found in token")
 
-    user = db.query(UserModel).filter(UserModel.id == user_id).first()
+    # Only access tokens: refresh and email tokens work on their own endpoints only, and password changes revoke older tokens.
+    # exp and iat are required, a token without them would never expire or fall under a revocation cutoff.
+    if (
+        payload.get('type') != 'access' or not _is_timestamp(payload.get('exp')) or not _is_timestamp(payload.get('iat'))
+        or revocation_store.is_user_token_revoked(payload)
+    ):
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+    return await get_user_principal(user_id, db)
+
+
+# Snapshot of a user by id, from the principal cache when possible
+async def get_user_principal(user_id: int, db: DBSession = None) -> UserSnapshot:
+    principal = get_cached_principal(user_id)
+    if principal:
+        return principal
+
+    async def load():
+        if db is None:
+            async with open_session() as session:
+                return await _load_principal(user_id, session)
+        return await _load_principal(user_id, db)
+
+    # A burst of requests with the same token after a cache miss issues one query
+    return await user_lookups.do(user_id, load)
+
+
+async def _load_principal(user_id: int, db: DBSession) -> UserSnapshot:
+    result = await db_execute(db, select(UserModel).where(UserModel.id == user_id))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    return user
+
+    return cache_principal(user)
+
+# Get the current authenticated user from the token
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme), db: DBSession = Depends(get_session)) -> UserSnapshot:
+    # Reuse the principal already resolved by JWTAuth for this request
+    user = request.scope.get("user")
+    if isinstance(user, UserSnapshot):
+        return user
+
+    return await get_token_principal(token, db)
 
 # Authentication class for Starlette middleware integration
 class JWTAuth:
@@ -66,19 +209,52 @@ class JWTAuth:
         if 'authorization' not in conn.headers:
             return guest
         
-        token = conn.headers.get('authorization').split(' ')[1]  # Extract Bearer token
-        if not token:
+        scheme, token = get_authorization_scheme_param(conn.headers.get('authorization'))  # Extract Bearer token
+        if scheme.lower() != 'bearer' or not token:
             return guest
         
         try:
-            user = get_current_user(token=token)
+            user = await get_token_principal(token)
         except HTTPException:
             return guest
         
         return AuthCredentials(['authenticated']), user
 
-# Create a verification token for email verification
-def create_verification_token(data: dict) -> str:
-    expire_in = datetime.utcnow() + timedelta(hours=settings.EMAIL_TOKEN_EXPIRE_HOURS)
-    payload = {"email": data["email"], "exp": expire_in}
-    return jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
+# Signed single-use tokens for the verification and reset emails (EMAIL_SIGNED_TOKENS)
+def create_verification_token(user_id: int, email: str) -> str:
+    return _create_email_token("verify", user_id, timedelta(hours=settings.EMAIL_TOKEN_EXPIRE_HOURS), email=email)
+
+# Reset token bound to the current password hash, any password change invalidates it
+def create_password_reset_token(user_id: int, password_hash: str) -> str:
+    expiry = timedelta(minutes=settings.PASSWORD_RESET_TOKEN_EXPIRE_MINUTES)
+    return _create_email_token("reset", user_id, expiry, pwd=password_fingerprint(password_hash))
+
+def _create_email_token(token_type: str, user_id: int, expiry: timedelta, **claims) -> str:
+    payload = {"id": user_id, "type": token_type, "jti": secrets.token_urlsafe(8), "exp": datetime.utcnow() + expiry, **claims}
+    return encode_token(payload)
+
+# Scheme, cost and salt of a bcrypt hash. A new hash always has a new salt, and the salt isn't secret,
+# so the redeeming UPDATE can compare it with a plain substring instead of reading the hash first
+def password_fingerprint(password_hash: str) -> str:
+    return password_hash[:PASSWORD_FINGERPRINT_LENGTH]
+
+# Claims of a valid email token of the given type that this process hasn't seen redeemed
+def decode_email_token(token: str, token_type: str) -> dict:
+    try:
+        payload = decode_token(token)
+    except JWTError:
+        raise HTTPException(status_code=400, detail="Invalid or expired token")
+    if payload.get("type") != token_type or not payload.get("id") or not payload.get("jti"):
+        raise HTTPException(status_code=400, detail="Invalid or expired token")
+    if used_email_tokens.get(payload["jti"]):
+        raise HTTPException(status_code=400, detail="Token has already been used")
+    return payload
+
+# Remember a redeemed token until it expires
+def mark_email_token_used(payload: dict):
+    used_email_tokens.set(payload["jti"], True, expires_at=payload["exp"])
+
+# Guard for the internal endpoints, denied unless INTERNAL_API_TOKEN is configured
+def require_internal_token(x_internal_token: str = Header(None)):
+    if not settings.INTERNAL_API_TOKEN or not x_internal_token or not hmac.compare_digest(x_internal_token, settings.INTERNAL_API_TOKEN):
+        raise HTTPException(status_code=403, detail="Not allowed")
@@ -0,0 +1,120 @@
+import asyncio
+import time
+from starlette.responses import JSONResponse
+from core.config import get_settings
+from core.metrics import registry
+from core.pool import pool_wait
+
+settings = get_settings()
+
+# Route priorities, shed from the lowest up as pressure rises
+CRITICAL, NORMAL, LOW = "critical", "normal", "low"
+
+shed_counters = {
+    "admitted": {CRITICAL: 0, NORMAL: 0, LOW: 0},
+    "shed": {CRITICAL: 0, NORMAL: 0, LOW: 0},
+}
+
+
+def _prefixes(value: str) -> tuple:
+    return tuple(path.strip() for path in value.split(",") if path.strip())
+
+
+def _matches(path: str, prefixes: tuple) -> bool:
+    return any(path == prefix or path.startswith(prefix.rstrip("/") + "/") for prefix in prefixes)
+
+
+class LoadMonitor:
+    """
+    Samples event-loop lag and the average DB pool checkout wait once per
+    interval and turns them into a pressure level: 0 admits everything, 1 sheds
+    low priority routes, 2 sheds everything but critical routes.
+    """
+
+    def __init__(self):
+        self.loop_lag = 0.0
+        self.pool_wait = 0.0
+        self.level = 0
+        self._last_count = pool_wait.count
+        self._last_sum = pool_wait.sum
+
+    def _sample_pool_wait(self) -> float:
+        count, total = pool_wait.count, pool_wait.sum
+        checkouts = count - self._last_count
+        wait = (total - self._last_sum) / checkouts if checkouts else 0.0
+        self._last_count, self._last_sum = count, total
+        return wait
+
+    def update(self, loop_lag: float):
+        self.loop_lag = loop_lag
+        self.pool_wait = self._sample_pool_wait()
+        if loop_lag >= settings.LOAD_SHED_LAG_HIGH or self.pool_wait >= settings.LOAD_SHED_POOL_WAIT_HIGH:
+            self.level = 2
+        elif loop_lag >= settings.LOAD_SHED_LAG_LOW or self.pool_wait >= settings.LOAD_SHED_POOL_WAIT_LOW:
+            self.level = 1
+        else:
+            self.level = 0
+
+    async def run(self, interval: float):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            # A busy loop wakes us up late; the delay is what every request waits too
+            self.update(max(0.0, time.perf_counter() - start - interval))
+
+    def stats(self) -> dict:
+        return {
+            "level": self.level,
+            "loop_lag_seconds": round(self.loop_lag, 6),
+            "pool_wait_seconds": round(self.pool_wait, 6),
+            **shed_counters,
+        }
+
+
+load_monitor = LoadMonitor()
+
+registry.gauge(
+    "load_shed_decisions_total", "Requests admitted or shed by route priority.",
+    lambda: {(outcome, priority): count for outcome, counts in shed_counters.items() for priority, count in counts.items()},
+    labels=("outcome", "priority"), kind="counter",
+)
+registry.gauge("load_shed_level", "Current load shedding level.", lambda: load_monitor.level)
+registry.gauge("event_loop_lag_seconds", "Event-loop lag at the last sample.", lambda: load_monitor.loop_lag)
+
+
+class LoadSheddingMiddleware:
+    """
+    ASGI middleware rejecting requests with 503 + Retry-After while the service
+    is overloaded, lowest priority routes first, so critical routes keep running.
+    """
+
+    def __init__(self, app, monitor: LoadMonitor = None):
+        self.app = app
+        self.monitor = monitor or load_monitor
+        self.critical = _prefixes(settings.LOAD_SHED_CRITICAL_ROUTES)
+        self.low = _prefixes(settings.LOAD_SHED_LOW_ROUTES)
+
+    def priority(self, path: str) -> str:
+        if _matches(path, self.critical):
+            return CRITICAL
+        if _matches(path, self.low):
+            return LOW
+        return NORMAL
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.LOAD_SHED_ENABLED:
+            return await self.app(scope, receive, send)
+
+        priority = self.priority(scope["path"])
+        level = self.monitor.level
+        if (priority == LOW and level >= 1) or (priority == NORMAL and level >= 2):
+            shed_counters["shed"][priority] += 1
+            response = JSONResponse(
+                {"detail": "Server is busy. Please try again shortly."},
+                status_code=503,
+                headers={"Retry-After": str(settings.LOAD_SHED_RETRY_AFTER)},
+            )
+            return await response(scope, receive, send)
+
+        shed_counters["admitted"][priority] += 1
+        await self.app(scope, receive, send)
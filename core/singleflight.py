@@ -0,0 +1,65 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+from core.config import get_settings
+from core.metrics import registry
+
+settings = get_settings()
+
+coalesced_calls = registry.counter(
+    "singleflight_calls_total",
+    "Coalesced lookups by group, `shared` callers waited on a call already in flight (coalescing ratio = shared / total).",
+    labels=("group", "result"),
+)
+
+
+class SingleFlight:
+    """
+    Concurrent callers asking for the same key share one in-flight call instead
+    of each running their own. Only calls that overlap are shared, nothing is
+    kept once the call finishes. The first caller runs the call itself, on its
+    own DB session; if it is cancelled (client went away) the waiting callers
+    start over rather than failing with it.
+    """
+
+    def __init__(self, group: str):
+        self.group = group
+        self._inflight = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if not settings.REQUEST_COALESCING:
+            return await fn()
+
+        while True:
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            coalesced_calls.inc(self.group, "shared")
+            try:
+                # Shielded, so a waiter going away doesn't cancel the call for the others
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise  # This caller was cancelled
+                # The caller running it was cancelled: start over, maybe as the one running it
+
+        coalesced_calls.inc(self.group, "leader")
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as error:
+            future.set_exception(error)
+            future.exception()  # Retrieved, no "never retrieved" warning when nobody was waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def __len__(self) -> int:
+        return len(self._inflight)
@@ -0,0 +1,68 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from core.config import get_settings
+from core.metrics import registry
+from core.database import pool_stats
+from core.ratelimit import get_rate_limit_stats
+from core.shedding import load_monitor
+from core.security import require_internal_token
+from users.retention import retention_job
+
+settings = get_settings()
+
+internal_router = APIRouter(
+    prefix="/internal",
+    tags=["Internal"],
+    include_in_schema=False,
+    dependencies=[Depends(require_internal_token)],
+)
+
+# Prometheus scrape endpoint, served at the root path where scrapers expect it
+metrics_router = APIRouter(
+    tags=["Internal"],
+    include_in_schema=False,
+    dependencies=[Depends(require_internal_token)],
+)
+
+# Live connection pool statistics, used to size pools per worker
+@internal_router.get('/pool')
+async def get_pool_stats():
+    return pool_stats()
+
+# Rate limiter counters and tracked buckets
+@internal_router.get('/ratelimit')
+async def get_rate_limits():
+    return get_rate_limit_stats()
+
+# Load shedding pressure and admit/shed counters per route priority
+@internal_router.get('/load')
+async def get_load():
+    return load_monitor.stats()
+
+# Slow requests captured by the sampling profiler, with their phase breakdown
+@internal_router.get('/profiles')
+async def get_profiles(path: Optional[str] = None):
+    if not settings.PROFILE_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled.")
+    from core.profiling import sampler  # Imported only when profiling is on, like in main.py
+    return [profile.summary() for profile in sampler.find(path=path)]
+
+# Captured stacks in collapsed format, e.g. `flamegraph.pl profiles.txt > login.svg` or speedscope
+@internal_router.get('/profiles/flamegraph', response_class=PlainTextResponse)
+async def get_flamegraph(id: Optional[int] = None, path: Optional[str] = None):
+    if not settings.PROFILE_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled.")
+    from core.profiling import sampler
+    lines = [line for profile in sampler.find(profile_id=id, path=path) for line in profile.folded()]
+    return PlainTextResponse("\n".join(lines) + "\n" if lines else "")
+
+# Outcome of the last retention run, `python -m users.retention --dry-run` shows what is pending
+@internal_router.get('/retention')
+async def get_retention():
+    return retention_job.stats()
+
+# Metrics in the Prometheus text exposition format
+@metrics_router.get('/metrics', response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,16 +1,101 @@
+import asyncio
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse
-from users.routes import guest_router, user_router  # Import both routers
-from auth.route import router as auth_router
-from core.security import JWTAuth
-from starlette.middleware.authentication import AuthenticationMiddleware
+from core.config import get_settings
+from core.responses import FastJSONResponse
 
-app = FastAPI()
+settings = get_settings()
 
-# Include both guest and user routers
-app.include_router(guest_router)
-app.include_router(user_router)
-app.include_router(auth_router)
 
-# Add Middleware
-app.add_middleware(AuthenticationMiddleware, backend=JWTAuth())
+def create_app() -> FastAPI:
+    """
+    Build the app with its routers, middleware and lifecycle hooks. The routers
+    and subsystems are imported here, so importing main stays cheap and
+    `uvicorn --factory main:create_app` only pays for them in the worker.
+    """
+    from starlette.middleware.authentication import AuthenticationMiddleware
+    from users.routes import guest_router, user_router  # Import both routers
+    from auth.route import router as auth_router, well_known_router
+    from internal.routes import internal_router, metrics_router
+    from core.security import JWTAuth
+    from core.hashing import shutdown_hash_executor
+    from core.mailer import mail_queue
+    from core.database import warm_up_pool, replica_set
+    from core.revocation import revocation_store
+    from auth.email_templates import email_templates
+    from auth.outbox import outbox_dispatcher
+    from users.retention import retention_job
+    from core.ratelimit import RateLimitMiddleware
+    from core.shedding import LoadSheddingMiddleware, load_monitor
+    from core.instrumentation import MetricsMiddleware
+
+    app = FastAPI(default_response_class=FastJSONResponse)
+
+    # Include both guest and user routers
+    app.include_router(guest_router)
+    app.include_router(user_router)
+    app.include_router(auth_router)
+    app.include_router(well_known_router)
+    app.include_router(internal_router)
+    app.include_router(metrics_router)
+
+    # Add Middleware
+    app.add_middleware(AuthenticationMiddleware, backend=JWTAuth())
+    # Runs before authentication and rejects throttled requests before any other work
+    app.add_middleware(RateLimitMiddleware)
+    # Sheds low priority routes while the event loop or the DB pool is saturated
+    app.add_middleware(LoadSheddingMiddleware)
+    # Stack samples and phase breakdown of slow requests, inside MetricsMiddleware which times the phases
+    sampler = None
+    if settings.PROFILE_ENABLED:
+        from core.profiling import ProfilingMiddleware, sampler
+        app.add_middleware(ProfilingMiddleware)
+    # Wraps everything so shed and throttled requests are timed too
+    app.add_middleware(MetricsMiddleware)
+
+    # Open DB connections, start load monitoring and replica health checks, load token revocations, compile the email templates, start the SMTP delivery workers and the retention job
+    @app.on_event("startup")
+    async def startup_event():
+        await warm_up_pool()
+        if sampler:
+            sampler.start()
+        app.state.load_monitor = asyncio.create_task(load_monitor.run(settings.LOAD_SHED_INTERVAL))
+        if replica_set:
+            await replica_set.check()
+            app.state.replica_health = asyncio.create_task(replica_set.run_health_checks(settings.DB_REPLICA_HEALTH_INTERVAL))
+        await revocation_store.load()
+        app.state.revocation_sync = asyncio.create_task(revocation_store.run_sync(settings.REVOCATION_SYNC_INTERVAL))
+        # With LAZY_STARTUP the templates compile and the SMTP workers start with the first email
+        if not settings.LAZY_STARTUP:
+            email_templates.load()
+            mail_queue.start()
+        if outbox_dispatcher:
+            outbox_dispatcher.start()
+        if settings.RETENTION_ENABLED:
+            app.state.retention = asyncio.create_task(retention_job.run(settings.RETENTION_INTERVAL))
+
+    # Flush queued emails and release the worker pools on shutdown
+    @app.on_event("shutdown")
+    def shutdown_event():
+        app.state.load_monitor.cancel()
+        if sampler:
+            sampler.stop()
+        app.state.revocation_sync.cancel()
+        if replica_set:
+            app.state.replica_health.cancel()
+        if outbox_dispatcher:
+            outbox_dispatcher.stop()
+        if settings.RETENTION_ENABLED:
+            app.state.retention.cancel()
+        mail_queue.stop()
+        shutdown_hash_executor()
+
+    return app
+
+
+# `main:app` builds the app on first access (PEP 562), so `uvicorn main:app` and `from main import app` keep working
+def __getattr__(name: str):
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,66 @@
+"""
+The tests drive the app in-process like the benchmarks do. Importing the
+harness first points the settings at a throwaway SQLite database and the local
+SMTP sink (benchmarks/harness.py), so no test touches a configured database.
+"""
+import asyncio
+import itertools
+import re
+from contextlib import contextmanager
+import pytest
+from benchmarks import harness
+from sqlalchemy import event
+from core.database import engine, async_engine
+from core.instrumentation import current_timings
+
+PASSWORD = "Secret123!"
+
+_prefixes = itertools.count()
+_STATEMENT = re.compile(r"^\s*(?:(INSERT) INTO|(UPDATE)|(DELETE) FROM|(SELECT)\s.*?\sFROM)\s+\"?(\w+)", re.IGNORECASE | re.DOTALL)
+
+
+def run_app(scenario):
+    """
+    Run `await scenario(client)` with the app started, in a fresh event loop.
+    """
+    async def main():
+        async with harness.running_app(), harness.client() as client:
+            return await scenario(client)
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def users():
+    """
+    Seed `count` verified users with unique names, returns their usernames. Their password is PASSWORD.
+    """
+    return lambda count=1: harness.seed_users(count, PASSWORD, prefix=f"test{next(_prefixes)}u")
+
+
+def statement_shape(sql: str) -> str:
+    # "UPDATE users SET ..." -> "UPDATE users"
+    match = _STATEMENT.match(sql)
+    if not match:
+        return sql.split(None, 1)[0].upper()
+    kind = next(group for group in match.groups()[:4] if group)
+    return f"{kind.upper()} {match.group(5)}"
+
+
+@contextmanager
+def request_statements():
+    """
+    Collect the shapes of the SQL statements run by requests, skipping background tasks.
+    """
+    shapes = []
+    target = async_engine.sync_engine if async_engine else engine
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if current_timings() is not None:
+            shapes.append(statement_shape(statement))
+
+    event.listen(target, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield shapes
+    finally:
+        event.remove(target, "before_cursor_execute", before_cursor_execute)
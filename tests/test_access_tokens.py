@@ -0,0 +1,73 @@
+"""
+Which tokens authenticate a request, through GET /users/me.
+"""
+import time
+from datetime import datetime, timedelta
+import pytest
+from core import security
+from tests.conftest import PASSWORD, run_app
+
+
+def _me(username: str, claims: dict) -> int:
+    """
+    Status of /users/me with a token for `username` carrying `claims`.
+    """
+    async def scenario(client):
+        login = await client.post("/auth/login", data={"username": username, "password": PASSWORD})
+        assert login.status_code == 200, login.text
+        me = await client.get("/users/me", headers={"Authorization": f"Bearer {login.json()['access_token']}"})
+        assert me.status_code == 200, me.text
+        token = security.encode_token({"id": me.json()["id"], **claims})
+        return (await client.get("/users/me", headers={"Authorization": f"Bearer {token}"})).status_code
+
+    return run_app(scenario)
+
+
+def _exp() -> datetime:
+    return datetime.utcnow() + timedelta(minutes=5)
+
+
+def _iat() -> float:
+    return round(time.time(), 3)
+
+
+def test_access_token_is_accepted(users):
+    (username,) = users(1)
+    assert _me(username, {"type": "access", "exp": _exp(), "iat": _iat()}) == 200
+
+
+@pytest.mark.parametrize("claims", [
+    pytest.param({"type": "access", "iat": 1700000000}, id="no exp"),
+    pytest.param({"type": "access", "exp": "in five minutes"}, id="non-numeric exp"),
+    pytest.param({}, id="old refresh token"),  # Refresh tokens used to carry the user id only
+])
+def test_token_without_exp_is_rejected(users, claims):
+    (username,) = users(1)
+    assert _me(username, claims) == 401
+
+
+def test_token_without_iat_is_rejected(users):
+    # No revocation cutoff would ever apply to it
+    (username,) = users(1)
+    assert _me(username, {"type": "access", "exp": _exp()}) == 401
+
+
+@pytest.mark.parametrize("claims", [
+    pytest.param({}, id="untyped"),
+    pytest.param({"type": "refresh", "jti": "0" * 32}, id="refresh"),
+    pytest.param({"type": "verify", "jti": "abc", "email": "someone@example.com"}, id="verify email"),
+])
+def test_only_access_tokens_are_accepted(users, claims):
+    (username,) = users(1)
+    assert _me(username, {"exp": _exp(), "iat": _iat(), **claims}) == 401
+
+
+def test_refresh_token_is_not_an_access_token(users):
+    (username,) = users(1)
+
+    async def scenario(client):
+        login = await client.post("/auth/login", data={"username": username, "password": PASSWORD})
+        refresh_token = login.json()["refresh_token"]
+        return (await client.get("/users/me", headers={"Authorization": f"Bearer {refresh_token}"})).status_code
+
+    assert run_app(scenario) == 401
@@ -0,0 +1,113 @@
+"""
+Bulk import and export through POST /users/import and GET /users/export.
+"""
+from datetime import datetime
+import orjson
+import pytest
+from sqlalchemy import update
+from core import security
+from core.database import engine
+from core.security import get_password_hash
+from tests.conftest import PASSWORD, run_app
+from users import routes
+from users.models import UserModel
+
+INTERNAL_TOKEN = "test-internal-token"
+HEADERS = {"X-Internal-Token": INTERNAL_TOKEN}
+
+
+@pytest.fixture(autouse=True)
+def internal_token(monkeypatch):
+    monkeypatch.setattr(security.settings, "INTERNAL_API_TOKEN", INTERNAL_TOKEN)
+
+
+async def _import(client, filename: str, content: bytes) -> dict:
+    response = await client.post("/users/import", headers=HEADERS, files={"file": (filename, content)})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def _export(client, email_prefix: str, format: str) -> bytes:
+    response = await client.get("/users/export", headers=HEADERS, params={"email_prefix": email_prefix, "format": format})
+    assert response.status_code == 200, response.text
+    return response.content
+
+
+def _ndjson(records: list) -> bytes:
+    return b"".join(orjson.dumps(record) + b"\n" for record in records)
+
+
+@pytest.mark.parametrize("format", ["csv", "ndjson"])
+def test_export_imports_back_unchanged(users, format):
+    prefix = users(3)[0][:-1]
+    copy = f"{prefix}copy"
+    with engine.begin() as conn:
+        conn.execute(
+            update(UserModel).where(UserModel.username.startswith(prefix))
+            .values(registered_at=datetime(2024, 5, 1, 12, 30, 15, 250000), verified_at=datetime(2024, 5, 1, 12, 45))
+        )
+
+    async def scenario(client):
+        exported = await _export(client, prefix, format)
+        # The same accounts under other names, everything else as exported
+        renamed = exported.replace(prefix.encode(), copy.encode())
+        result = await _import(client, f"users.{format}", renamed)
+        assert result == {"imported": 3, "rejected": 0, "hashed": 0, "rejects": [], "rejects_truncated": False}
+        assert await _export(client, copy, format) == renamed
+
+        login = await client.post("/auth/login", data={"username": f"{copy}0", "password": PASSWORD})
+        assert login.status_code == 200, login.text
+
+    run_app(scenario)
+
+
+def test_rejects_carry_line_and_reason(users):
+    (taken,) = users(1)
+    prefix = f"{taken}new"
+    password_hash = get_password_hash(PASSWORD)
+    lines = _ndjson([
+        {"username": f"{prefix}0", "email": f"{prefix}0@example.com", "password": PASSWORD},
+        {"username": "", "email": f"{prefix}1@example.com", "password_hash": password_hash},
+        {"username": f"{prefix}2", "email": "not an email", "password_hash": password_hash},
+        {"username": f"{prefix}3", "email": f"{prefix}3@example.com", "password_hash": "$1$md5$crypt"},
+        {"username": f"{prefix}4", "email": f"{prefix}4@example.com"},
+        {"username": f"{prefix}0", "email": f"{prefix}5@example.com", "password": PASSWORD},
+        {"username": taken, "email": f"{prefix}6@example.com", "password_hash": password_hash},
+        {"username": f"{prefix}7", "email": f"{taken}@example.com", "password": PASSWORD},
+        {"username": f"{prefix}8", "email": f"{prefix}8@example.com", "password_hash": password_hash, "is_active": "maybe"},
+    ]) + b"{not json\n"
+
+    async def scenario(client):
+        return await _import(client, "users.ndjson", lines)
+
+    result = run_app(scenario)
+    assert (result["imported"], result["rejected"], result["hashed"]) == (1, 9, 1)
+    assert [(reject["line"], reject["error"]) for reject in result["rejects"]] == [
+        (2, "Invalid username."),
+        (3, "Invalid email."),
+        (4, "Unsupported password hash."),
+        (5, "Missing password or password_hash."),
+        (6, "Duplicate username or email in this batch."),
+        (9, "Invalid boolean 'maybe'."),
+        (10, "Malformed record."),
+        (7, "Username is already registered."),
+        (8, "Email is already registered."),
+    ]
+    # Plain passwords never come back
+    assert all("password" not in reject["record"] for reject in result["rejects"] if isinstance(reject["record"], dict))
+    assert result["rejects"][6]["record"] == "{not json"
+
+
+def test_returned_rejects_are_capped(users, monkeypatch):
+    monkeypatch.setattr(routes.settings, "BULK_IMPORT_REJECTS_RETURNED", 2)
+    prefix = users(1)[0]
+    # No password: every row is rejected
+    lines = _ndjson([{"username": f"{prefix}{n}", "email": f"{prefix}{n}@example.com"} for n in range(5)])
+
+    async def scenario(client):
+        return await _import(client, "users.ndjson", lines)
+
+    result = run_app(scenario)
+    assert (result["imported"], result["rejected"]) == (0, 5)
+    assert [reject["line"] for reject in result["rejects"]] == [1, 2]
+    assert result["rejects_truncated"] is True
@@ -0,0 +1,20 @@
+"""
+Runs the route smoke tests again in the other DB mode, in a fresh interpreter
+since the engines are built from the settings at import.
+"""
+import os
+import subprocess
+import sys
+from core.config import get_settings
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_routes_in_the_other_db_mode(tmp_path):
+    other = "false" if get_settings().DB_ASYNC else "true"
+    env = dict(os.environ, DB_ASYNC=other, DATABASE_URL=f"sqlite:///{tmp_path}/other.db")
+    result = subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", os.path.join(TESTS_DIR, "test_routes.py")],
+        cwd=os.path.dirname(TESTS_DIR), env=env, capture_output=True, text=True, timeout=600,
+    )
+    assert result.returncode == 0, f"DB_ASYNC={other}\n{result.stdout[-4000:]}"
@@ -0,0 +1,114 @@
+"""
+Verification and reset with signed single-use email tokens (EMAIL_SIGNED_TOKENS),
+the links read from the emails the SMTP sink received.
+"""
+import asyncio
+import re
+import pytest
+from benchmarks import harness
+from auth import services
+from core import security
+from tests.conftest import PASSWORD, run_app
+
+NEW_PASSWORD = "Changed123!"
+
+
+@pytest.fixture(autouse=True)
+def signed_tokens(monkeypatch):
+    monkeypatch.setattr(services.settings, "EMAIL_SIGNED_TOKENS", True)
+    monkeypatch.setattr(services.settings, "EMAIL_VERIFY_URL", "https://app.example.com/verify?token={token}")
+    monkeypatch.setattr(services.settings, "EMAIL_RESET_URL", "https://app.example.com/reset?token={token}")
+
+
+async def _pop_token(email: str) -> str:
+    text = await asyncio.to_thread(harness.sink.pop_message, email)
+    return re.search(r"\?token=([\w.-]+)", text).group(1)
+
+
+async def _login(client, username: str, password: str):
+    return await client.post("/auth/login", data={"username": username, "password": password})
+
+
+async def _reset(client, token: str):
+    return await client.post(
+        "/auth/reset-password", json={"token": token, "new_password": NEW_PASSWORD, "confirm_password": NEW_PASSWORD}
+    )
+
+
+def test_verification_token_is_single_use(users):
+    username = f"{users(1)[0]}signed"
+    email = f"{username}@example.com"
+
+    async def scenario(client):
+        response = await client.post("/auth/register", json={"username": username, "email": email, "password": PASSWORD})
+        assert response.status_code == 201, response.text
+        token = await _pop_token(email)
+
+        # Not an access token
+        me = await client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+        assert me.status_code == 401
+
+        response = await client.post("/auth/verify", json={"token": token})
+        assert response.status_code == 200, response.text
+        assert (await _login(client, username, PASSWORD)).status_code == 200
+
+        reused = await client.post("/auth/verify", json={"token": token})
+        assert reused.json() == {"detail": "Token has already been used"}
+        # Another worker hasn't seen it redeemed, the UPDATE no longer matches there
+        security.used_email_tokens.clear()
+        reused = await client.post("/auth/verify", json={"token": token})
+        assert reused.status_code == 400
+        assert reused.json() == {"detail": "Token is no longer valid"}
+
+    run_app(scenario)
+
+
+def test_reset_token_is_single_use(users):
+    (username,) = users(1)
+    email = f"{username}@example.com"
+
+    async def scenario(client):
+        response = await client.post("/auth/forgot-password", json={"email": email})
+        assert response.status_code == 200, response.text
+        token = await _pop_token(email)
+
+        assert (await client.get("/users/me", headers={"Authorization": f"Bearer {token}"})).status_code == 401
+        # A verification token doesn't fit here
+        assert (await client.post("/auth/verify", json={"token": token})).status_code == 400
+
+        response = await _reset(client, token)
+        assert response.status_code == 200, response.text
+        assert (await _login(client, username, PASSWORD)).status_code == 400
+        assert (await _login(client, username, NEW_PASSWORD)).status_code == 200
+
+        assert (await _reset(client, token)).status_code == 400
+        security.used_email_tokens.clear()
+        reused = await _reset(client, token)
+        assert reused.status_code == 400
+        assert reused.json() == {"detail": "Token is no longer valid"}
+
+    run_app(scenario)
+
+
+def test_password_change_invalidates_reset_token(users):
+    (username,) = users(1)
+    email = f"{username}@example.com"
+
+    async def scenario(client):
+        response = await client.post("/auth/forgot-password", json={"email": email})
+        assert response.status_code == 200, response.text
+        token = await _pop_token(email)
+
+        login = await _login(client, username, PASSWORD)
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+        changed = await client.put("/auth/change-password", headers=headers, json={
+            "current_password": PASSWORD, "new_password": "Another123!", "confirm_password": "Another123!",
+        })
+        assert changed.status_code == 200, changed.text
+
+        response = await _reset(client, token)
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Token is no longer valid"}
+        assert (await _login(client, username, "Another123!")).status_code == 200
+
+    run_app(scenario)
@@ -0,0 +1,55 @@
+"""
+The HS256 fast path (core/jwt_hs256.py) and the verified token cache in core/security.py.
+"""
+import hashlib
+import time
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+from jose.exceptions import JWTError
+from core import jwt_hs256, security
+from core.jwt_hs256 import HS256Signer, _b64encode
+
+SECRET = "test-secret"
+
+
+def test_tokens_interoperate_with_python_jose():
+    signer = HS256Signer(SECRET)
+    payload = {"id": 7, "exp": int(time.time()) + 60}
+    assert jwt.decode(signer.encode(payload), SECRET, algorithms=["HS256"]) == payload
+    assert signer.decode(jwt.encode(payload, SECRET, algorithm="HS256")) == payload
+
+
+@pytest.mark.parametrize("header, body", [
+    (b"[]", b'{"id": 1}'),  # Header not an object
+    (b'{"alg": "HS256"}', b"[1]"),  # Payload not an object
+    (b'{"alg": "none"}', b'{"id": 1}'),
+])
+def test_malformed_tokens_raise_jwt_error(header, body):
+    signer = HS256Signer(SECRET)
+    signing_input = _b64encode(header) + b"." + _b64encode(body)
+    token = (signing_input + b"." + _b64encode(signer._sign(signing_input))).decode("ascii")
+    with pytest.raises(JWTError):
+        signer.decode(token)
+
+
+def test_cached_payload_is_dropped_at_exp(monkeypatch):
+    # One fake clock for the cache and the exp check
+    now = [time.time()]
+    monkeypatch.setattr(security.token_cache, "_clock", lambda: now[0])
+    monkeypatch.setattr(jwt_hs256, "time", SimpleNamespace(time=lambda: now[0]))
+    exp = int(now[0]) + 30
+    token = security.encode_token({"id": 7, "exp": exp})
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+
+    assert security.get_token_payload(token)["id"] == 7
+    hits = security.token_cache.hits
+    assert security.get_token_payload(token)["id"] == 7
+    assert security.token_cache.hits == hits + 1
+
+    now[0] = exp
+    assert security.token_cache.get(key) is None
+    with pytest.raises(HTTPException) as error:
+        security.get_token_payload(token)
+    assert error.value.status_code == 401
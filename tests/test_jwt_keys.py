@@ -0,0 +1,133 @@
+"""
+Asymmetric signing with the key ring (core/jwt_keys.py): round-trips, key
+selection by kid, the legacy HS256 fallback and the published JWKS.
+"""
+import json
+import time
+import pytest
+from cryptography.hazmat.primitives import serialization
+from jose import jwt
+from jose.exceptions import JWTError
+from auth import route
+from core import jwt_keys, security
+from core.jwt_hs256 import HS256Signer, _b64encode
+from core.jwt_keys import KeyRing, SigningKey, generate_key, load_key_ring
+from tests.conftest import PASSWORD, run_app
+
+PAYLOAD = {"id": 7, "type": "access", "exp": int(time.time()) + 60, "iat": int(time.time())}
+
+
+def _token(key: SigningKey, header: dict, payload: dict = PAYLOAD) -> str:
+    signing_input = _b64encode(json.dumps(header).encode()) + b"." + _b64encode(json.dumps(payload).encode())
+    return (signing_input + b"." + _b64encode(key.sign(signing_input))).decode("ascii")
+
+
+@pytest.mark.parametrize("algorithm", jwt_keys.ALGORITHMS)
+def test_round_trip(algorithm):
+    ring = KeyRing([SigningKey("k1", generate_key(algorithm))], "k1")
+    token = ring.encode(PAYLOAD)
+    assert jwt.get_unverified_header(token) == {"alg": algorithm, "kid": "k1", "typ": "JWT"}
+    assert ring.decode(token) == PAYLOAD
+
+    header, _, signature = token.split(".")
+    forged = _b64encode(json.dumps({**PAYLOAD, "id": 8}).encode()).decode("ascii")
+    with pytest.raises(JWTError):
+        ring.decode(f"{header}.{forged}.{signature}")
+
+
+@pytest.mark.parametrize("algorithm", ["ES256", "RS256"])
+def test_published_keys_verify_with_python_jose(algorithm):
+    ring = KeyRing([SigningKey("k1", generate_key(algorithm))], "k1")
+    (jwk,) = json.loads(ring.jwks)["keys"]
+    assert (jwk["kid"], jwk["alg"], jwk["use"]) == ("k1", algorithm, "sig")
+    assert jwt.decode(ring.encode(PAYLOAD), jwk, algorithms=[algorithm]) == PAYLOAD
+
+
+def test_jwks_lists_every_key_without_private_parts():
+    keys = [SigningKey(f"k-{algorithm}", generate_key(algorithm)) for algorithm in jwt_keys.ALGORITHMS]
+    jwks = json.loads(KeyRing(keys, "k-EdDSA").jwks)["keys"]
+    assert [(jwk["kid"], jwk["kty"]) for jwk in jwks] == [("k-EdDSA", "OKP"), ("k-ES256", "EC"), ("k-RS256", "RSA")]
+    assert not {"d", "p", "q"} & {field for jwk in jwks for field in jwk}
+
+
+def test_signing_kid_picks_the_key():
+    old, new = SigningKey("old", generate_key("ES256")), SigningKey("new", generate_key("EdDSA"))
+    token = KeyRing([old, new], "old").encode(PAYLOAD)
+    assert jwt.get_unverified_header(token)["kid"] == "old"
+
+    # After the rotation the old key's public half still verifies its tokens
+    rotated = KeyRing([SigningKey("old", old.public_key), new], "new")
+    assert rotated.decode(token) == PAYLOAD
+    assert jwt.get_unverified_header(rotated.encode(PAYLOAD))["kid"] == "new"
+
+    with pytest.raises(ValueError):
+        KeyRing([SigningKey("old", old.public_key), new], "old")
+
+
+def test_key_is_looked_up_by_header_kid():
+    key = SigningKey("k1", generate_key("ES256"))
+    ring = KeyRing([key], "k1")
+    # Same key, header bytes other than the ones the ring produces
+    assert ring.decode(_token(key, {"kid": "k1", "alg": "ES256"})) == PAYLOAD
+
+    for header in ({"kid": "k2", "alg": "ES256"}, {"kid": "k1", "alg": "HS256"}, {"alg": "ES256"}):
+        with pytest.raises(JWTError):
+            ring.decode(_token(key, header))
+
+
+def test_legacy_hs256_tokens_until_they_expire():
+    legacy = HS256Signer("test-secret")
+    key = SigningKey("k1", generate_key("EdDSA"))
+    token = legacy.encode(PAYLOAD)
+
+    assert KeyRing([key], "k1", legacy=legacy).decode(token) == PAYLOAD
+    with pytest.raises(JWTError):
+        KeyRing([key], "k1").decode(token)
+    with pytest.raises(JWTError):
+        KeyRing([key], "k1", legacy=HS256Signer("other-secret")).decode(token)
+    with pytest.raises(JWTError):
+        KeyRing([key], "k1", legacy=legacy).decode(legacy.encode({**PAYLOAD, "exp": int(time.time()) - 1}))
+
+
+def test_newest_kid_signs_unless_pinned(tmp_path, monkeypatch):
+    for kid, algorithm in (("2024-a", "ES256"), ("2025-b", "ES256")):
+        pem = generate_key(algorithm).private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        )
+        (tmp_path / f"{kid}.pem").write_bytes(pem)
+    monkeypatch.setattr(jwt_keys.settings, "JWT_KEYS_DIR", str(tmp_path))
+    monkeypatch.setattr(jwt_keys.settings, "JWT_ALGORITHM", "ES256")
+
+    monkeypatch.setattr(jwt_keys.settings, "JWT_SIGNING_KEY_ID", "")
+    assert load_key_ring().signing_key.kid == "2025-b"
+    monkeypatch.setattr(jwt_keys.settings, "JWT_SIGNING_KEY_ID", "2024-a")
+    assert load_key_ring().signing_key.kid == "2024-a"
+
+    monkeypatch.setattr(jwt_keys.settings, "JWT_ALGORITHM", "RS256")
+    with pytest.raises(ValueError):
+        load_key_ring()
+
+
+def test_app_signs_with_the_key_ring(users, monkeypatch):
+    (username,) = users(1)
+    legacy_token = security.encode_token(PAYLOAD)  # HS256, from before the switch
+    ring = KeyRing([SigningKey("k1", generate_key("ES256"))], "k1", legacy=HS256Signer(security.settings.JWT_SECRET))
+    monkeypatch.setattr(security, "key_ring", ring)
+    monkeypatch.setattr(route, "key_ring", ring)
+
+    async def scenario(client):
+        jwks = await client.get("/.well-known/jwks.json")
+        assert jwks.status_code == 200
+        login = await client.post("/auth/login", data={"username": username, "password": PASSWORD})
+        access_token = login.json()["access_token"]
+        me = await client.get("/users/me", headers={"Authorization": f"Bearer {access_token}"})
+        assert me.status_code == 200, me.text
+
+        (jwk,) = jwks.json()["keys"]
+        claims = jwt.decode(access_token, jwk, algorithms=["ES256"])
+        assert (claims["id"], claims["type"]) == (me.json()["id"], "access")
+        # A refresh token verifies with the same key, its type tells it apart
+        assert jwt.decode(login.json()["refresh_token"], jwk, algorithms=["ES256"])["type"] == "refresh"
+        return ring.decode(legacy_token)
+
+    assert run_app(scenario) == PAYLOAD
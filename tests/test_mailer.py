@@ -0,0 +1,93 @@
+"""
+SMTP delivery through the mail workers, against the local sink in benchmarks/harness.py.
+"""
+import time
+import pytest
+from benchmarks import harness
+from core import mailer
+from core.mailer import MailQueue, OutgoingEmail
+
+
+@pytest.fixture
+def sink():
+    harness.sink.faults.clear()
+    return harness.sink
+
+
+@pytest.fixture
+def mail_queue(monkeypatch):
+    monkeypatch.setattr(mailer.settings, "SMTP_RETRY_BACKOFF", 0.1)
+    monkeypatch.setattr(mailer.settings, "SMTP_MAX_RETRIES", 3)
+    queue = MailQueue(workers=1)
+    yield queue
+    queue.stop(timeout=5)
+
+
+def _wait_for(condition, timeout: float = 10) -> bool:
+    # The sink counts a message before the worker sees the reply, so poll the queue counters
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def _send(queue: MailQueue, count: int, prefix: str):
+    for i in range(count):
+        queue.enqueue(OutgoingEmail(to_email=f"{prefix}{i}@example.com", subject="Test", body=f"Message {i}"))
+
+
+def test_messages_share_one_session(sink, mail_queue):
+    received, connections = sink.received, sink.connections
+    _send(mail_queue, 5, "batch")
+    assert _wait_for(lambda: mail_queue.sent == 5)
+    assert sink.received - received == 5
+    assert sink.connections - connections == 1
+
+
+def test_session_is_reopened_after_messages_per_session(sink, mail_queue, monkeypatch):
+    monkeypatch.setattr(mailer.settings, "SMTP_MESSAGES_PER_SESSION", 2)
+    received, connections = sink.received, sink.connections
+    _send(mail_queue, 5, "session")
+    assert sink.wait_received(received + 5)
+    assert sink.connections - connections == 3
+
+
+def test_reconnects_after_the_server_hangs_up(sink, mail_queue):
+    received, connections = sink.received, sink.connections
+    _send(mail_queue, 1, "before-drop")
+    assert sink.wait_received(received + 1)
+
+    sink.faults.append("drop")
+    _send(mail_queue, 2, "after-drop")
+    assert _wait_for(lambda: mail_queue.sent == 3)
+    assert sink.received - received == 3 and mail_queue.failed == 0
+    assert sink.connections - connections == 2
+
+
+def test_rejected_message_is_retried_with_backoff(sink, mail_queue):
+    received = sink.received
+    sink.faults.extend(["reject", "reject"])
+    start = time.monotonic()
+    _send(mail_queue, 1, "retry")
+    assert _wait_for(lambda: mail_queue.sent == 1)
+    # Two retries, after 0.1s and then 0.2s
+    assert time.monotonic() - start >= 0.3
+    assert sink.received - received == 1 and mail_queue.failed == 0
+
+
+def test_gives_up_after_max_retries(sink, mail_queue):
+    sink.faults.extend(["reject"] * 4)  # The first attempt and SMTP_MAX_RETRIES retries
+    _send(mail_queue, 1, "give-up")
+    assert _wait_for(lambda: mail_queue.failed == 1)
+    assert mail_queue.failed == 1 and mail_queue.sent == 0
+    assert not sink.faults
+
+
+def test_stop_flushes_queued_mail(sink, mail_queue):
+    received = sink.received
+    _send(mail_queue, 10, "flush")
+    mail_queue.stop(timeout=10)
+    assert sink.received - received == 10
+    assert mail_queue.sent == 10 and not mail_queue.workers
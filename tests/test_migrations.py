@@ -0,0 +1,132 @@
+"""
+core/migrations.py against throwaway SQLite databases, starting from the
+baseline schema (the users table only) or from an empty database.
+"""
+from types import SimpleNamespace
+import pytest
+from datetime import datetime
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.dialects import postgresql
+from core.database import Base
+from core.migrations import MIGRATIONS, _users_indexes, migrate
+from users.models import UserModel
+
+BASELINE_SCHEMA = (
+    """
+    CREATE TABLE users (
+        id INTEGER NOT NULL PRIMARY KEY,
+        username VARCHAR(100),
+        email VARCHAR(255),
+        password VARCHAR(100),
+        is_active BOOLEAN,
+        is_verified BOOLEAN,
+        verification_code VARCHAR,
+        verification_code_expiration DATETIME,
+        verified_at DATETIME,
+        registered_at DATETIME,
+        reset_password_code VARCHAR,
+        reset_password_code_expiration DATETIME,
+        updated_at DATETIME,
+        created_at DATETIME DEFAULT (CURRENT_TIMESTAMP) NOT NULL
+    )
+    """,
+    "CREATE INDEX ix_users_id ON users (id)",
+    "CREATE UNIQUE INDEX ix_users_username ON users (username)",
+    "CREATE UNIQUE INDEX ix_users_email ON users (email)",
+)
+
+
+@pytest.fixture
+def database(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path}/migrations.db")
+    yield bind
+    bind.dispose()
+
+
+def _create_baseline(bind):
+    with bind.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.execute(text(statement))
+
+
+def test_existing_database_is_migrated_once(database):
+    _create_baseline(database)
+    names = [migration.name for migration in MIGRATIONS]
+
+    assert list(migrate(database, dry_run=True)) == names
+    assert inspect(database).get_table_names() == ["users"]
+
+    assert list(migrate(database)) == names
+    assert {"email_outbox", "revoked_tokens", "schema_migrations"} <= set(inspect(database).get_table_names())
+    assert "ix_email_outbox_status_available_at" in {index["name"] for index in inspect(database).get_indexes("email_outbox")}
+    assert {"ix_revoked_tokens_expires_at", "ix_revoked_tokens_created_at"} <= {
+        index["name"] for index in inspect(database).get_indexes("revoked_tokens")
+    }
+    assert {
+        "ix_users_created_at_id", "ix_users_registered_at",
+        "ix_users_verification_code_expiration", "ix_users_reset_password_code_expiration",
+    } <= {index["name"] for index in inspect(database).get_indexes("users")}
+    assert migrate(database) == {}
+
+
+def _schema(bind) -> dict:
+    inspector = inspect(bind)
+    return {
+        table: {
+            "columns": [(column["name"], str(column["type"]), column["nullable"]) for column in inspector.get_columns(table)],
+            "indexes": sorted(
+                (index["name"], tuple(index["column_names"]), bool(index["unique"])) for index in inspector.get_indexes(table)
+            ),
+        }
+        for table in Base.metadata.tables
+    }
+
+
+def test_migrated_database_matches_the_models(database, tmp_path):
+    _create_baseline(database)
+    migrate(database)
+    fresh = create_engine(f"sqlite:///{tmp_path}/models.db")
+    Base.metadata.create_all(fresh)
+    try:
+        assert _schema(database) == _schema(fresh)
+    finally:
+        fresh.dispose()
+
+
+def test_signup_source_is_backfilled_for_unverified_sign_ups(database):
+    _create_baseline(database)
+    now = datetime.utcnow()
+    with database.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO users (username, email, is_verified, verification_code, verification_code_expiration, created_at)"
+            " VALUES (:username, :username, :is_verified, :code, :expiration, :now)"
+        ), [
+            {"username": "pending", "is_verified": False, "code": "123456", "expiration": now, "now": now},
+            {"username": "expired", "is_verified": False, "code": "654321", "expiration": datetime(2020, 1, 1), "now": now},
+            {"username": "verified", "is_verified": True, "code": None, "expiration": None, "now": now},
+            {"username": "guest", "is_verified": False, "code": None, "expiration": None, "now": now},
+        ])
+
+    migrate(database)
+    with database.connect() as conn:
+        sources = dict(conn.execute(select(UserModel.username, UserModel.signup_source)).all())
+    assert sources == {"pending": "register", "expired": "register", "verified": None, "guest": None}
+
+
+def test_new_database_gets_the_whole_schema(database):
+    assert list(migrate(database)) == ["schema"]
+    assert {"users", "email_outbox", "revoked_tokens", "schema_migrations"} <= set(inspect(database).get_table_names())
+    assert migrate(database) == {}
+
+
+def test_postgresql_builds_users_indexes_concurrently():
+    # A previous run was interrupted while building ix_users_registered_at
+    conn = SimpleNamespace(
+        dialect=postgresql.dialect(),
+        execute=lambda *args: SimpleNamespace(scalars=lambda: ["ix_users_registered_at"]),
+    )
+    statements = _users_indexes(conn)
+    assert statements[0] == "DROP INDEX CONCURRENTLY IF EXISTS ix_users_registered_at"
+    assert all(statement.startswith("CREATE INDEX CONCURRENTLY IF NOT EXISTS ") for statement in statements[1:])
+    assert "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_email_pattern ON users (email text_pattern_ops)" in statements
+    assert len(statements) == 6
@@ -0,0 +1,44 @@
+"""
+Outbox dispatch against the local SMTP sink in benchmarks/harness.py.
+"""
+import pytest
+from benchmarks import harness
+from sqlalchemy import delete, select
+from auth import outbox
+from auth.models import EmailOutboxModel
+from auth.outbox import dispatch_batch, outbox_email
+from core.database import Base, SessionLocal, engine
+from core.mailer import SMTPSession
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(engine)
+    with SessionLocal() as session:
+        session.execute(delete(EmailOutboxModel))
+        session.commit()
+        yield session
+
+
+def test_failed_row_keeps_the_sent_rows_deleted(db, monkeypatch):
+    monkeypatch.setattr(outbox.settings, "EMAIL_OUTBOX_MAX_ATTEMPTS", 3)
+    harness.sink.faults.clear()
+    received = harness.sink.received
+    db.add_all([
+        outbox_email("first@example.com", "verification_email.html", username="first", verification_code="123456"),
+        outbox_email("broken@example.com", "missing_template.html", username="broken"),
+        outbox_email("last@example.com", "password_reset_email.html", username="last", verification_code="654321"),
+    ])
+    db.commit()
+
+    smtp = SMTPSession()
+    try:
+        assert dispatch_batch(db, smtp, "test-worker") == 3
+    finally:
+        smtp.close()
+
+    assert harness.sink.wait_received(received + 2)
+    (row,) = db.execute(select(EmailOutboxModel)).scalars().all()
+    assert row.to_email == "broken@example.com"
+    assert (row.status, row.attempts, row.claimed_by) == ("pending", 1, None)
+    assert row.last_error.startswith("KeyError")
@@ -0,0 +1,87 @@
+"""
+bcrypt cost calibration and reporting (auth/password_cost.py), and the upgrade
+of cheaper hashes on login.
+"""
+import asyncio
+import pytest
+from passlib.hash import bcrypt
+from sqlalchemy import insert, select, update
+from core.database import engine
+from core.security import password_rehashes
+from auth import password_cost
+from tests.conftest import PASSWORD, run_app
+from users.models import UserModel
+
+
+def test_calibration_recommends_the_highest_cost_within_target(monkeypatch):
+    # 10ms at cost 10, doubling per round
+    timed = []
+    monkeypatch.setattr(password_cost, "time_cost", lambda rounds, samples: timed.append(rounds) or 0.01 * 2 ** (rounds - 10))
+
+    result = password_cost.calibrate(0.05, min_rounds=10, max_rounds=16, samples=1)
+    assert result["recommended"] == 12
+    # Stops once a cost takes twice the target
+    assert timed == [10, 11, 12, 13, 14]
+
+    assert password_cost.calibrate(0.001, min_rounds=10, max_rounds=16, samples=1)["recommended"] == 10
+
+
+@pytest.mark.parametrize("prefix, expected", [
+    ("$2b$12$", ("bcrypt", 12)),
+    ("$2a$04$", ("bcrypt", 4)),
+    ("$argon2id$v=19$", ("unknown", None)),
+    (None, ("unknown", None)),
+])
+def test_hash_prefixes(prefix, expected):
+    assert password_cost.parse_prefix(prefix) == expected
+
+
+def test_distribution_counts_hashes_per_cost(users):
+    prefix = users(2)[0]
+    before = asyncio.run(password_cost.hash_distribution())
+    with engine.begin() as conn:
+        conn.execute(insert(UserModel), [
+            {"username": f"{prefix}cheap", "email": f"{prefix}cheap@example.com", "password": bcrypt.using(rounds=5).hash(PASSWORD)},
+            {"username": f"{prefix}md5", "email": f"{prefix}md5@example.com", "password": "$1$salt$hash"},
+        ])
+    after = asyncio.run(password_cost.hash_distribution())
+
+    assert after[("bcrypt", 5)] - before.get(("bcrypt", 5), 0) == 1
+    assert after[("unknown", None)] - before.get(("unknown", None), 0) == 1
+    assert after[("bcrypt", 12)] == before[("bcrypt", 12)]
+
+
+def _stored_hash(username: str) -> str:
+    with engine.connect() as conn:
+        return conn.execute(select(UserModel.password).where(UserModel.username == username)).scalar_one()
+
+
+def test_cheaper_hash_is_upgraded_on_login(users):
+    (username,) = users(1)
+    with engine.begin() as conn:
+        conn.execute(update(UserModel).where(UserModel.username == username).values(password=bcrypt.using(rounds=4).hash(PASSWORD)))
+    rehashes = password_rehashes.values.get((), 0)
+
+    async def scenario(client):
+        for _ in range(2):
+            login = await client.post("/auth/login", data={"username": username, "password": PASSWORD})
+            assert login.status_code == 200, login.text
+
+    run_app(scenario)
+    assert _stored_hash(username).startswith("$2b$12$")
+    assert bcrypt.verify(PASSWORD, _stored_hash(username))
+    # The second login found the upgraded hash
+    assert password_rehashes.values.get((), 0) - rehashes == 1
+
+
+def test_wrong_password_keeps_the_cheaper_hash(users):
+    (username,) = users(1)
+    cheap = bcrypt.using(rounds=4).hash(PASSWORD)
+    with engine.begin() as conn:
+        conn.execute(update(UserModel).where(UserModel.username == username).values(password=cheap))
+
+    async def scenario(client):
+        return (await client.post("/auth/login", data={"username": username, "password": "Wrong123!"})).status_code
+
+    assert run_app(scenario) == 400
+    assert _stored_hash(username) == cheap
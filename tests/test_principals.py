@@ -0,0 +1,43 @@
+"""
+The principal cache behind authenticated requests (core/principals.py).
+"""
+from core.principals import principal_cache
+from tests.conftest import PASSWORD, request_statements, run_app
+
+
+async def _login(client, username: str, password: str) -> dict:
+    response = await client.post("/auth/login", data={"username": username, "password": password})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_cached_principal_is_dropped_on_password_change(users):
+    (username,) = users(1)
+
+    async def scenario(client):
+        headers = await _login(client, username, PASSWORD)
+        me = await client.get("/users/me", headers=headers)
+        assert me.status_code == 200, me.text
+        user_id = me.json()["id"]
+        assert principal_cache.get(user_id) is not None
+
+        # Later requests are served from the cache
+        with request_statements() as statements:
+            assert (await client.get("/users/me", headers=headers)).status_code == 200
+        assert "SELECT users" not in statements
+
+        new_password = PASSWORD + "1"
+        response = await client.put(
+            "/auth/change-password", headers=headers,
+            json={"current_password": PASSWORD, "new_password": new_password, "confirm_password": new_password},
+        )
+        assert response.status_code == 200, response.text
+        assert principal_cache.get(user_id) is None
+
+        # The next request loads the user again
+        headers = await _login(client, username, new_password)
+        with request_statements() as statements:
+            assert (await client.get("/users/me", headers=headers)).status_code == 200
+        assert statements == ["SELECT users"]
+
+    run_app(scenario)
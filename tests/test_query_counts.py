@@ -0,0 +1,94 @@
+"""
+SQL statements per auth write on the success path. The write paths take one
+round trip each (INSERT ... ON CONFLICT ... RETURNING, guarded UPDATE ...
+RETURNING), an extra SELECT or a re-read after commit shows up here.
+"""
+import asyncio
+from benchmarks import harness
+from auth import services as auth_services
+from users import services as user_services
+from tests.conftest import PASSWORD, request_statements, run_app
+
+# Statement shapes per route. Sign-ups check for a taken username or email
+# before hashing the password, password resets and changes also write the
+# revocation cutoff for older tokens, and a change reads the hash to verify the
+# current password before its compare-and-set.
+EXPECTED = {
+    "/auth/register": ["SELECT users", "INSERT users"],
+    "/guest": ["SELECT users", "INSERT users"],
+    "/auth/verify": ["UPDATE users"],
+    "/auth/forgot-password": ["UPDATE users"],
+    "/auth/reset-password": ["UPDATE users", "INSERT revoked_tokens"],
+    "/auth/change-password": ["SELECT users", "UPDATE users", "INSERT revoked_tokens"],
+}
+
+
+async def _call(client, shapes: dict, route: str, method: str, url: str, expected: int = 200, **kwargs):
+    before = harness.query_totals().get(route, (0, 0))
+    with request_statements() as statements:
+        response = await client.request(method, url, **kwargs)
+    assert response.status_code == expected, response.text
+    after = harness.query_totals()[route]
+    assert after[0] - before[0] == 1
+    # The per-route metric and the statements seen agree
+    assert after[1] - before[1] == len(statements)
+    shapes[route] = statements
+    return response
+
+
+def test_auth_writes_take_one_statement_each(users):
+    (username,) = users(1)
+    email = f"{username}@example.com"
+    new_password = PASSWORD + "1"
+
+    async def scenario(client):
+        shapes = {}
+        await _call(
+            client, shapes, "/auth/register", "POST", "/auth/register", expected=201,
+            json={"username": f"{username}new", "email": f"{username}new@example.com", "password": PASSWORD},
+        )
+        code = await asyncio.to_thread(harness.sink.pop_code, f"{username}new@example.com")
+        await _call(client, shapes, "/auth/verify", "POST", "/auth/verify", json={"email": f"{username}new@example.com", "code": code})
+        await _call(
+            client, shapes, "/guest", "POST", "/guest",
+            json={"username": f"{username}guest", "email": f"{username}guest@example.com", "password": PASSWORD},
+        )
+
+        await _call(client, shapes, "/auth/forgot-password", "POST", "/auth/forgot-password", json={"email": email})
+        code = await asyncio.to_thread(harness.sink.pop_code, email)
+        await _call(
+            client, shapes, "/auth/reset-password", "POST", "/auth/reset-password",
+            json={"email": email, "code": code, "new_password": new_password, "confirm_password": new_password},
+        )
+
+        login = await client.post("/auth/login", data={"username": username, "password": new_password})
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+        await client.get("/users/me", headers=headers)  # Caches the principal, its lookup isn't part of the write
+        await _call(
+            client, shapes, "/auth/change-password", "PUT", "/auth/change-password", headers=headers,
+            json={"current_password": new_password, "new_password": PASSWORD, "confirm_password": PASSWORD},
+        )
+        return shapes
+
+    assert run_app(scenario) == EXPECTED
+
+
+def test_duplicate_sign_up_is_one_select_without_hashing(users, monkeypatch):
+    (username,) = users(1)
+
+    async def no_hashing(password: str) -> str:
+        raise AssertionError("A taken username must not be hashed")
+
+    monkeypatch.setattr(auth_services, "hash_password_async", no_hashing)
+    monkeypatch.setattr(user_services, "hash_password_async", no_hashing)
+
+    async def scenario(client):
+        shapes = {}
+        for route in ("/auth/register", "/guest"):
+            await _call(
+                client, shapes, route, "POST", route, expected=422,
+                json={"username": username, "email": f"{username}other@example.com", "password": PASSWORD},
+            )
+        return shapes
+
+    assert run_app(scenario) == {"/auth/register": ["SELECT users"], "/guest": ["SELECT users"]}
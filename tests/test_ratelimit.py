@@ -0,0 +1,83 @@
+"""
+RateLimitMiddleware (core/ratelimit.py) in front of an app echoing the request
+body, with small limits on /auth/login.
+"""
+import asyncio
+from types import SimpleNamespace
+import httpx
+import pytest
+from starlette.requests import Request
+from starlette.responses import Response
+from core import ratelimit
+from core.ratelimit import MemoryBucketStore, RateLimitMiddleware
+
+
+async def echo(scope, receive, send):
+    body = await Request(scope, receive).body()
+    await Response(body, media_type="text/plain")(scope, receive, send)
+
+
+def _limited(monkeypatch, ip: str, account: str) -> RateLimitMiddleware:
+    monkeypatch.setattr(ratelimit.settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit.settings, "RATE_LIMIT_LOGIN_IP", ip)
+    monkeypatch.setattr(ratelimit.settings, "RATE_LIMIT_LOGIN_ACCOUNT", account)
+    return RateLimitMiddleware(echo, store=MemoryBucketStore(evict_interval=60))
+
+
+def _logins(app, attempts: list) -> list:
+    """
+    POST /auth/login for each (client ip, username), returns the responses.
+    """
+    async def scenario():
+        responses = []
+        for ip, username in attempts:
+            transport = httpx.ASGITransport(app=app, client=(ip, 40000))
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                responses.append(await client.post("/auth/login", data={"username": username, "password": "x"}))
+        return responses
+
+    return asyncio.run(scenario())
+
+
+def test_account_limit_applies_across_ips(monkeypatch):
+    app = _limited(monkeypatch, ip="100/60", account="2/60")
+    responses = _logins(app, [
+        ("10.0.0.1", "alice"), ("10.0.0.2", "alice"), ("10.0.0.3", "Alice"), ("10.0.0.1", "bob"),
+    ])
+    assert [response.status_code for response in responses] == [200, 200, 429, 200]
+    # One token per 30 seconds
+    assert 1 <= int(responses[2].headers["Retry-After"]) <= 30
+    # The body read for the account reaches the app unchanged
+    assert responses[3].text == "username=bob&password=x"
+
+
+def test_ip_limit_applies_across_accounts(monkeypatch):
+    app = _limited(monkeypatch, ip="2/60", account="")
+    responses = _logins(app, [
+        ("10.0.0.1", "alice"), ("10.0.0.1", "bob"), ("10.0.0.1", "carol"), ("10.0.0.2", "carol"),
+    ])
+    assert [response.status_code for response in responses] == [200, 200, 429, 200]
+    assert responses[2].json() == {"detail": "Too many requests. Please try again later."}
+    assert 1 <= int(responses[2].headers["Retry-After"]) <= 30
+
+
+def test_disabled_limits_let_everything_through(monkeypatch):
+    app = _limited(monkeypatch, ip="1/60", account="1/60")
+    monkeypatch.setattr(ratelimit.settings, "RATE_LIMIT_ENABLED", False)
+    responses = _logins(app, [("10.0.0.1", "alice")] * 3)
+    assert [response.status_code for response in responses] == [200, 200, 200]
+
+
+def test_bucket_refills_over_the_period(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit, "time", SimpleNamespace(monotonic=lambda: now[0], time=lambda: now[0]))
+    store = MemoryBucketStore(evict_interval=60)
+    limit = ratelimit.Limit(2, 60)
+
+    async def take() -> float:
+        return await store.take("key", limit)
+
+    assert asyncio.run(take()) == 0 and asyncio.run(take()) == 0
+    assert asyncio.run(take()) == pytest.approx(30)
+    now[0] += 30
+    assert asyncio.run(take()) == 0
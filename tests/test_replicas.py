@@ -0,0 +1,109 @@
+"""
+Read/write routing of RoutingSession (core/replicas.py), with SQLite files
+standing in for the primary and two replicas. Each database holds its own name
+in a marker table, so a read shows which one served it.
+"""
+import asyncio
+import pytest
+from sqlalchemy import Column, MetaData, String, Table, create_engine, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from core.replicas import ReplicaSet, RoutingSession, use_primary
+
+DATABASES = ("primary", "replica1", "replica2")
+
+marker = Table("marker", MetaData(), Column("name", String(20)))
+
+
+@pytest.fixture
+def urls(tmp_path) -> dict:
+    urls = {}
+    for name in DATABASES:
+        url = f"sqlite:///{tmp_path}/{name}.db"
+        engine = create_engine(url)
+        with engine.begin() as conn:
+            marker.create(conn)
+            conn.execute(insert(marker).values(name=name))
+        engine.dispose()
+        urls[name] = url
+    return urls
+
+
+@pytest.fixture
+def make_session(urls):
+    engines = {name: create_engine(url) for name, url in urls.items()}
+    replicas = ReplicaSet([engines["replica1"], engines["replica2"]], retry_after=60)
+    factory = sessionmaker(class_=RoutingSession, info={"primary": engines["primary"], "replicas": replicas})
+    yield factory, replicas, engines
+    for engine in engines.values():
+        engine.dispose()
+
+
+def _served_by(db) -> str:
+    return db.execute(select(marker.c.name)).scalar()
+
+
+def test_reads_stay_on_one_replica_per_session(make_session):
+    factory, _, engines = make_session
+    with factory() as first, factory() as second:
+        assert {_served_by(first) for _ in range(4)} == {"replica1"}
+        # One replica connection for the session
+        assert (engines["replica1"].pool.checkedout(), engines["replica2"].pool.checkedout()) == (1, 0)
+        # The next session gets the next replica, and keeps it too
+        assert {_served_by(second) for _ in range(4)} == {"replica2"}
+        assert {_served_by(first) for _ in range(2)} == {"replica1"}
+
+
+def test_closing_releases_the_pinned_replica(make_session):
+    factory, _, _ = make_session
+    db = factory()
+    assert _served_by(db) == "replica1"
+    db.close()
+    assert _served_by(db) == "replica2"
+    db.close()
+
+
+def test_writes_pin_the_session_to_the_primary(make_session):
+    factory, _, _ = make_session
+    with factory() as db:
+        assert _served_by(db) == "replica1"
+        db.execute(insert(marker).values(name="written"))
+        assert db.execute(select(marker.c.name).where(marker.c.name == "written")).scalar() == "written"
+        assert _served_by(db) == "primary"
+        db.commit()
+    with factory() as db:
+        use_primary(db)
+        assert _served_by(db) == "primary"
+
+
+def test_unhealthy_replicas_are_skipped(make_session):
+    factory, replicas, engines = make_session
+    replicas.mark_down(engines["replica1"])
+    with factory() as db:
+        assert _served_by(db) == "replica2"
+    replicas.mark_down(engines["replica2"])
+    with factory() as db:
+        assert _served_by(db) == "primary"
+    replicas.mark_up(engines["replica1"])
+    with factory() as db:
+        assert _served_by(db) == "replica1"
+
+
+def test_async_sessions_stay_on_one_replica(urls):
+    async def scenario():
+        engines = {name: create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://")) for name, url in urls.items()}
+        replicas = ReplicaSet([engines["replica1"], engines["replica2"]], retry_after=60)
+        factory = async_sessionmaker(
+            sync_session_class=RoutingSession, info={"primary": engines["primary"].sync_engine, "replicas": replicas},
+        )
+        try:
+            served = []
+            for _ in range(2):
+                async with factory() as db:
+                    served.append({(await db.execute(select(marker.c.name))).scalar() for _ in range(4)})
+            return served
+        finally:
+            for engine in engines.values():
+                await engine.dispose()
+
+    assert asyncio.run(scenario()) == [{"replica1"}, {"replica2"}]
@@ -0,0 +1,28 @@
+"""
+The retention job's unverified account sweep.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select
+from tests.conftest import PASSWORD, run_app
+from core.database import engine
+from users.models import UserModel
+from users.retention import retention_job
+
+
+def test_only_unverified_registrations_are_deleted(users):
+    prefix = users(1)[0]
+    created_at = datetime.utcnow() - timedelta(days=365)
+    with engine.begin() as conn:
+        conn.execute(insert(UserModel), [
+            {"username": f"{prefix}{source}", "email": f"{prefix}{source}@example.com", "password": PASSWORD,
+             "is_verified": False, "created_at": created_at, "signup_source": source}
+            for source in ("register", "guest", "import", None)
+        ])
+
+    async def scenario(client):
+        return await retention_job.run_once(["unverified_accounts"])
+
+    assert run_app(scenario)["unverified_accounts"]["rows"] == 1
+    with engine.connect() as conn:
+        remaining = conn.execute(select(UserModel.username).where(UserModel.username.startswith(prefix))).scalars().all()
+    assert sorted(remaining) == sorted([prefix, f"{prefix}guest", f"{prefix}import", f"{prefix}None"])
@@ -0,0 +1,108 @@
+"""
+Smoke test of the auth and user routes in the configured DB mode. test_db_modes
+runs this file again with DB_ASYNC flipped, so every run covers the async
+(sqlite+aiosqlite) and the sync session paths.
+"""
+import asyncio
+import orjson
+from benchmarks import harness
+from core import security
+from core.database import async_engine
+from core.config import get_settings
+from tests.conftest import PASSWORD, run_app
+
+INTERNAL_TOKEN = "test-internal-token"
+
+
+def test_engine_matches_db_async():
+    assert (async_engine is not None) == get_settings().DB_ASYNC
+    if async_engine is not None:
+        assert async_engine.dialect.driver == "aiosqlite"
+
+
+def test_account_lifecycle(users):
+    (username,) = users(1)
+    email = f"{username}@example.com"
+
+    async def scenario(client):
+        # Register and verify a new account
+        new_email = f"{username}new@example.com"
+        response = await client.post("/auth/register", json={"username": f"{username}new", "email": new_email, "password": PASSWORD})
+        assert response.status_code == 201, response.text
+        login = await client.post("/auth/login", data={"username": f"{username}new", "password": PASSWORD})
+        assert login.status_code == 403  # Not verified yet
+        code = await asyncio.to_thread(harness.sink.pop_code, new_email)
+        response = await client.post("/auth/verify", json={"email": new_email, "code": code})
+        assert response.status_code == 200, response.text
+
+        # Log in, read the profile, rotate the refresh token
+        login = await client.post("/auth/login", data={"username": username, "password": PASSWORD})
+        assert login.status_code == 200, login.text
+        tokens = login.json()
+        me = await client.get("/users/me", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+        assert me.status_code == 200 and me.json()["email"] == email
+        refreshed = await client.post("/auth/refresh", headers={"refresh-token": tokens["refresh_token"]})
+        assert refreshed.status_code == 200, refreshed.text
+        reused = await client.post("/auth/refresh", headers={"refresh-token": tokens["refresh_token"]})
+        assert reused.status_code == 401
+
+        # Change the password: older tokens stop working
+        new_password = PASSWORD + "1"
+        response = await client.put(
+            "/auth/change-password", headers={"Authorization": f"Bearer {refreshed.json()['access_token']}"},
+            json={"current_password": PASSWORD, "new_password": new_password, "confirm_password": new_password},
+        )
+        assert response.status_code == 200, response.text
+        me = await client.get("/users/me", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+        assert me.status_code == 401
+
+        # Reset it through the emailed code
+        response = await client.post("/auth/forgot-password", json={"email": email})
+        assert response.status_code == 200, response.text
+        code = await asyncio.to_thread(harness.sink.pop_code, email)
+        response = await client.post(
+            "/auth/reset-password",
+            json={"email": email, "code": code, "new_password": PASSWORD, "confirm_password": PASSWORD},
+        )
+        assert response.status_code == 200, response.text
+        wrong = await client.post("/auth/login", data={"username": username, "password": new_password})
+        assert wrong.status_code != 200
+        login = await client.post("/auth/login", data={"username": username, "password": PASSWORD})
+        assert login.status_code == 200
+
+    run_app(scenario)
+
+
+def test_guest_and_admin_routes(users, monkeypatch):
+    monkeypatch.setattr(security.settings, "INTERNAL_API_TOKEN", INTERNAL_TOKEN)
+    usernames = users(3)
+    prefix = usernames[0][:-1]
+    headers = {"X-Internal-Token": INTERNAL_TOKEN}
+
+    async def scenario(client):
+        response = await client.post("/guest", json={"username": f"{prefix}guest", "email": f"{prefix}guest@example.com", "password": PASSWORD})
+        assert response.status_code == 200, response.text
+        duplicate = await client.post("/guest", json={"username": f"{prefix}guest", "email": f"{prefix}guest@example.com", "password": PASSWORD})
+        assert duplicate.status_code == 422
+
+        assert (await client.get("/users", params={"limit": 2})).status_code == 403
+        page = await client.get("/users", headers=headers, params={"limit": 2, "email_prefix": prefix})
+        assert page.status_code == 200, page.text
+        listed = [user["username"] for user in page.json()["items"]]
+        cursor = page.json()["next_cursor"]
+        page = await client.get("/users", headers=headers, params={"limit": 2, "email_prefix": prefix, "cursor": cursor})
+        listed += [user["username"] for user in page.json()["items"]]
+        assert sorted(listed) == sorted(usernames + [f"{prefix}guest"])
+
+        export = await client.get("/users/export", headers=headers, params={"email_prefix": prefix})
+        assert export.status_code == 200
+        exported = [orjson.loads(line)["username"] for line in export.content.splitlines()]
+        assert sorted(exported) == sorted(listed)
+
+        # LIKE wildcards and the last code point are matched literally
+        for odd in ("%", prefix[:2] + "_", "\U0010ffff"):
+            page = await client.get("/users", headers=headers, params={"email_prefix": odd})
+            assert page.status_code == 200, page.text
+            assert page.json()["items"] == []
+
+    run_app(scenario)
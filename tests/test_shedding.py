@@ -0,0 +1,85 @@
+"""
+LoadSheddingMiddleware (core/shedding.py) in front of an app answering 200,
+with the pressure level set on its own LoadMonitor.
+"""
+import asyncio
+import httpx
+import pytest
+from starlette.responses import Response
+from core import shedding
+from core.pool import pool_wait
+from core.shedding import LoadMonitor, LoadSheddingMiddleware
+
+ROUTES = ("/auth/register", "/auth/login", "/users/me")  # low, normal and critical priority
+
+
+async def ok(scope, receive, send):
+    await Response("ok", media_type="text/plain")(scope, receive, send)
+
+
+def _responses(monkeypatch, level: int, paths=ROUTES, enabled: bool = True) -> list:
+    monkeypatch.setattr(shedding.settings, "LOAD_SHED_ENABLED", enabled)
+    monitor = LoadMonitor()
+    monitor.level = level
+    app = LoadSheddingMiddleware(ok, monitor=monitor)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [await client.get(path) for path in paths]
+
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("level, expected", [
+    pytest.param(0, [200, 200, 200], id="idle"),
+    pytest.param(1, [503, 200, 200], id="low priority shed"),
+    pytest.param(2, [503, 503, 200], id="critical only"),
+])
+def test_routes_are_shed_from_the_lowest_priority_up(monkeypatch, level, expected):
+    shed = dict(shedding.shed_counters["shed"])
+    responses = _responses(monkeypatch, level)
+    assert [response.status_code for response in responses] == expected
+    assert sum(shedding.shed_counters["shed"].values()) - sum(shed.values()) == expected.count(503)
+
+
+def test_shed_response_asks_to_retry(monkeypatch):
+    monkeypatch.setattr(shedding.settings, "LOAD_SHED_RETRY_AFTER", 3)
+    (response,) = _responses(monkeypatch, 2, ["/guest"])
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+    assert response.json() == {"detail": "Server is busy. Please try again shortly."}
+
+
+def test_route_prefixes_match_whole_segments(monkeypatch):
+    responses = _responses(monkeypatch, 2, ["/internal/metrics", "/internalx", "/.well-known/jwks.json"])
+    assert [response.status_code for response in responses] == [200, 503, 200]
+
+
+def test_disabled_shedding_admits_everything(monkeypatch):
+    responses = _responses(monkeypatch, 2, enabled=False)
+    assert [response.status_code for response in responses] == [200, 200, 200]
+
+
+def test_monitor_levels_follow_lag_and_pool_wait(monkeypatch):
+    monkeypatch.setattr(shedding.settings, "LOAD_SHED_LAG_LOW", 0.05)
+    monkeypatch.setattr(shedding.settings, "LOAD_SHED_LAG_HIGH", 0.25)
+    monkeypatch.setattr(shedding.settings, "LOAD_SHED_POOL_WAIT_LOW", 0.1)
+    monkeypatch.setattr(shedding.settings, "LOAD_SHED_POOL_WAIT_HIGH", 1)
+    monitor = LoadMonitor()
+
+    monitor.update(0.01)
+    assert monitor.level == 0
+    monitor.update(0.1)
+    assert monitor.level == 1
+    monitor.update(0.3)
+    assert monitor.level == 2
+
+    # Average checkout wait since the last sample: 0.2s and 0.4s over two checkouts
+    pool_wait.observe(0.2)
+    pool_wait.observe(0.4)
+    monitor.update(0.0)
+    assert monitor.pool_wait == pytest.approx(0.3) and monitor.level == 1
+    # No checkouts since, no wait
+    monitor.update(0.0)
+    assert monitor.pool_wait == 0 and monitor.level == 0
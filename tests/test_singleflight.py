@@ -0,0 +1,111 @@
+"""
+SingleFlight (core/singleflight.py) with a lookup that blocks until released,
+so the callers overlap.
+"""
+import asyncio
+import pytest
+from core import singleflight
+from core.singleflight import SingleFlight, coalesced_calls
+
+
+@pytest.fixture(autouse=True)
+def coalescing(monkeypatch):
+    monkeypatch.setattr(singleflight.settings, "REQUEST_COALESCING", True)
+
+
+class Lookup:
+    """
+    Counts its calls; each returns the call number once `release` is set, or raises `error`.
+    """
+
+    def __init__(self, error: BaseException = None):
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.error = error
+
+    async def __call__(self):
+        self.calls += 1
+        call = self.calls
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return call
+
+
+async def _start(flight: SingleFlight, lookup: Lookup, count: int) -> list:
+    tasks = [asyncio.create_task(flight.do("key", lookup)) for _ in range(count)]
+    await asyncio.sleep(0)  # Every caller reaches the flight
+    return tasks
+
+
+def test_concurrent_callers_share_one_call():
+    async def scenario():
+        flight, lookup = SingleFlight("test-shared"), Lookup()
+        tasks = await _start(flight, lookup, 5)
+        assert len(flight) == 1
+        lookup.release.set()
+        results = await asyncio.gather(*tasks)
+        # Nothing is kept once the call finished
+        assert len(flight) == 0
+        assert await flight.do("key", lookup) == 2
+        return results, lookup.calls
+
+    assert asyncio.run(scenario()) == ([1] * 5, 2)
+    assert coalesced_calls.values[("test-shared", "leader")] == 2
+    assert coalesced_calls.values[("test-shared", "shared")] == 4
+
+
+def test_error_reaches_every_caller():
+    error = ValueError("lookup failed")
+
+    async def scenario():
+        flight, lookup = SingleFlight("test-error"), Lookup(error)
+        tasks = await _start(flight, lookup, 3)
+        lookup.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return results, lookup.calls, len(flight)
+
+    results, calls, inflight = asyncio.run(scenario())
+    assert results == [error] * 3
+    assert (calls, inflight) == (1, 0)
+
+
+def test_cancelled_leader_hands_over_to_a_waiter():
+    async def scenario():
+        flight, lookup = SingleFlight("test-cancel"), Lookup()
+        leader, *waiters = await _start(flight, lookup, 3)
+        leader.cancel()
+        while lookup.calls < 2:  # A waiter took over
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        lookup.release.set()
+        results = await asyncio.gather(*waiters)
+        assert leader.cancelled()
+        return results, lookup.calls
+
+    # The waiters start over and share the second call
+    assert asyncio.run(scenario()) == ([2, 2], 2)
+
+
+def test_cancelled_waiter_leaves_the_call_running():
+    async def scenario():
+        flight, lookup = SingleFlight("test-waiter"), Lookup()
+        leader, waiter, other = await _start(flight, lookup, 3)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        lookup.release.set()
+        return await asyncio.gather(leader, other), waiter.cancelled(), lookup.calls
+
+    assert asyncio.run(scenario()) == ([1, 1], True, 1)
+
+
+def test_disabled_coalescing_runs_every_call(monkeypatch):
+    monkeypatch.setattr(singleflight.settings, "REQUEST_COALESCING", False)
+
+    async def scenario():
+        lookup = Lookup()
+        tasks = await _start(SingleFlight("test-disabled"), lookup, 3)
+        lookup.release.set()
+        return sorted(await asyncio.gather(*tasks))
+
+    assert asyncio.run(scenario()) == [1, 2, 3]
@@ -0,0 +1,352 @@
+"""
+Bulk import and export of user accounts as CSV or NDJSON.
+
+    python -m users.bulk import users.csv --rejects rejects.ndjson
+    python -m users.bulk export users.ndjson
+
+Import rows carry username, email and either `password_hash` (a bcrypt hash,
+stored as is) or `password` (hashed on the worker pool), plus the optional
+is_active, is_verified, registered_at and verified_at. Rows are written
+BULK_IMPORT_BATCH_SIZE at a time: COPY on Postgres, a chunked executemany
+INSERT ... ON CONFLICT DO NOTHING elsewhere. Rows that can't be imported,
+including taken usernames and emails, go to the reject file with the reason.
+The export writes the same columns, so its output imports back unchanged.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import sys
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Callable, Iterator
+import orjson
+from pydantic import EmailStr, TypeAdapter, ValidationError
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.config import get_settings
+from core.database import DBSession, engine, async_engine, db_execute, db_commit, db_rollback, insert_ignoring_conflicts, open_primary_session
+from core.metrics import registry
+from core.security import hash_password_async, pwd_context
+from users.models import UserModel
+from users.schemas import UserListFilters
+from users.services import export_users
+
+settings = get_settings()
+
+import_rows = registry.counter("user_import_rows_total", "Rows processed by bulk user imports.", labels=("result",))
+
+# Columns written per imported row, created_at comes from the server default
+IMPORT_COLUMNS = ("username", "email", "password", "is_active", "is_verified", "registered_at", "verified_at", "updated_at", "signup_source")
+TRUE_VALUES = {"true", "t", "1", "yes", "y"}
+FALSE_VALUES = {"false", "f", "0", "no", "n", ""}
+UNIQUE_VIOLATION = "23505"  # Postgres SQLSTATE
+
+_email = TypeAdapter(EmailStr)
+
+
+def detect_format(filename: str) -> str:
+    return "csv" if (filename or "").lower().endswith(".csv") else "ndjson"
+
+
+def read_records(file, format: str) -> Iterator:
+    """
+    (line number, record) pairs from a text file. Unparseable NDJSON lines come
+    through as their raw text and are rejected later.
+    """
+    if format == "csv":
+        reader = csv.DictReader(file)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, orjson.loads(line)
+        except orjson.JSONDecodeError:
+            yield line_number, line.strip()[:200]
+
+
+def _bool(value) -> bool:
+    if isinstance(value, bool) or value is None:
+        return bool(value)
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f"Invalid boolean {value!r}.")
+
+
+def _datetime(value):
+    if value in (None, ""):
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError(f"Invalid datetime {value!r}.")
+    # Columns are naive UTC, like the timestamps the auth flows write
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _prepare(record, now: datetime) -> tuple:
+    """
+    Validate one record into (row, plain password or None). Raises ValueError with the reject reason.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("Malformed record.")
+    username = str(record.get("username") or "").strip()
+    if not username or len(username) > UserModel.username.type.length:
+        raise ValueError("Invalid username.")
+    try:
+        email = _email.validate_python(str(record.get("email") or "").strip())
+    except ValidationError:
+        raise ValueError("Invalid email.")
+
+    password_hash = record.get("password_hash") or None
+    password = None
+    if password_hash:
+        if (
+            not isinstance(password_hash, str) or len(password_hash) > UserModel.password.type.length
+            or pwd_context.identify(password_hash) is None
+        ):
+            raise ValueError("Unsupported password hash.")
+    else:
+        password = record.get("password") or None
+        if not password:
+            raise ValueError("Missing password or password_hash.")
+        if not isinstance(password, str):
+            raise ValueError("Invalid password.")
+
+    row = {
+        "username": username,
+        "email": email,
+        "password": password_hash,
+        "is_active": _bool(record.get("is_active")),
+        "is_verified": _bool(record.get("is_verified")),
+        "registered_at": _datetime(record.get("registered_at")) or now,
+        "verified_at": _datetime(record.get("verified_at")),
+        "updated_at": now,
+        "signup_source": "import",
+    }
+    return row, password
+
+
+def _reject_entry(line: int, record, error: str) -> dict:
+    # Plain passwords never reach the reject file
+    if isinstance(record, dict):
+        record = {key: value for key, value in record.items() if key != "password"}
+    return {"line": line, "error": error, "record": record}
+
+
+async def _taken(db: DBSession, usernames: set, emails: set) -> tuple:
+    statement = select(UserModel.username, UserModel.email).where(
+        or_(UserModel.username.in_(usernames), UserModel.email.in_(emails))
+    )
+    rows = (await db_execute(db, statement)).all()
+    return {username for username, _ in rows}, {email for _, email in rows}
+
+
+def _copy_driver(db: DBSession) -> str:
+    dialect = (async_engine.dialect if isinstance(db, AsyncSession) else engine.dialect)
+    if dialect.name == "postgresql" and dialect.driver in ("asyncpg", "psycopg2"):
+        return dialect.driver
+    return None
+
+
+async def _copy_rows(db: DBSession, rows: list):
+    records = [tuple(row[column] for column in IMPORT_COLUMNS) for row in rows]
+    if isinstance(db, AsyncSession):
+        connection = await db.connection()
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            UserModel.__tablename__, records=records, columns=IMPORT_COLUMNS
+        )
+        return
+
+    # psycopg2 reads CSV, where an unquoted empty field is NULL
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(records)
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {UserModel.__tablename__} ({', '.join(IMPORT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+    finally:
+        cursor.close()
+
+
+async def _insert_rows(db: DBSession, rows: list) -> set:
+    """
+    Chunked executemany; usernames of the rows actually inserted.
+    """
+    if engine.dialect.name in ("postgresql", "sqlite"):
+        # ON CONFLICT DO NOTHING RETURNING: rows that lost a race are simply missing from the result
+        statement = insert_ignoring_conflicts(UserModel).returning(UserModel.username)
+        return set((await db_execute(db, statement, rows)).scalars().all())
+
+    try:
+        await db_execute(db, insert(UserModel), rows)
+        return {row["username"] for row in rows}
+    except IntegrityError:
+        await db_rollback(db)
+
+    # Without ON CONFLICT one conflict fails the whole batch, so retry it row by row
+    inserted = set()
+    for row in rows:
+        try:
+            await db_execute(db, insert(UserModel).values(**row))
+            await db_commit(db)
+            inserted.add(row["username"])
+        except IntegrityError:
+            await db_rollback(db)
+    return inserted
+
+
+async def _write_rows(db: DBSession, rows: list) -> set:
+    if _copy_driver(db):
+        try:
+            await _copy_rows(db, rows)
+            await db_commit(db)
+            return {row["username"] for row in rows}
+        except Exception as error:
+            # COPY is all or nothing, a name taken since the check fails it: fall back to the insert path
+            if UNIQUE_VIOLATION not in (getattr(error, "sqlstate", None), getattr(error, "pgcode", None)):
+                raise
+            await db_rollback(db)
+
+    inserted = await _insert_rows(db, rows)
+    await db_commit(db)
+    return inserted
+
+
+async def _hash_passwords(pending: list, semaphore: asyncio.Semaphore):
+    async def hash_one(row: dict, password: str):
+        async with semaphore:
+            row["password"] = await hash_password_async(password)
+
+    await asyncio.gather(*(hash_one(row, password) for row, password in pending))
+
+
+async def _import_batch(batch: list, db: DBSession, reject: Callable, stats: dict, semaphore: asyncio.Semaphore):
+    now = datetime.utcnow()
+    candidates = []
+    usernames, emails = set(), set()
+
+    def rejected(line: int, record, error: str):
+        stats["rejected"] += 1
+        reject(_reject_entry(line, record, error))
+
+    for line, record in batch:
+        try:
+            row, password = _prepare(record, now)
+        except ValueError as error:
+            rejected(line, record, str(error))
+            continue
+        if row["username"] in usernames or row["email"] in emails:
+            rejected(line, record, "Duplicate username or email in this batch.")
+            continue
+        usernames.add(row["username"])
+        emails.add(row["email"])
+        candidates.append((line, record, row, password))
+    if not candidates:
+        return
+
+    # One query for the whole batch, so no password is hashed for a row that is rejected anyway
+    taken_usernames, taken_emails = await _taken(db, usernames, emails)
+    await db_rollback(db)  # Don't hold the connection while hashing
+    rows = []
+    for line, record, row, password in candidates:
+        if row["username"] in taken_usernames:
+            rejected(line, record, "Username is already registered.")
+        elif row["email"] in taken_emails:
+            rejected(line, record, "Email is already registered.")
+        else:
+            rows.append((line, record, row, password))
+    if not rows:
+        return
+
+    pending = [(row, password) for _, _, row, password in rows if password is not None]
+    await _hash_passwords(pending, semaphore)
+    stats["hashed"] += len(pending)
+
+    inserted = await _write_rows(db, [row for _, _, row, _ in rows])
+    stats["imported"] += len(inserted)
+    for line, record, row, _ in rows:
+        if row["username"] not in inserted:
+            rejected(line, record, "Username or email is already registered.")
+
+
+async def import_users(records: Iterator, db: DBSession, reject: Callable) -> dict:
+    """
+    Import (line, record) pairs from read_records. Each batch is committed on its
+    own, `reject` receives one dict per row that wasn't imported.
+    Returns the imported, rejected and hashed row counts.
+    """
+    stats = {"imported": 0, "rejected": 0, "hashed": 0}
+    # Leaves the rest of the hashing pool to the login and register traffic
+    semaphore = asyncio.Semaphore(settings.BULK_IMPORT_HASH_CONCURRENCY)
+    while True:
+        # Reading and parsing runs off the event loop, uploads may be spooled to disk
+        batch = await asyncio.to_thread(list, islice(records, settings.BULK_IMPORT_BATCH_SIZE))
+        if not batch:
+            break
+        before = dict(stats)
+        await _import_batch(batch, db, reject, stats, semaphore)
+        import_rows.inc("imported", amount=stats["imported"] - before["imported"])
+        import_rows.inc("rejected", amount=stats["rejected"] - before["rejected"])
+    return stats
+
+
+async def _run_import(args):
+    format = args.format or detect_format(args.path)
+    source = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8-sig", newline="")
+    rejects_path = args.rejects or (
+        "rejects.ndjson" if args.path == "-" else f"{args.path.rsplit('.', 1)[0]}.rejects.ndjson"
+    )
+    with source, open(rejects_path, "wb") as rejects:
+        async with open_primary_session() as db:
+            stats = await import_users(
+                read_records(source, format), db, lambda entry: rejects.write(orjson.dumps(entry) + b"\n")
+            )
+    print(orjson.dumps({**stats, "rejects": rejects_path}).decode(), file=sys.stderr)
+
+
+async def _run_export(args):
+    format = args.format or detect_format(args.path)
+    target = sys.stdout.buffer if args.path == "-" else open(args.path, "wb")
+    try:
+        chunks = export_users(UserListFilters(), format)
+        if hasattr(chunks, "__aiter__"):
+            async for chunk in chunks:
+                target.write(chunk)
+        else:
+            for chunk in chunks:
+                target.write(chunk)
+    finally:
+        if target is not sys.stdout.buffer:
+            target.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import or export user accounts as CSV or NDJSON.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="import accounts from a file ('-' for stdin)")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--rejects", help="reject file, <path>.rejects.ndjson by default")
+    export_parser = commands.add_parser("export", help="export accounts to a file ('-' for stdout)")
+    export_parser.add_argument("path")
+    for command in (import_parser, export_parser):
+        command.add_argument("--format", choices=("csv", "ndjson"), help="guessed from the file extension by default")
+    args = parser.parse_args()
+
+    asyncio.run(_run_import(args) if args.command == "import" else _run_export(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, func
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Index, func
 from datetime import datetime
 from core.database import Base
 
@@ -18,3 +18,21 @@ class UserModel(Base):
     reset_password_code_expiration = Column(DateTime, nullable=True)  
     updated_at = Column(DateTime, nullable=True, default=None, onupdate=datetime.now)
     created_at = Column(DateTime, nullable=False, server_default=func.now())
+    signup_source = Column(String(20), nullable=True)  # register, guest or import; NULL for accounts from before it was recorded, see migration 0004
+
+    __table_args__ = (
+        # Keyset pagination and range filters of the admin listing
+        Index("ix_users_created_at_id", "created_at", "id"),
+        Index("ix_users_registered_at", "registered_at"),
+        # Email prefix filter: LIKE 'prefix%' only uses a btree in the "C" order, the unique index follows the collation
+        Index("ix_users_email_pattern", "email", postgresql_ops={"email": "text_pattern_ops"}).ddl_if(dialect="postgresql"),
+        # Retention sweeps of expired codes, partial so rows without a pending code stay out of them
+        Index(
+            "ix_users_verification_code_expiration", "verification_code_expiration", "id",
+            postgresql_where=verification_code_expiration.is_not(None), sqlite_where=verification_code_expiration.is_not(None),
+        ),
+        Index(
+            "ix_users_reset_password_code_expiration", "reset_password_code_expiration", "id",
+            postgresql_where=reset_password_code_expiration.is_not(None), sqlite_where=reset_password_code_expiration.is_not(None),
+        ),
+    )
@@ -1,15 +1,47 @@
-from pydantic import BaseModel, EmailStr
-from typing import Union
+from operator import attrgetter
+from pydantic import BaseModel, ConfigDict, EmailStr
+from typing import List, Optional, Union
 from datetime import datetime
 
 class BaseResponse(BaseModel):
-    class Config:
-        from_attributes = True
-        arbitrary_types_allowed = True
+    model_config = ConfigDict(from_attributes=True, arbitrary_types_allowed=True)
 
 
 class UserResponse(BaseModel):
     id: int
     username: str 
     email: EmailStr
-    registered_at: Union[None, datetime] = None
\ No newline at end of file
+    registered_at: Union[None, datetime] = None
+
+
+class AdminUserResponse(BaseModel):
+    id: int
+    username: str
+    email: EmailStr
+    is_active: bool
+    is_verified: bool
+    registered_at: Optional[datetime] = None
+    verified_at: Optional[datetime] = None
+    created_at: datetime
+
+
+class UserPageResponse(BaseModel):
+    items: List[AdminUserResponse]
+    next_cursor: Optional[str] = None  # Pass back as `cursor` for the next page, None on the last page
+
+
+# Precomputed ORM -> dict serializer for UserResponse, works on UserModel and UserSnapshot.
+# Values come from the database already typed, so no validation is needed.
+USER_RESPONSE_FIELDS = tuple(UserResponse.model_fields)
+_user_response_values = attrgetter(*USER_RESPONSE_FIELDS)
+
+# Columns selected for the admin listing, rows zip straight into dicts
+ADMIN_USER_FIELDS = tuple(AdminUserResponse.model_fields)
+
+
+def serialize_user(user) -> dict:
+    return dict(zip(USER_RESPONSE_FIELDS, _user_response_values(user)))
+
+
+def serialize_admin_row(row) -> dict:
+    return dict(zip(ADMIN_USER_FIELDS, row))
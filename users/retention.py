@@ -0,0 +1,179 @@
+"""
+Retention of never-verified accounts, expired verification/reset codes and
+expired token revocations.
+
+    python -m users.retention --dry-run
+    python -m users.retention [--target reset_codes ...]
+
+Each target walks its rows in keyset order on an index (created_at for accounts,
+the expiry for codes and revocations), RETENTION_BATCH_SIZE rows per short transaction with
+RETENTION_BATCH_PAUSE between them, so no lock is held for long and the request
+traffic keeps its share of the database. The delete or update re-checks the
+condition, a row that changed since it was read (e.g. just verified) is left
+alone. RETENTION_ENABLED runs the same job in-process every RETENTION_INTERVAL.
+"""
+import argparse
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+import orjson
+from sqlalchemy import delete, func, select, tuple_, update
+from core.config import get_settings
+from core.database import DBSession, db_commit, db_execute, open_primary_session
+from core.metrics import registry
+from core.principals import invalidate_principal
+from auth.models import RevokedTokenModel
+from users.models import UserModel
+
+settings = get_settings()
+
+retention_rows = registry.counter("retention_rows_total", "Rows deleted or cleared by the retention job.", labels=("target",))
+
+
+@dataclass(frozen=True)
+class RetentionTarget:
+    name: str
+    key: object  # Indexed column walked in keyset order, with id as tie breaker
+    condition: Callable[[datetime], object]  # Rows to process as of `now`
+    clear: Optional[dict] = field(default=None)  # Columns to reset, None deletes the row
+    model: type = UserModel
+    on_delete: Optional[Callable[[int], None]] = None  # Called with each deleted id after the commit
+
+
+def _unverified_before(now: datetime):
+    # Only /auth/register sign-ups that never verified; guests and imported accounts may stay unverified.
+    # Accounts from before signup_source was recorded are NULL and kept, except never-verified sign-ups,
+    # which migration 0004_users_signup_source backfilled as 'register' (see core/migrations.py)
+    return (
+        (UserModel.signup_source == "register") & UserModel.is_verified.is_not(True)
+        & (UserModel.created_at < now - timedelta(days=settings.RETENTION_UNVERIFIED_DAYS))
+    )
+
+
+TARGETS = {
+    target.name: target for target in (
+        RetentionTarget("unverified_accounts", UserModel.created_at, _unverified_before, on_delete=invalidate_principal),
+        RetentionTarget(
+            "verification_codes", UserModel.verification_code_expiration,
+            lambda now: UserModel.verification_code_expiration < now,
+            clear={"verification_code": None, "verification_code_expiration": None},
+        ),
+        RetentionTarget(
+            "reset_codes", UserModel.reset_password_code_expiration,
+            lambda now: UserModel.reset_password_code_expiration < now,
+            clear={"reset_password_code": None, "reset_password_code_expiration": None},
+        ),
+        # Rotated refresh tokens and password change cutoffs, only needed until the tokens they revoke expire
+        RetentionTarget(
+            "revoked_tokens", RevokedTokenModel.expires_at,
+            lambda now: RevokedTokenModel.expires_at < now,
+            model=RevokedTokenModel,
+        ),
+    )
+}
+
+
+def _enabled_targets(names: list = None) -> list:
+    targets = [TARGETS[name] for name in (names or TARGETS)]
+    if settings.RETENTION_UNVERIFIED_DAYS <= 0:
+        targets = [target for target in targets if target.name != "unverified_accounts"]
+    return targets
+
+
+async def _sweep(db: DBSession, target: RetentionTarget, now: datetime) -> int:
+    model = target.model
+    processed = 0
+    after = None
+    while True:
+        statement = select(target.key, model.id).where(target.condition(now))
+        if after is not None:
+            statement = statement.where(tuple_(target.key, model.id) > tuple_(*after))
+        rows = (await db_execute(db, statement.order_by(target.key, model.id).limit(settings.RETENTION_BATCH_SIZE))).all()
+        if not rows:
+            break
+        after = tuple(rows[-1])
+        ids = [row.id for row in rows]
+
+        change = delete(model) if target.clear is None else update(model).values(**target.clear)
+        result = await db_execute(db, change.where(model.id.in_(ids), target.condition(now)).execution_options(synchronize_session=False))
+        await db_commit(db)  # One short transaction per batch
+        processed += result.rowcount
+        retention_rows.inc(target.name, amount=result.rowcount)
+        if target.on_delete:
+            for row_id in ids:
+                target.on_delete(row_id)
+
+        if len(rows) < settings.RETENTION_BATCH_SIZE:
+            break
+        await asyncio.sleep(settings.RETENTION_BATCH_PAUSE)
+    return processed
+
+
+async def _report(db: DBSession, target: RetentionTarget, now: datetime) -> dict:
+    statement = select(func.count(), func.min(target.key)).where(target.condition(now))
+    count, oldest = (await db_execute(db, statement)).one()
+    return {"rows": count, "oldest": oldest.isoformat() if oldest else None}
+
+
+class RetentionJob:
+    """
+    Runs the retention targets once or on an interval, keeping the last outcome for /internal/retention.
+    """
+
+    def __init__(self):
+        self.last_run = None
+        self.last_result = {}
+        self.running = False
+
+    async def run_once(self, targets: list = None, dry_run: bool = False) -> dict:
+        now = datetime.utcnow()
+        result = {}
+        start = time.perf_counter()
+        async with open_primary_session() as db:
+            for target in _enabled_targets(targets):
+                if dry_run:
+                    result[target.name] = await _report(db, target, now)
+                else:
+                    result[target.name] = {"rows": await _sweep(db, target, now)}
+        if not dry_run:
+            self.last_run = now
+            self.last_result = {"seconds": round(time.perf_counter() - start, 3), "targets": result}
+        return result
+
+    async def run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.running = True
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Retention run failed: {e}")
+            finally:
+                self.running = False
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.RETENTION_ENABLED,
+            "running": self.running,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            **self.last_result,
+        }
+
+
+retention_job = RetentionJob()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete never-verified accounts and expired revocations, clear expired codes, in small batches.")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be processed without changing anything")
+    parser.add_argument("--target", action="append", choices=tuple(TARGETS), help="limit to these targets, repeatable")
+    args = parser.parse_args()
+
+    result = asyncio.run(retention_job.run_once(args.target, dry_run=args.dry_run))
+    print(orjson.dumps(result, option=orjson.OPT_INDENT_2).decode())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,18 @@
-from fastapi import APIRouter, status, Depends, Request
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from core.database import get_db
-from users.schemas import CreateUserRequest
-from users.services import create_user_account, get_current_user
-from core.security import oauth2_scheme
-from users.responses import UserResponse
-from users.models import UserModel
+import io
+from typing import Literal, Optional
+from fastapi import APIRouter, status, Depends, Request, HTTPException, Query, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
+from core.config import get_settings
+from core.database import get_session, open_primary_session, DBSession
+from users.schemas import CreateUserRequest, UserListFilters
+from users.services import create_user_account, list_users, stream_users, export_users
+from users.bulk import detect_format, import_users, read_records
+from core.security import get_current_user, require_internal_token
+from users.responses import UserResponse, UserPageResponse, serialize_user
+from core.responses import FastJSONResponse
+from core.principals import UserSnapshot
+
+settings = get_settings()
 
 # Define two separate routers
 guest_router = APIRouter(
@@ -22,15 +28,54 @@ user_router = APIRouter(
 )
 
 @guest_router.post('', status_code=status.HTTP_201_CREATED)
-async def create_guest(data: CreateUserRequest, db: Session = Depends(get_db)):
+async def create_guest(data: CreateUserRequest, db: DBSession = Depends(get_session)):
     await create_user_account(data=data, db=db)
     payload = {"message": "Guest account has been successfully created."}
     return JSONResponse(content=payload)
 
 # Update the /me route
 @user_router.get('/me', response_model=UserResponse)
-async def get_user_detail(current_user: UserModel = Depends(get_current_user)):
+async def get_user_detail(current_user: UserSnapshot = Depends(get_current_user)):
     if current_user is None:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    return current_user
+    # Returning the response directly skips FastAPI's validation against UserResponse
+    return FastJSONResponse(serialize_user(current_user))
+
+# Admin listing with keyset pagination, or every match as NDJSON with format=ndjson
+@user_router.get('', response_model=UserPageResponse, dependencies=[Depends(require_internal_token)])
+async def list_user_accounts(
+    filters: UserListFilters = Depends(),
+    order: Literal["id", "created_at"] = "id",
+    descending: bool = False,
+    limit: int = Query(50, ge=1, le=settings.ADMIN_PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    format: Literal["json", "ndjson"] = "json",
+    db: DBSession = Depends(get_session),
+):
+    if format == "ndjson":
+        return StreamingResponse(stream_users(filters, order, descending, cursor), media_type="application/x-ndjson")
+    page = await list_users(filters, order, descending, limit, cursor, db)
+    return FastJSONResponse(page)
+
+# Bulk import from a CSV or NDJSON upload, see users/bulk.py for the columns.
+# Lists the first BULK_IMPORT_REJECTS_RETURNED rejects, `rejected` counts them all
+@user_router.post('/import', dependencies=[Depends(require_internal_token)])
+async def import_user_accounts(file: UploadFile, format: Optional[Literal["csv", "ndjson"]] = None):
+    text = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    rejects = []
+
+    def reject(entry: dict):
+        if len(rejects) < settings.BULK_IMPORT_REJECTS_RETURNED:
+            rejects.append(entry)
+
+    async with open_primary_session() as db:
+        stats = await import_users(read_records(text, format or detect_format(file.filename)), db, reject)
+    return FastJSONResponse({**stats, "rejects": rejects, "rejects_truncated": stats["rejected"] > len(rejects)})
+
+# Every matching user with the password hash, in the format the import reads
+@user_router.get('/export', dependencies=[Depends(require_internal_token)])
+async def export_user_accounts(filters: UserListFilters = Depends(), format: Literal["csv", "ndjson"] = "ndjson"):
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="users.{format}"'}
+    return StreamingResponse(export_users(filters, format), media_type=media_type, headers=headers)
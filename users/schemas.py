@@ -1,5 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr
 from datetime import datetime
+from typing import Optional
 
 class CreateUserRequest(BaseModel):
     username: str
@@ -7,8 +8,10 @@ class CreateUserRequest(BaseModel):
     password: str
 
 class VerifyCodeRequest(BaseModel):
-    email: str
-    code: str
+    # Either the emailed code with its email, or the signed token (EMAIL_SIGNED_TOKENS)
+    email: Optional[str] = None
+    code: Optional[str] = None
+    token: Optional[str] = None
 
 class UserResponse(BaseModel):
     id: int
@@ -18,6 +21,13 @@ class UserResponse(BaseModel):
     is_verified: bool
     registered_at: datetime
     verified_at: datetime = None
-    
-    class Config:
-        orm_mode = True 
\ No newline at end of file
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class UserListFilters(BaseModel):
+    is_verified: Optional[bool] = None
+    is_active: Optional[bool] = None
+    registered_from: Optional[datetime] = None  # Inclusive
+    registered_to: Optional[datetime] = None  # Exclusive
+    email_prefix: Optional[str] = None
@@ -1,61 +1,199 @@
-from fastapi import Depends, HTTPException
-from fastapi.security import OAuth2PasswordBearer
+import base64
+import binascii
+import csv
+import io
+import orjson
+from fastapi import HTTPException
 from users.models import UserModel
-from core.database import get_db
-from sqlalchemy.orm import Session
+from users.schemas import UserListFilters
+from users.responses import ADMIN_USER_FIELDS, serialize_admin_row
+from core.database import DBSession, SessionLocal, db_execute, db_commit, db_rollback, insert_ignoring_conflicts, open_session
+from sqlalchemy import or_, select, tuple_
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime
-from core.security import get_password_hash
-from jose import JWTError, jwt
+from core.security import hash_password_async
 from core.config import get_settings  
 
 # Initialize settings
 settings = get_settings()
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
+async def is_account_taken(username: str, email: str, db: DBSession) -> bool:
+    # Indexed lookup so a taken username or email is turned away before paying for a password hash.
+    # It may read a lagging replica, the INSERT ... ON CONFLICT still catches what it misses.
+    result = await db_execute(db, select(UserModel.id).where(or_(UserModel.username == username, UserModel.email == email)).limit(1))
+    return result.first() is not None
 
-async def create_user_account(data, db):
-    try:
-        # Check if the user already exists by email or username
-        user = db.query(UserModel).filter(
-            (UserModel.email == data.email) | (UserModel.username == data.username)
-        ).first()
-        
-        if user:
-            raise HTTPException(status_code=422, detail="Email or username is already registered with us.")
-
-        new_user = UserModel(
-            username=data.username, 
-            email=data.email,
-            password=get_password_hash(data.password),
-            is_active=False,
-            is_verified=False,
-            registered_at=datetime.now(),
-            updated_at=datetime.now()
-        )
-        
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
-        return new_user
 
+async def create_user_account(data, db: DBSession):
+    if await is_account_taken(data.username, data.email, db):
+        raise HTTPException(status_code=422, detail="Email or username is already registered with us.")
+
+    # INSERT ... ON CONFLICT DO NOTHING RETURNING, a username or email taken since the check returns no row
+    statement = insert_ignoring_conflicts(UserModel).values(
+        username=data.username, 
+        email=data.email,
+        password=await hash_password_async(data.password),
+        is_active=False,
+        is_verified=False,
+        registered_at=datetime.now(),
+        updated_at=datetime.now(),
+        signup_source="guest",
+    ).returning(UserModel)
+
+    try:
+        result = await db_execute(db, statement)
+        new_user = result.scalars().first()
     except IntegrityError:
-        db.rollback()  # Roll back the session on error
-        raise HTTPException(status_code=400, detail="Database integrity error.")
+        new_user = None
+
+    if not new_user:
+        await db_rollback(db)  # Roll back the session on conflict
+        raise HTTPException(status_code=422, detail="Email or username is already registered with us.")
+
+    await db_commit(db)
+    return new_user
+
+
+# Keyset columns per sort order, id breaks created_at ties
+SORT_KEYS = {
+    "id": (UserModel.id,),
+    "created_at": (UserModel.created_at, UserModel.id),
+}
+ADMIN_USER_COLUMNS = tuple(getattr(UserModel, field) for field in ADMIN_USER_FIELDS)
+
+
+def encode_cursor(order: str, row: dict) -> str:
+    values = [row[column.key] for column in SORT_KEYS[order]]
+    return base64.urlsafe_b64encode(orjson.dumps([order, *values])).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, order: str) -> tuple:
+    try:
+        cursor_order, *values = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if cursor_order != order or len(values) != len(SORT_KEYS[order]):
+            raise ValueError(cursor_order)
+        if order == "created_at":
+            values[0] = datetime.fromisoformat(values[0])
+        return tuple(values)
+    except (ValueError, TypeError, binascii.Error, orjson.JSONDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def _filter_users(statement, filters: UserListFilters):
+    if filters.is_verified is not None:
+        statement = statement.where(UserModel.is_verified == filters.is_verified)
+    if filters.is_active is not None:
+        statement = statement.where(UserModel.is_active == filters.is_active)
+    if filters.registered_from:
+        statement = statement.where(UserModel.registered_at >= filters.registered_from)
+    if filters.registered_to:
+        statement = statement.where(UserModel.registered_at < filters.registered_to)
+    if filters.email_prefix:
+        # Escaped LIKE, served by the text_pattern_ops index on PostgreSQL whatever the collation
+        statement = statement.where(UserModel.email.startswith(filters.email_prefix, autoescape=True))
+    return statement
+
+
+def _user_listing(filters: UserListFilters, order: str, descending: bool, cursor: str = None):
+    keys = SORT_KEYS[order]
+    statement = _filter_users(select(*ADMIN_USER_COLUMNS), filters)
+    if cursor:
+        # Keyset: continue after the last row seen, the index seeks there instead of skipping rows
+        after = decode_cursor(cursor, order)
+        position = tuple_(*keys) if len(keys) > 1 else keys[0]
+        bound = tuple_(*after) if len(keys) > 1 else after[0]
+        statement = statement.where(position < bound if descending else position > bound)
+    return statement.order_by(*(key.desc() if descending else key.asc() for key in keys))
+
+
+async def list_users(filters: UserListFilters, order: str, descending: bool, limit: int, cursor: str, db: DBSession) -> dict:
+    statement = _user_listing(filters, order, descending, cursor).limit(limit + 1)
+    result = await db_execute(db, statement)
+    items = [serialize_admin_row(row) for row in result.all()]
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(order, items[-1])
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def _ndjson(rows) -> bytes:
+    return b"".join(orjson.dumps(serialize_admin_row(row)) + b"\n" for row in rows)
+
+
+def stream_users(filters: UserListFilters, order: str, descending: bool, cursor: str = None):
+    """
+    NDJSON chunks of every matching user, read through a server-side cursor in
+    ADMIN_STREAM_BATCH_SIZE batches so memory stays flat however many rows match.
+    Opens its own session, the response body outlives the request dependencies.
+    """
+    statement = _user_listing(filters, order, descending, cursor).execution_options(yield_per=settings.ADMIN_STREAM_BATCH_SIZE)
+    return _stream(statement, _ndjson)
+
+
+# Columns of the bulk export, in the shape users.bulk imports back (the hash is reused as is)
+EXPORT_FIELDS = ("username", "email", "password_hash", "is_active", "is_verified", "registered_at", "verified_at")
+EXPORT_COLUMNS = (
+    UserModel.username, UserModel.email, UserModel.password.label("password_hash"),
+    UserModel.is_active, UserModel.is_verified, UserModel.registered_at, UserModel.verified_at,
+)
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _export_csv(rows) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_csv_value(value) for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+
+def _export_ndjson(rows) -> bytes:
+    return b"".join(orjson.dumps(dict(zip(EXPORT_FIELDS, row))) + b"\n" for row in rows)
+
+
+def export_users(filters: UserListFilters, format: str = "ndjson"):
+    """
+    CSV or NDJSON chunks of every matching user including the password hash,
+    streamed in id order like stream_users.
+    """
+    statement = _filter_users(select(*EXPORT_COLUMNS), filters).order_by(UserModel.id)
+    statement = statement.execution_options(yield_per=settings.ADMIN_STREAM_BATCH_SIZE)
+    if format == "csv":
+        return _stream(statement, _export_csv, header=_export_csv([EXPORT_FIELDS]))
+    return _stream(statement, _export_ndjson)
+
+
+def _stream(statement, encode, header: bytes = b""):
+    if settings.DB_ASYNC:
+        return _stream_async(statement, encode, header)
+    return _stream_sync(statement, encode, header)
+
+
+async def _stream_async(statement, encode, header: bytes):
+    if header:
+        yield header
+    async with open_session() as db:
+        result = await db.stream(statement)
+        async for rows in result.partitions():
+            yield encode(rows)
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def _stream_sync(statement, encode, header: bytes):
+    # Plain generator, StreamingResponse iterates it on the threadpool
+    if header:
+        yield header
+    db = SessionLocal()
     try:
-        # Use the settings for decoding the token
-        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
-        user_id: int = payload.get("id")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
-
-    user = db.query(UserModel).filter(UserModel.id == user_id).first()
-    if user is None:
-        raise HTTPException(status_code=401, detail="User not found")
-    
-    return user
+        for rows in db.execute(statement).partitions():
+            yield encode(rows)
+    finally:
+        db.close()